@@ -17,11 +17,19 @@ import numpy as np
 from pathlib import Path
 import subprocess
 import platform
+import matplotlib
+if 'MPLBACKEND' not in os.environ: # backend explicitly chosen, e.g. headless test runs
+    try:
+        matplotlib.use('TkAgg')  # Set the backend to TkAgg
+    except:
+        matplotlib.use('Agg')  # Set the backend to default
 
 import src.Exceptions as Exceptions
 from src.analyze import analyze_data, ordinal
 from src.format_file import format_raw_data
-from src.modeling import thin_film_liquid_analysis, thin_film_air_analysis, sauerbrey, avgs_analysis, gordon_kanazawa, crystal_thickness
+from src.engine import shutdown_render_pool
+from src.modeling import thin_film_liquid_analysis, thin_film_air_analysis, sauerbrey, avgs_analysis, gordon_kanazawa, crystal_thickness, RangeAggregates
+from src.stats_store import export_range_stats, clear_range_stats
 
 '''Variable Initializations'''
 class Input:
@@ -56,6 +64,7 @@ class Input:
         self.will_correct_slope = False
         self.will_calculate_offset = False
         self.is_qsd = False # True if data file being processed is a raw qsd file
+        self.num_sensors = 1 # QSense devices record either 1 or 4 sensors
         self.is_relative_time = False # depending on file src input, some machines record time relatively (start at 0) or absolutely (start at current time of day)
         self.file_src_type = '' # different machines output data differently
         self.which_plot = {'raw': {'fundamental_freq': False, 'fundamental_dis': False, '3rd_freq': False, '3rd_dis': False,
@@ -328,6 +337,7 @@ class App(tk.Tk):
     """    
     def __init__(self):
         super().__init__() # initialize parent class for the child
+        Exceptions.set_reporter(Exceptions.tk_reporter) # errors and warnings are message boxes in the UI, printed otherwise
 
         self.title('BraTaDio - pyQCM-D Analyzer')
         try:
@@ -408,6 +418,7 @@ class App(tk.Tk):
                 frame.grid_forget()
 
     def on_exit(self):
+        shutdown_render_pool() # don't leave figure rendering processes behind
         self.quit()
         self.destroy()
         sys.exit()
@@ -604,15 +615,10 @@ class numSensorsFrame(tk.Frame):
         self.four_sensors_radio.grid(row=1, column=1)
 
     def handle_radios(self):
-        # if not qsense selected, gray out 4 sensors, nothing changes
-        # if qsense and 4 sensors, ask to plot only one sensor or all 4
-            # if qsd, and plot only 1 sensor, nothing changes
-            # if qsd and 4 sensors, adjust qsd formatting
-            # if not qsd and 1 sensor, adjust format_QSense to have a column renaming dict read first sensors data
-            # if not qsd and 4 sensors, adjust file formatting to save 4 indv files for each sensor, and adjust analyze.py to run on all 4
-        # if qsense and 1 sensor, nothing changes
-        
-        pass
+        # if qsense qsd and 4 sensors, every sensor is formatted to its own file from one read of the qsd
+        # all other cases format only the first sensor
+        global input
+        input.num_sensors = 4 if self.num_sensors_var.get() == 1 else 1
 
 class absTimeInputFrame(tk.Frame):
     """Frame for input of absolute baseline time"""    
@@ -851,6 +857,7 @@ class ModelingWindow(tk.Frame):
         self.is_visible = True  # Example flag
         self.parent = parent
         self.model_window = None
+        self.range_aggregates = RangeAggregates() # range stats are read and averaged once for all models run from this window
 
     def open_modeling_window(self):
         self.model_window = tk.Toplevel(self.parent)
@@ -897,6 +904,11 @@ class ModelingWindow(tk.Frame):
                                              command=lambda: self.call_crystal_thickness())
         self.run_crystal_thickness_button.grid(row=13, column=0, pady=4)
 
+        # range stats are kept in a database, csv files of them written only when asked for
+        self.export_range_stats_button = tk.Button(self.models_frame, text="Export range stats\nto csv", padx=6, pady=4, width=20,
+                                             command=lambda: self.call_export_range_stats())
+        self.export_range_stats_button.grid(row=14, column=0, pady=4)
+
     def test_modelling_window(self):
         self.model_window.deiconify()
 
@@ -915,28 +927,28 @@ class ModelingWindow(tk.Frame):
 
     def call_sauerbrey(self):
         try:
-            sauerbrey(input.will_use_theoretical_vals)
+            sauerbrey(input.will_use_theoretical_vals, self.range_aggregates)
             self.show_path_box("Sauerbrey")
         except Exception as exc:
             Exceptions.error_popup("Unknown error ocurred\n\n")
             print(exc)
     def call_averages(self):
         try:
-            avgs_analysis()
+            avgs_analysis(self.range_aggregates)
             self.show_path_box("Averages")
         except Exception as exc:
             Exceptions.error_popup("Unknown error ocurred\n\n")
             print(exc)
     def call_tf_liquid(self):
         try:
-            thin_film_liquid_analysis(input.which_plot['clean'], input.will_use_theoretical_vals, input.latex_installed)
+            thin_film_liquid_analysis(input.which_plot['clean'], input.will_use_theoretical_vals, input.latex_installed, self.range_aggregates)
             self.show_path_box("Thin film in liquid")
         except Exception as exc:
             Exceptions.error_popup("Unknown error ocurred\n\n")
             print(exc)
     def call_tf_air(self):
         try:
-            thin_film_air_analysis(input.which_plot['clean'], input.will_use_theoretical_vals, input.latex_installed)
+            thin_film_air_analysis(input.which_plot['clean'], input.will_use_theoretical_vals, input.latex_installed, self.range_aggregates)
             self.show_path_box("Thin film in air")
         except Exception as exc:
             Exceptions.error_popup("Unknown error ocurred\n\n")
@@ -948,6 +960,14 @@ class ModelingWindow(tk.Frame):
         except Exception as exc:
             Exceptions.error_popup("Unknown error ocurred\n\n")
             print(exc)
+
+    def call_export_range_stats(self):
+        try:
+            export_range_stats()
+            open_folder(Path(os.path.join(os.getcwd(), 'selected_ranges')))
+        except Exception as exc:
+            Exceptions.error_popup(f"Could not export range stats\n\n{exc}")
+            print(exc)
 class PlotOptsWindow():
     """window for handling all of the plot customization options
     """    
@@ -1074,6 +1094,13 @@ class PlotOptsWindow():
         self.points_plotted_index_entry.grid(row=20, column=3, columnspan=3, pady=8)
         self.widgets['points_plotted_index'] = self.points_plotted_index_entry
 
+        # option to reduce points plotted to what the figure can show, keeping spikes and steps that striding skips over
+        self.decimation_label = tk.Label(self.opts_frame, text="Point reduction mode:\nstride (every Nth point above),\nminmax, or lttb (per pixel column)")
+        self.decimation_label.grid(row=21, column=0, columnspan=3, pady=8)
+        self.decimation_entry = tk.Entry(self.opts_frame, width=10)
+        self.decimation_entry.grid(row=21, column=3, columnspan=3, pady=8)
+        self.widgets['decimation'] = self.decimation_entry
+
         # option to set bounds of time, frequency, and dissipation
         self.bounds_frame = tk.Frame(self.opts_frame)
         bounds_label_text = "Enter bounds for data to be plotted\nenter 'auto' to use the default for that bound\n\n" \
@@ -1115,7 +1142,7 @@ class PlotOptsWindow():
         self.widgets['dissipation_lower_bound'] = self.dissipation_lower_bound_entry
         self.widgets['dissipation_upper_bound'] = self.dissipation_upper_bound_entry
         
-        self.bounds_frame.grid(row=21, column=0, columnspan=6, pady=(12,0))
+        self.bounds_frame.grid(row=22, column=0, columnspan=6, pady=(12,0))
 
         # second column color customizer
         self.ov_color_label = tk.Label(self.opts_frame, text="Customize Overtone Plot Colors", font=('TkDefaultFont', 12, 'bold'))
@@ -1310,8 +1337,8 @@ class Col1(tk.Frame):
         self.file_src_frame = srcFileFrame(self)
         self.file_src_frame.grid(row=4, column=0, pady=(16,8))
 
-        #self.num_sensors_frame = numSensorsFrame(self)
-        #self.num_sensors_frame.grid(row=5, column=0, pady=8)
+        self.num_sensors_frame = numSensorsFrame(self)
+        self.num_sensors_frame.grid(row=5, column=0, pady=8)
 
         self.rel_time_input = relTimeInputFrame(self)
         self.abs_time_input = absTimeInputFrame(self)
@@ -1364,7 +1391,7 @@ class Col1(tk.Frame):
             if input.file_src_type == '':
                 Exceptions.error_popup("Please select a file source type.")
 
-            format_raw_data(input.file_src_type, input.file, input.will_use_theoretical_vals)
+            format_raw_data(input.file_src_type, input.file, input.will_use_theoretical_vals, input.num_sensors == 4)
             print("Format completed")
         
         self.submitted_label.grid(row=13, column=0)
@@ -1679,6 +1706,7 @@ class Col4(tk.Frame):
 
     def clear_range_data(self):
         set_input_altered_flag(True)
+        clear_range_stats()
         rf_clean_stats = open("selected_ranges/clean_all_stats_rf.csv", 'w')
         dis_clean_stats = open("selected_ranges/clean_all_stats_dis.csv", 'w')
         rf_raw_stats = open("selected_ranges/raw_all_stats_rf.csv", 'w')
@@ -1,11 +1,59 @@
-from tkinter import messagebox
+from contextlib import contextmanager
+
+'''errors and warnings are shown through a swappable reporter so analysis and formatting can run without a UI
+the default prints them so headless callers never need Tk, the UI installs tk_reporter for message boxes,
+other callers can swap in raise_reporter or their own function taking (level, msg) where level is 'error' or 'warning' '''
+
+def tk_reporter(level, msg):
+    from tkinter import messagebox # imported on use so headless processes never load Tk
+    if level == 'error':
+        messagebox.showerror("Error", msg)
+    else:
+        messagebox.showwarning("Warning", msg)
+
+def print_reporter(level, msg):
+    print(f"{level.upper()}: {msg}")
+
+class ReportedError(Exception):
+    pass
+
+def raise_reporter(level, msg):
+    # errors stop the current job instead of waiting on a popup, warnings are just printed
+    if level == 'error':
+        raise ReportedError(msg)
+    print_reporter(level, msg)
+
+_reporter = print_reporter
+
+def set_reporter(reporter):
+    """replace the function errors and warnings are reported through
+
+    Args:
+        reporter (function): takes (level, msg), level being 'error' or 'warning'
+
+    Returns:
+        function: the previous reporter
+    """    
+    global _reporter
+    prev_reporter = _reporter
+    _reporter = reporter
+    return prev_reporter
+
+@contextmanager
+def use_reporter(reporter):
+    """temporarily report errors and warnings through reporter"""
+    prev_reporter = set_reporter(reporter)
+    try:
+        yield
+    finally:
+        set_reporter(prev_reporter)
 
 def error_popup(msg=None):
     msg = "Uncaught unknown exception has occurred, please view the terminal for details" if msg == None else msg
-    messagebox.showerror("Error", msg)
+    _reporter('error', msg)
 
 def warning_popup(msg):
-    messagebox.showwarning("Warning", msg)
+    _reporter('warning', msg)
 
 class ShapeMismatchException(Exception):
     def __init__(self, shapes, msg):
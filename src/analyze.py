@@ -4,35 +4,35 @@ Created: 2/19/2022, 10:46 am (result of refactor)
 Last Modified: 1/3/2024
 """
 
-from tkinter import *
 import os
 from datetime import time
 import numpy as np
 import pandas as pd
-import tkinter as tk
-from tkinter import ttk
 import matplotlib
-try:
-    matplotlib.use('TkAgg')  # Set the backend to TkAgg
-except:
-    matplotlib.use('Agg')  # Set the backend to default
-import matplotlib.pyplot as plt
+import matplotlib.pyplot as plt # backend is chosen by main.py for the UI, headless runs use matplotlib's default
 from matplotlib.widgets import SpanSelector
+from matplotlib.transforms import Bbox
 from scipy.optimize import curve_fit
 import sys
 import json
+import warnings
 
 import src.Exceptions as Exceptions
+from src.formatted_store import find_formatted_fn, load_formatted
+from src.decimate import plot_width_px, decimate, take, MinMaxPyramid
+from src.range_stats import RangeStats
+from src.stats_store import save_range_stats, StatsSession
 
 ''' ANALYSIS VARIABLES '''
 class Analysis:
     def __init__(self, fn):
         file_name, _ = os.path.splitext(fn)
         file_name = os.path.basename(file_name)
-        if fn.__contains__("Formatted"):
+        formatted_fn = find_formatted_fn(file_name)
+        if fn.__contains__("Formatted") and not os.path.exists(formatted_fn): # previously formatted file is used as is until it is run through formatting
             self.formatted_fn = fn
         else:
-            self.formatted_fn = f"raw_data/Formatted-{file_name}.csv"
+            self.formatted_fn = formatted_fn
         
         print(f"Using formatted file: {self.formatted_fn}")
 
@@ -158,6 +158,12 @@ def determine_ylabel(ydata_type, is_normalized, is_raw_data=False):
 plt.figure
 
 
+def set_tick_label_font(ax, plot_customs):
+    """applies tick label font size and family from plot customs to the current tick labels of ax"""
+    for tick_label in ax.get_xticklabels() + ax.get_yticklabels():
+        tick_label.set_fontsize(plot_customs['value_text_size'])
+        tick_label.set_fontfamily(plot_customs['font'])
+
 def setup_plot(fig, ax, fig_x, fig_y, fig_title, fn, will_save=False, legend=True):
     """takes in a plt figure object and applies figure attributes passed in
     also applies attributes from plot customs
@@ -175,7 +181,6 @@ def setup_plot(fig, ax, fig_x, fig_y, fig_title, fn, will_save=False, legend=Tru
     plot_customs = get_plot_preferences()
     dpi = plot_customs['fig_dpi']
     fig_format = plot_customs['fig_format']
-    plt.figure(fig.number)
 
     if legend:
         ax.legend(loc='best', fontsize=plot_customs['legend_text_size'], prop={'family': plot_customs['font']}, framealpha=0.1)
@@ -196,50 +201,226 @@ def setup_plot(fig, ax, fig_x, fig_y, fig_title, fn, will_save=False, legend=Tru
         x_bound = ('auto','auto')
 
     if x_bound[0] != x_bound[1]:
-        plt.xlim(int(x_bound[0]), int(x_bound[1]))
+        ax.set_xlim(int(x_bound[0]), int(x_bound[1]))
     if y_bound[0] != y_bound[1]:
-        plt.ylim(float(y_bound[0]), float(y_bound[1]))
-
-    plt.xticks(fontsize=plot_customs['value_text_size'], fontfamily=plot_customs['font'])
-    plt.yticks(fontsize=plot_customs['value_text_size'], fontfamily=plot_customs['font'])
-    plt.xlabel(fig_x, fontsize=plot_customs['label_text_size'], fontfamily=plot_customs['font'])
-    plt.ylabel(fig_y, fontsize=plot_customs['label_text_size'], fontfamily=plot_customs['font'])
-    plt.tick_params(axis='both', direction=plot_customs['tick_dir'])
-    plt.title(fig_title, fontsize=plot_customs['title_text_size'], fontfamily=plot_customs['font'])
+        ax.set_ylim(float(y_bound[0]), float(y_bound[1]))
+
+    set_tick_label_font(ax, plot_customs)
+    ax.set_xlabel(fig_x, fontsize=plot_customs['label_text_size'], fontfamily=plot_customs['font'])
+    ax.set_ylabel(fig_y, fontsize=plot_customs['label_text_size'], fontfamily=plot_customs['font'])
+    ax.tick_params(axis='both', direction=plot_customs['tick_dir'])
+    ax.set_title(fig_title, fontsize=plot_customs['title_text_size'], fontfamily=plot_customs['font'])
     if will_save:
         fig.savefig(fn + '.' + fig_format, format=fig_format, bbox_inches='tight', transparent=True, dpi=dpi)
 
 
-def find_nearest_time(time, df, time_col_name, is_relative_time):
+def get_analysis_columns(input, analysis):
+    """determine which columns of the formatted data are needed for the user's selections,
+    so only those are loaded from file
+
+    Args:
+        input (Input object): contains all relevant information from UI
+        analysis (Analysis object): contains relevant file/data information
+
+    Returns:
+        list of str: names of needed columns, or None if all columns are needed (calculating offsets uses every overtone)
+    """    
+    if input.will_calculate_offset:
+        return None
+
+    columns = [analysis.time_col, analysis.abs_time_col, analysis.temp_col, analysis.temp_time_col]
+    for data_fmt in ('raw', 'clean'):
+        will_plot = input.will_plot_raw_data if data_fmt == 'raw' else input.will_plot_clean_data
+        if not will_plot:
+            continue
+        # freq and dis are cleaned in pairs, so grab both for any overtone selected
+        for channel, is_selected in input.which_plot[data_fmt].items():
+            if is_selected:
+                overtone = channel.rsplit('_', 1)[0]
+                columns += [f"{overtone}_freq", f"{overtone}_dis"]
+    # more dis than freq channels selected for cleaning pads with the lowest freq channels
+    if input.will_plot_clean_data:
+        clean_freqs, clean_disps = get_channels(input.which_plot['clean'].items())
+        columns += analysis.freqs[:max(0, len(clean_disps) - len(clean_freqs))]
+
+    if input.enable_interactive_plot:
+        for int_plot_overtone in input.interactive_plot_overtone.values():
+            overtone = ordinal(get_num_from_string(str(int_plot_overtone))).lower()
+            columns += [f"{overtone}_freq", f"{overtone}_dis"]
+
+    return columns
+
+
+def parse_abs_time(abs_time):
+    """converts absolute time stamps (e.g. '10:12:35' or '2023-05-12 10:12:35.25') into seconds since the first midnight
+    runs that go past midnight keep counting up instead of wrapping back to 0
+
+    Args:
+        abs_time (pd.Series): column of absolute time stamp strings
+
+    Returns:
+        np.ndarray: seconds as floats, nan where no time stamp could be read
+    """    
+    hms = abs_time.astype(str).str.extract(r'(\d{1,2}):(\d{2}):(\d{2}(?:\.\d+)?)').astype(float)
+    seconds = (hms[0] * 3600 + hms[1] * 60 + hms[2]).to_numpy(dtype=float, copy=True)
+
+    # a jump back of more than half a day means the clock passed midnight
+    valid = ~np.isnan(seconds)
+    day_wraps = np.cumsum(np.diff(seconds[valid], prepend=seconds[valid][:1]) < -43200)
+    seconds[valid] += day_wraps * 86400
+    return seconds
+
+def build_time_index(df, time_col_name, is_relative_time):
+    """numeric, sorted copy of the time column for binary searching baseline times
+    building it once lets t0 and tf (and any later lookups) skip rescanning or reparsing the column
+
+    Args:
+        df (pd.Dataframe): dataframe of experimental data
+        time_col_name (str): name of time column
+        is_relative_time (bool): boolean determining if time is relative or absolute (like for openQCM)
+
+    Returns:
+        tuple: sorted times (np.ndarray of seconds), and row positions of df in that sorted order
+    """    
+    if is_relative_time:
+        times = df[time_col_name].to_numpy(dtype=float)
+    else:
+        times = parse_abs_time(df[time_col_name])
+
+    valid_pos = np.flatnonzero(~np.isnan(times))
+    if np.all(np.diff(times[valid_pos]) >= 0): # already in order, as recorded
+        order = valid_pos
+    else:
+        order = valid_pos[np.argsort(times[valid_pos], kind='stable')]
+    return times[order], order
+
+def find_nearest_time(time, df, time_col_name, is_relative_time, time_index=None):
     """if user inputs a baseline time of x, and x is not a time recorded in the data, finds index of next closest value
+    relative time finds the nearest recorded time, absolute time finds the first time stamp at or after the one given
 
     Args:
         time (str): user inputted baseline time (t0 or tf)
         df (pd.Dataframe): dataframe of experimental data
         time_col_name (str): name of time column
         is_relative_time (bool): boolean determining if time is relative or absolute (like for openQCM)
+        time_index (tuple, optional): result of build_time_index() for this df and column. Defaults to None (built here).
 
     Returns:
         int: index of nearest time entry to what user specified
     """    
+    if time_index is None:
+        time_index = build_time_index(df, time_col_name, is_relative_time)
+    times, order = time_index
+
     # locate where baseline starts/ends
     if is_relative_time:
-        time_df = df.iloc[(df[time_col_name] - int(time)).abs().argsort()[:1]]
-        base_t0_ind = time_df.index[0]
+        target = float(time)
+        pos = min(np.searchsorted(times, target), len(times) - 1)
+        if pos > 0 and target - times[pos - 1] <= times[pos] - target: # earlier neighbor is at least as close
+            pos -= 1
     else:
-        time_df = df[df[time_col_name].str.contains(time)]
+        target = parse_abs_time(pd.Series([time]))[0]
+        # time stamps are given without a date, so move it to the first day of the run it falls within
+        target += max(0, np.ceil((times[0] - target - 1) / 86400)) * 86400
+        pos = min(np.searchsorted(times, target), len(times) - 1)
+
+    return df.index[order[pos]]
+
+
+def clean_overtones(df, baseline_len, time_col, freq_cols, dis_cols, will_normalize_F, is_qsd, time_divisor):
+    """baseline corrects all selected frequency/dissipation pairs at once
+    channels are stacked as 2-D (channel x row) blocks so normalizing by overtone, subtracting the baseline averages,
+    and the dissipation magnitude conversion are each one broadcast over every channel, and time is shifted/scaled once
 
-        # convert the last 2 digits (the seconds) into integers and increment by 1, mod by 10
-        # this method will find nearest time since time stamps are never more than 2 seconds apart
-        while(time_df.shape[0] == 0): # iterate until string found in time dataframe
-            ta = time[:7]
-            tb = (int(time[7:]) + 1) % 10
-            time = ta + str(tb)
-            time_df = df[df[time_col_name].str.contains(time)]
-        base_t0_ind = time_df.index[0]
+    Args:
+        df (pd.Dataframe): experimental data starting at baseline t0, with a default index
+        baseline_len (int): number of rows from the start of df that make up the baseline
+        time_col (str): name of time column
+        freq_cols (list of str): frequency channels, paired by position with dis_cols
+        dis_cols (list of str): dissipation channels
+        will_normalize_F (bool): divide frequency by overtone number
+        is_qsd (bool): data is from a .qsd file, where dissipation is already on the order of 1e-6
+        time_divisor (float): divisor converting seconds to the time scale of the plots
+
+    Returns:
+        tuple: cleaned_df (time followed by freq and dis of each pair, rows where no pair has data dropped),
+               list of (x_time, y_freq, y_dis) pd.Series per pair with rows missing data for that pair dropped,
+               baseline averages of frequency and of dissipation per pair (np.ndarray)
+    """    
+    time = df[time_col].to_numpy(dtype=float)
+    if not freq_cols: # no overtones selected, only time is cleaned
+        shifted_time = (time - time[0]) / time_divisor if time.shape[0] else time
+        return frame_from_block([shifted_time], [time_col], np.arange(time.shape[0])), [], np.empty(0), np.empty(0)
+    freq_block = np.array([df[col].to_numpy(dtype=float) for col in freq_cols])
+    dis_block = np.array([df[col].to_numpy(dtype=float) for col in dis_cols])
+    # a pair only uses rows where time, its frequency, and its dissipation are all recorded
+    pair_valid = ~(np.isnan(time) | np.isnan(freq_block) | np.isnan(dis_block))
+
+    # normalize by overtone
+    if will_normalize_F:
+        freq_block /= np.array([get_num_from_string(col) for col in freq_cols], dtype=float)[:, np.newaxis]
+
+    # lower curves s.t. baseline is approx at y=0
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', category=RuntimeWarning) # all nan baseline of a channel gives nan average
+        rf_base_avgs = np.nanmean(freq_block[:, :baseline_len], axis=1)
+        dis_base_avgs = np.nanmean(dis_block[:, :baseline_len], axis=1)
+    freq_block -= rf_base_avgs[:, np.newaxis]
+    dis_block -= dis_base_avgs[:, np.newaxis]
+    if not is_qsd:
+        dis_block *= 1000000 # magnitude conversion
+
+    # drop rows with no data for any pair, and blank out the values of pairs missing data in the remaining rows
+    if not pair_valid.all():
+        rows = np.flatnonzero(pair_valid.any(axis=0))
+        freq_block[~pair_valid] = np.nan
+        dis_block[~pair_valid] = np.nan
+        time, freq_block, dis_block, pair_valid = time[rows], freq_block[:, rows], dis_block[:, rows], pair_valid[:, rows]
+    else:
+        rows = np.arange(time.shape[0])
+
+    # shift x to left to start at 0, from the first row each pair has data for
+    time_starts = [time[valid][0] if valid.any() else np.nan for valid in pair_valid]
+    shifted_time = (time - time_starts[0]) / time_divisor
+
+    pairs = []
+    for i, valid in enumerate(pair_valid):
+        if valid.all():
+            x_time = pd.Series(shifted_time, index=rows, name=time_col)
+            y_freq = pd.Series(freq_block[i], index=rows, name=freq_cols[i])
+            y_dis = pd.Series(dis_block[i], index=rows, name=dis_cols[i])
+        else:
+            pair_time = shifted_time[valid] if time_starts[i] == time_starts[0] else (time[valid] - time_starts[i]) / time_divisor
+            x_time = pd.Series(pair_time, index=rows[valid], name=time_col)
+            y_freq = pd.Series(freq_block[i][valid], index=rows[valid], name=freq_cols[i])
+            y_dis = pd.Series(dis_block[i][valid], index=rows[valid], name=dis_cols[i])
+        pairs.append((x_time, y_freq, y_dis))
+
+    if not pair_valid[0].all():
+        shifted_time = np.where(pair_valid[0], shifted_time, np.nan)
+    cleaned_cols = [shifted_time]
+    cleaned_names = [time_col]
+    for i in range(len(freq_cols)):
+        cleaned_cols += [freq_block[i], dis_block[i]]
+        cleaned_names += [freq_cols[i], dis_cols[i]]
+    cleaned_df = frame_from_block(cleaned_cols, cleaned_names, rows)
+
+    return cleaned_df, pairs, rf_base_avgs, dis_base_avgs
+
+def frame_from_block(block, columns, index):
+    """wraps rows of a 2-D (column x row) array, or a list of 1-D arrays, as dataframe columns without copying them
 
-    return base_t0_ind
+    Args:
+        block (np.ndarray or list of np.ndarray): one row/array per column
+        columns (list of str): column names, may repeat
+        index (array like): row index of the dataframe
 
+    Returns:
+        pd.DataFrame: dataframe whose columns are views of block
+    """    
+    df = pd.DataFrame(dict(enumerate(block)), index=index, copy=False)
+    df.columns = columns
+    return df
 
 def plot_multiaxis(input, x_time, y_rf, y_dis, freq_label, dis_label, fig, ax1, ax2, color):
     """similar to setup plot, but for multiaxis (freq and dis vs time)
@@ -258,41 +439,39 @@ def plot_multiaxis(input, x_time, y_rf, y_dis, freq_label, dis_label, fig, ax1,
         ax2 (plt.axes): plt twin axis object for plotting multiaxis
         color (str): color for overtone specified by map_colors() following user preference (or default)
     """    
-    plt.figure(fig.number)
     plot_customs = get_plot_preferences()
-    points_idx = plot_customs['points_plotted_index']
+    width_px = plot_width_px(fig, plot_customs['fig_dpi'] * 1.25, plot_customs, x_time[0]) # multiaxis plot is saved at higher dpi
     x_time_freq, x_time_dis = x_time
+    cur_ax = fig.gca() # bounds, tick labels, and title go to the figure's current axis (the twin axis)
 
     x_bound = (plot_customs['time_lower_bound'], plot_customs['time_upper_bound'])
     y1_bound = (plot_customs['frequency_lower_bound'], plot_customs['frequency_upper_bound'])
     y2_bound = (plot_customs['dissipation_lower_bound'], plot_customs['dissipation_upper_bound'])
 
     if x_bound[0] != x_bound[1]:
-        plt.xlim(int(x_bound[0]), int(x_bound[1]))
+        cur_ax.set_xlim(int(x_bound[0]), int(x_bound[1]))
     if y1_bound[0] != y1_bound[1]:
-        plt.ylim(int(y1_bound[0]), int(y1_bound[1]))
+        cur_ax.set_ylim(int(y1_bound[0]), int(y1_bound[1]))
     if y2_bound[0] != y2_bound[1]:
-        plt.ylim(int(y2_bound[0]), int(y2_bound[1]))
+        cur_ax.set_ylim(int(y2_bound[0]), int(y2_bound[1]))
 
     ax1.set_xlabel(determine_xlabel(plot_customs['time_scale']), fontsize=plot_customs['label_text_size'], fontfamily=plot_customs['font'])
     ax1.set_ylabel(determine_ylabel('freq', input.will_normalize_F), fontsize=plot_customs['label_text_size'], fontfamily=plot_customs['font'])
     ax2.set_ylabel(determine_ylabel('dis', input.will_normalize_F), fontsize=plot_customs['label_text_size'], fontfamily=plot_customs['font'])
-    ax1.plot(x_time_freq[::points_idx], y_rf[::points_idx], 'o', markersize=1, label=freq_label, color=color)
-    ax2.plot(x_time_dis[::points_idx], y_dis[::points_idx], 'o', markersize=2, label=dis_label, markerfacecolor='none', markeredgecolor=color, markeredgewidth=0.32)
+    ax1.plot(*decimate(x_time_freq, y_rf, plot_customs, width_px), 'o', markersize=1, label=freq_label, color=color)
+    ax2.plot(*decimate(x_time_dis, y_dis, plot_customs, width_px), 'o', markersize=2, label=dis_label, markerfacecolor='none', markeredgecolor=color, markeredgewidth=0.32)
     ax1.tick_params(axis='both', direction=plot_customs['tick_dir'])
     ax2.tick_params(axis='both', direction=plot_customs['tick_dir'])
-    plt.xticks(fontsize=plot_customs['value_text_size'], fontfamily=plot_customs['font'])
-    plt.yticks(fontsize=plot_customs['value_text_size'], fontfamily=plot_customs['font'])
-    plt.title("Change in Frequency vs Change in Dissipation", fontsize=plot_customs['title_text_size'], fontfamily=plot_customs['font'])
+    set_tick_label_font(cur_ax, plot_customs)
+    cur_ax.set_title("Change in Frequency vs Change in Dissipation", fontsize=plot_customs['title_text_size'], fontfamily=plot_customs['font'])
 
 
-def plot_temp_v_time(fig, ax, time, temp, x_scale):
-    """plot temperature vs time, utilizing setup_plot"""
+def plot_temp_v_time(fig, ax, time, temp, x_scale, fn="qcmd-plots/temp_vs_time_plot"):
+    """plot temperature vs time, utilizing setup_plot, saving it to fn unless fn is None"""
 
     plot_prefs = get_plot_preferences()
-    points_idx = plot_prefs['points_plotted_index']
-    ax.plot(time[::points_idx], temp[::points_idx], '.', markersize=1)
-    setup_plot(fig, ax, determine_xlabel(x_scale), r"Temperature, $\it{t}$ °C", "QCM-D Temperature vs Time", "qcmd-plots/temp_vs_time_plot", True, False)
+    ax.plot(*decimate(time, temp, plot_prefs, plot_width_px(fig, plot_prefs['fig_dpi'], plot_prefs, time)), '.', markersize=1)
+    setup_plot(fig, ax, determine_xlabel(x_scale), r"Temperature, $\it{t}$ °C", "QCM-D Temperature vs Time", fn, fn is not None, False)
 
 # check if label and file already exists and remove if it does before writing new data for that range
 # this allows for overwriting of only the currently selected file and frequency,
@@ -336,9 +515,9 @@ def prepare_stats_file(header, which_range, src_fn, stats_fn):
             new_file.write(header)
 
 
-def range_statistics(df, imin, imax, overtone_sel, which_range, which_fmt, fn):
+def range_statistics(df, imin, imax, overtone_sel, which_range, which_fmt, fn, stats=None, session=None):
     """perform basic statistical analysis on data in selection made by user in interactive plot
-    save this data to the stats file prepared by prepare_stats_file()
+    save this data to the range stats database (see src/stats_store.py), replacing stats saved before for this range
 
     Args:
         df (pd.Dataframe): data frame, contents depend on clean/raw, norm/unnorm, or if slope corrected
@@ -348,6 +527,10 @@ def range_statistics(df, imin, imax, overtone_sel, which_range, which_fmt, fn):
         which_range (str): user specified range/selection identifier
         which_fmt (str): raw or clean
         fn (str): data file name and path
+        stats (RangeStats, optional): precomputed statistics of df, so a selection costs the same however long it is.
+            Defaults to None (computed from the selected data).
+        session (StatsSession, optional): buffer of the interactive plot's selections, saved together later.
+            Defaults to None (saved straight away).
     """    
     # determine what overtones were selected in UI
     which_overtones = []
@@ -355,39 +538,48 @@ def range_statistics(df, imin, imax, overtone_sel, which_range, which_fmt, fn):
         if ov[1]:
             which_overtones.append(ov[0])
     
-    # open stat files, either raw or clean as spec'd by user in var 'which_fmt'
-    dis_stat_file = open(f"selected_ranges/{which_fmt.upper()}_all_stats_dis.csv", 'a')
-    rf_stat_file = open(f"selected_ranges/{which_fmt.upper()}_all_stats_rf.csv", 'a')
+    # rows of stats for frequency and dissipation, saved together once all are calculated
+    stat_rows = {'rf': [], 'dis': []}
 
     # statistical analysis for all desired overtones using range of selection
-    x_data = df["Time"]
-    x_sel = x_data[imin:imax]
+    if stats is not None:
+        x_lower, x_upper = stats.time_bounds(imin, imax)
+    else:
+        x_sel = df["Time"][imin:imax]
+        x_lower, x_upper = np.min(x_sel), np.max(x_sel)
     for overtone in overtone_sel:
         ov = overtone[0] # label of current overtone
         if overtone[1]: # if current overtone selected for plotting
-            y_data = df[ov]
-            y_sel = y_data[imin:imax]
-            if ov.__contains__('dis'):
-                y_sel = y_sel / 1000000 # unit conversion since multiplied up by 10^6 earlier in code
-            mean_y = np.average(y_sel)
-            std_dev_y = np.std(y_sel)
-            median_y = np.median(y_sel)
+            if stats is not None and ov in stats.columns:
+                mean_y, std_dev_y, median_y = stats.summary(ov, imin, imax)
+                if ov.__contains__('dis'):
+                    mean_y, std_dev_y, median_y = mean_y / 1000000, std_dev_y / 1000000, median_y / 1000000
+            else:
+                y_data = df[ov]
+                y_sel = y_data[imin:imax]
+                if ov.__contains__('dis'):
+                    y_sel = y_sel / 1000000 # unit conversion since multiplied up by 10^6 earlier in code
+                mean_y = np.average(y_sel)
+                std_dev_y = np.std(y_sel)
+                median_y = np.median(y_sel)
         
-            if ov.__contains__('freq'): # save frequency stats to frequency stat file
-                rf_stat_file.write(f"{ov},{mean_y:.16E},{std_dev_y:.16E},{median_y:.16E},{which_range},{np.min(x_sel)},{np.max(x_sel)},{fn}\n")
-            elif ov.__contains__('dis'): # save dissipation stats to dissipation stat file
-                dis_stat_file.write(f"{ov},{mean_y:.16E},{std_dev_y:.16E},{median_y:.16E},{which_range},{np.min(x_sel)},{np.max(x_sel)},{fn}\n")
+            if ov.__contains__('freq'): # save frequency stats with frequency stats
+                stat_rows['rf'].append((ov, mean_y, std_dev_y, median_y, which_range, x_lower, x_upper, fn))
+            elif ov.__contains__('dis'): # save dissipation stats with dissipation stats
+                stat_rows['dis'].append((ov, mean_y, std_dev_y, median_y, which_range, x_lower, x_upper, fn))
         
         else: # if overtone not selected, save as 0s (necessary for functionality in modeling.py)
             print(f"\n{ov} not selected\n")
             if ov.__contains__('freq'):
-                rf_stat_file.write(f"{ov},{0:.16E},{0:.16E},{0:.16E},{which_range},{0:.16E},{0:.16E},{fn}\n")
+                stat_rows['rf'].append((ov, 0, 0, 0, which_range, 0, 0, fn))
 
             elif ov.__contains__('dis'):
-                dis_stat_file.write(f"{ov},{0:.16E},{0:.16E},{0:.16E},{which_range},{0:.16E},{0:.16E},{fn}\n")
+                stat_rows['dis'].append((ov, 0, 0, 0, which_range, 0, 0, fn))
     
-    dis_stat_file.close()
-    rf_stat_file.close()
+    if session is not None: # only the latest selection of this range is kept until saved
+        session.add(which_fmt, which_range, fn, stat_rows)
+    else:
+        save_range_stats(which_fmt, stat_rows)
 
 def save_calibration_data(df, imin, imax, which_plots, range, fn):
     """DEPRECATED
@@ -477,6 +669,9 @@ def get_time_scale_divisor(time_scale):
 
 def set_x_entry():
     """util function for the Tk.Entry widgets in the interactive plot for manual time entry"""    
+    import tkinter as tk # only the interactive plot needs Tk, so analysis can be imported without it
+    from tkinter import ttk
+
     def handle_focus_in(entry):
         x_entry.delete(0,"end")
         x_entry.config(foreground='black')
@@ -499,6 +694,92 @@ def set_x_entry():
 
     return plot_win, x_entry
 
+class ZoomPlots:
+    """zoomed selection subplots of the interactive plot, drawn once and then updated in place
+    the points and linear fit of each subplot are persistent artists whose data is swapped for every selection,
+    then only the zoom side of the figure is redrawn and blitted over a saved background of the rest of the figure
+
+    Args:
+        int_plot (plt.Figure): interactive plot figure
+        select_ax (plt.axes): a subplot selections are made from, the zoom side of the figure is right of it
+        zoom_axes (tuple of plt.axes): subplots for frequency and dissipation selection data
+        data_lines (tuple of Line2D): points plotted in each zoom subplot
+        pyramids (tuple of MinMaxPyramid): pyramids of frequency and dissipation data
+    """
+    def __init__(self, int_plot, select_ax, zoom_axes, data_lines, pyramids):
+        self.int_plot = int_plot
+        self.select_ax = select_ax
+        self.zoom_axes = zoom_axes
+        self.data_lines = data_lines
+        self.pyramids = pyramids
+        self.fit_lines = tuple(ax.plot([], [], 'r')[0] for ax in zoom_axes)
+        self.legends = [None] * len(zoom_axes)
+        self.background = None
+        self.is_grabbing = False
+        # any full redraw (e.g. window resize) may move things, background is grabbed again on next update
+        int_plot.canvas.mpl_connect('draw_event', self.forget_background)
+
+    def forget_background(self, event):
+        if not self.is_grabbing:
+            self.background = None
+
+    def zoom_bbox(self):
+        """region of figure holding the zoom subplots, from halfway between the selection and zoom subplots to the right edge"""
+        fig_bbox = self.int_plot.bbox
+        x0 = (self.select_ax.bbox.x1 + self.zoom_axes[0].bbox.x0) / 2
+        return Bbox.from_extents(x0, fig_bbox.y0, fig_bbox.x1, fig_bbox.y1)
+
+    def grab_background(self):
+        """full draw of figure without zoom subplots, saving their region to blit over"""
+        canvas = self.int_plot.canvas
+        self.is_grabbing = True
+        try:
+            for ax in self.zoom_axes:
+                ax.set_visible(False)
+            canvas.draw()
+            self.background = canvas.copy_from_bbox(self.zoom_bbox())
+        finally:
+            for ax in self.zoom_axes:
+                ax.set_visible(True)
+            self.is_grabbing = False
+
+    def set_data(self, i, x, y, fit=None, label='', plot_customs=None):
+        """swap in points of zoom subplot i, and its fit line and legend text
+
+        Args:
+            i (int): 0 for frequency, 1 for dissipation
+            x (pd.Series): x of points plotted
+            y (pd.Series): y of points plotted
+            fit (tuple, optional): slope and intercept of linear fit. Defaults to None (fit failed, no fit line).
+            label (str, optional): legend text. Defaults to ''.
+            plot_customs (dict, optional): plot customization options, for legend font when it is first made.
+        """
+        ax = self.zoom_axes[i]
+        self.data_lines[i].set_data(x, y)
+
+        # a straight line only needs the ends of the plotted points
+        if fit is None or len(x) == 0:
+            self.fit_lines[i].set_data([], [])
+        else:
+            fit_x = np.asarray(x)[[0, -1]]
+            self.fit_lines[i].set_data(fit_x, fit[0] * fit_x + fit[1])
+
+        if self.legends[i] is None:
+            self.legends[i] = ax.legend([self.fit_lines[i]], [label], loc='best', fontsize=plot_customs['legend_text_size'],
+                                        prop={'family': plot_customs['font']}, framealpha=0.3)
+        else:
+            self.legends[i].get_texts()[0].set_text(label)
+
+    def redraw(self):
+        """draw only the zoom subplots and blit them to the screen"""
+        canvas = self.int_plot.canvas
+        if self.background is None:
+            self.grab_background()
+        canvas.restore_region(self.background)
+        for ax in self.zoom_axes:
+            self.int_plot.draw_artist(ax)
+        canvas.blit(self.zoom_bbox())
+
 def generate_interactive_plot(int_plot_overtone, time_scale, df, time_col, is_raw):
     """prepare interactive plot for utilization
     this function takes care of all int plot related utilities such as init subplots, clear old data, set titles/labels, etc.
@@ -523,6 +804,7 @@ def generate_interactive_plot(int_plot_overtone, time_scale, df, time_col, is_ra
         int_ax2_zoom (plt.axes): subplot for dissipation data in which zoomed selections will be plotted
         y_rf (pd.Series): frequency values of given visualized overtone
         y_dis (pd.Series): dissipation values of given visualized overtone
+        zoom_plots (ZoomPlots): persistent artists of the zoom subplots, updated with each selection
     """
     
     plt.close("all") # clear all previous plots
@@ -585,22 +867,43 @@ def generate_interactive_plot(int_plot_overtone, time_scale, df, time_col, is_ra
     y_rf = df[f'{int_plot_overtone}_freq']
     y_dis = df[f'{int_plot_overtone}_dis']
 
-    int_ax1.plot(x_time, y_rf, '.', color='green', markersize=1)
-    int_ax2.plot(x_time, y_dis, '.', color='blue', markersize=1)
-    zoom_plot1, = int_ax1_zoom.plot(x_time, y_rf, '.', color='green', markersize=1)
-    zoom_plot2, = int_ax2_zoom.plot(x_time, y_dis, '.', color='blue', markersize=1)
+    # min/max pyramids let every plot draw about as many points as it has pixels, while keeping spikes and steps
+    # the overview plots (and zoomed plots until a selection is made) show all of the data at screen resolution
+    pyramids = (MinMaxPyramid(y_rf), MinMaxPyramid(y_dis))
+    data_lines = []
+    for pyramid, y_data, axes, color in zip(pyramids, (y_rf, y_dis), ((int_ax1, int_ax1_zoom), (int_ax2, int_ax2_zoom)), ('green', 'blue')):
+        idxs = pyramid.query(0, len(x_time), 2 * int(axes[0].bbox.width))
+        axes[0].plot(take(x_time, idxs), take(y_data, idxs), '.', color=color, markersize=1)
+        zoom_plot, = axes[1].plot(take(x_time, idxs), take(y_data, idxs), '.', color=color, markersize=1)
+        data_lines.append(zoom_plot)
+    zoom_plots = ZoomPlots(int_plot, int_ax1, (int_ax1_zoom, int_ax2_zoom), data_lines, pyramids)
 
-    return int_plot, int_ax1, int_ax2, int_ax1_zoom, int_ax2_zoom, y_rf, y_dis
+    return int_plot, int_ax1, int_ax2, int_ax1_zoom, int_ax2_zoom, y_rf, y_dis, zoom_plots
+
+def range_indices(x_time, xmin, xmax):
+    """indices bounding the data between xmin and xmax of a selection
+
+    Args:
+        x_time (pd.Series): sorted time data, in the time scale of the plot
+        xmin (float): minimum x (time) value
+        xmax (float): maximum x (time) value
+
+    Returns:
+        imin (int): index of minimum (lefmost) value in selection
+        imax (int): index of maximum (rightmost) value in selection
+    """    
+    # min and max indices are where elements should be inserted to maintain order
+    imin, imax = np.searchsorted(x_time, (xmin, xmax))
+    # range will be at most all elems in x, or imax
+    imax = min(len(x_time)-1, imax)
+    return imin, imax
 
-def update_interactive_plot(spans, int_plot, int_ax1_zoom, int_ax2_zoom, plot_customs,
-                              xmin, xmax, x_time, y_rf, y_dis, x_scale):
-    """_summary_
+def update_interactive_plot(spans, zoom_plots, plot_customs, xmin, xmax, x_time, y_rf, y_dis, x_scale):
+    """show a new selection in the zoom subplots with the linear fit of the selected data
 
     Args:
         spans (list of matplotlob.Widgets.SpanSelector): contains the spanning objects for freq and dis windows for selections
-        int_plot (plt.Figure): interactive plot figure object
-        int_ax1_zoom (plt.axes): subplot to display zoomed frequency data selection
-        int_ax2_zoom (plt.axes): subplot to display zoomed dissipation data selection
+        zoom_plots (ZoomPlots): persistent artists of the zoom subplots from generate_interactive_plot()
         plot_customs (dict): plot customization options dictionary
         xmin (int): minimum x (time) value
         xmax (int): maximum x (time) value
@@ -615,71 +918,52 @@ def update_interactive_plot(spans, int_plot, int_ax1_zoom, int_ax2_zoom, plot_cu
 
     """    
     
-    from src.modeling import linearly_analyze # import in function to avoid circular import
+    from src.modeling import weighted_linear_fit, linear_fit_label # import in function to avoid circular import
     
     for span in spans:
         if span.active:
             span.extents = (xmin, xmax)
 
-    # clear previous linear fit
-    int_ax1_zoom.cla()
-    int_ax2_zoom.cla()
-
-    # min and max indices are where elements should be inserted to maintain order
-    imin, imax = np.searchsorted(x_time[0], (xmin, xmax))
-    # range will be at most all elems in x, or imax
-    imax = min(len(x_time[0])-1, imax)
+    imin, imax = range_indices(x_time[0], xmin, xmax)
 
     # cursor x and y for zoomed plot and data range
     zoomx = x_time[0][imin:imax]
-    zoomy1 = y_rf[imin:imax]
-    zoomy2 = y_dis[imin:imax]
+    zoom_ys = (y_rf[imin:imax], y_dis[imin:imax])
+
+    # linear regression on zoomed data, frequency and dissipation fit together
+    # fit is of every point in the selection, only drawn over the points plotted
+    units = (f"Hz/{x_scale}", f"1/{x_scale}")
+    label_prefixes = ("frequency drift: ", "dissipation drift: ")
+    slopes, intercepts, _, r_squareds = weighted_linear_fit(zoomx, np.vstack(zoom_ys))
+
+    for i, (y_data, pyramid, zoom_ax) in enumerate(zip((y_rf, y_dis), zoom_plots.pyramids, zoom_plots.zoom_axes)):
+        # points drawn, all of the selection's mins and maxes and its first and last points at the resolution of the plot
+        idxs = pyramid.query(imin, imax, 2 * int(zoom_ax.bbox.width))
+        plotx, ploty = take(x_time[0], idxs), take(y_data, idxs)
+
+        # in case selection has no data to fit
+        m, b = float(slopes[i]), float(intercepts[i])
+        if np.isfinite(m) and np.isfinite(b):
+            print(f"R² = {r_squareds[i]}")
+            zoom_plots.set_data(i, plotx, ploty, (m, b), linear_fit_label(m, b, label_prefixes[i], units[i]), plot_customs)
+        else:
+            err_txt = "Curve fit failed!"
+            Exceptions.error_popup(err_txt)
+            zoom_plots.set_data(i, plotx, ploty, None, err_txt, plot_customs)
 
-    # update data to newly spec'd range
-    int_ax1_zoom.plot(zoomx, zoomy1, '.', color='green', markersize=1)
-    int_ax2_zoom.plot(zoomx, zoomy2, '.', color='blue', markersize=1)
-    
-    # linear regression on zoomed data
-    freq_units = f"Hz/{x_scale}"
-    dis_units = f"1/{x_scale}"
-
-    # in case data does not perform with linear fit
-    try:
-        linearly_analyze(zoomx, zoomy1, int_ax1_zoom, "frequency drift: ", freq_units)
-        linearly_analyze(zoomx, zoomy2, int_ax2_zoom, "dissipation drift: ", dis_units)
-    except Exception as e:
-        print(e)
-        err_txt = "Curve fit failed!"
-        Exceptions.error_popup(err_txt)
-        legend_text = int_ax1_zoom.legend([err_txt], loc='best')
-        legend_text = int_ax2_zoom.legend([err_txt], loc='best')
-    int_ax1_zoom.legend(loc='best', fontsize=plot_customs['legend_text_size'], prop={'family': plot_customs['font']}, framealpha=0.3)
-    int_ax2_zoom.legend(loc='best', fontsize=plot_customs['legend_text_size'], prop={'family': plot_customs['font']}, framealpha=0.3)
-
-    # set limits of tick marks
-    int_ax1_zoom.set_xlim(zoomx.min(), zoomx.max())
-    int_ax1_zoom.set_ylim(zoomy1.min(), zoomy1.max())
-    int_ax2_zoom.set_xlim(zoomx.min(), zoomx.max())
-    int_ax2_zoom.set_ylim(zoomy2.min(), zoomy2.max())
-
-    int_plot.canvas.draw_idle()
+        # set limits of tick marks, the drawn points have the same extent as the selection
+        zoom_ax.set_xlim(plotx.min(), plotx.max())
+        zoom_ax.set_ylim(ploty.min(), ploty.max())
 
-    return imin, imax
+    zoom_plots.redraw()
 
-def interactive_plot_analysis(fn, df, range, imin, imax, which_plot, which_fmt):
-    """prepares, generates, and saves statistical calculations of int plot selected data"""
-    # prep and save data to file
-    # frequency stats for bandwidth shift
-    stats_out_fn = f'selected_ranges/{which_fmt}_all_stats_rf.csv'
-    header = f"overtone,Dfreq_average,Dfreq_std_dev,Dfreq_median,range_name,x_lower,x_upper,data_source\n"
-    prepare_stats_file(header, range[which_fmt], fn, stats_out_fn)
-    
-    # dissipation stats for bandwidth shift
-    stats_out_fn = f'selected_ranges/{which_fmt}_all_stats_dis.csv'
-    header = f"overtone,Ddis_average,Ddis_std_dev,Ddis_median,range_name,x_lower,x_upper,data_source\n"
-    prepare_stats_file(header, range[which_fmt], fn, stats_out_fn)
+    return imin, imax
 
-    range_statistics(df, imin, imax, which_plot, range[which_fmt], which_fmt, fn)
+def interactive_plot_analysis(fn, df, range, imin, imax, which_plot, which_fmt, stats=None, session=None):
+    """generates and saves statistical calculations of int plot selected data
+    stats is an optional RangeStats of df and session an optional StatsSession, see range_statistics()"""
+    # frequency and dissipation stats for bandwidth shift, stats saved before for this range are replaced
+    range_statistics(df, imin, imax, which_plot, range[which_fmt], which_fmt, fn, stats, session)
 
 def interactive_plot(input, selected_df, x_time, time_col, data_fmt):
     """main function for handling interactive plot, all other int plot related functions called from here
@@ -696,11 +980,15 @@ def interactive_plot(input, selected_df, x_time, time_col, data_fmt):
     int_plot_analysis = Analysis(input.file)
     spans = []        
     is_raw = True if data_fmt == 'raw' else False
-    int_plot, int_ax1, int_ax2, int_ax1_zoom, int_ax2_zoom, y_rf, y_dis = generate_interactive_plot(input.interactive_plot_overtone[data_fmt], plot_customs['time_scale'], selected_df, time_col, is_raw)
+    int_plot, int_ax1, int_ax2, int_ax1_zoom, int_ax2_zoom, y_rf, y_dis, zoom_plots = generate_interactive_plot(input.interactive_plot_overtone[data_fmt], plot_customs['time_scale'], selected_df, time_col, is_raw)
 
     # raw or clean interactive plot, as decided by user in UI
     which_fmt = [fmt[0] for fmt in input.interactive_plot_data_fmt.items() if fmt[1] == True][0]
 
+    # statistics of selected overtones for any selection without going over the selected data
+    stats_cols = [ov for ov, is_selected in input.which_plot[data_fmt].items() if is_selected and ov in selected_df.columns]
+    range_stats = RangeStats(selected_df, stats_cols)
+
 
     def update_text(event):
         if input.which_range_selecting == '':
@@ -709,23 +997,32 @@ def interactive_plot(input, selected_df, x_time, time_col, data_fmt):
         text = x_entry.get()
         try:
             xmin, xmax = map(float, text.split(','))
-            int_ax1_zoom.set_xlim(xmin, xmax)
-            int_plot.canvas.draw()
         except ValueError:
             msg = "Invalid input format. Please enter a valid range."
             Exceptions.error_popup(msg)
             print(msg)
+            return
 
-        imin, imax = update_interactive_plot(spans, int_plot, int_ax1_zoom, int_ax2_zoom, plot_customs,
+        imin, imax = update_interactive_plot(spans, zoom_plots, plot_customs,
                                   xmin, xmax, x_time, y_rf, y_dis, plot_customs['time_scale'])
         interactive_plot_analysis(int_plot_analysis.formatted_fn, selected_df, input.which_range_selecting,
-                                  imin, imax, input.which_plot[data_fmt].items(), which_fmt)
+                                  imin, imax, input.which_plot[data_fmt].items(), which_fmt, range_stats, stats_session)
     
     plot_win, x_entry = set_x_entry()
     x_entry.bind('<Return>', update_text)
 
+    # dragging a selection makes many selections a second, stats are kept in memory and saved
+    # once the selection settles, or when the window closes
+    stats_session = StatsSession(plot_win)
+
+    def on_close():
+        stats_session.close()
+        plot_win.destroy()
+    plot_win.protocol("WM_DELETE_WINDOW", on_close)
+
     # draw initial figure
-    canvas = matplotlib.backends.backend_tkagg.FigureCanvasTkAgg(int_plot, master=plot_win)
+    from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg # only the UI loads tk
+    canvas = FigureCanvasTkAgg(int_plot, master=plot_win)
     canvas.draw()
     canvas.get_tk_widget().pack()
 
@@ -734,16 +1031,14 @@ def interactive_plot(input, selected_df, x_time, time_col, data_fmt):
             print("** WARNING: NO RANGE SELECTED VALUES WILL NOT BE ACCOUNTED FOR")
             return
         
-        imin, imax = update_interactive_plot(spans, int_plot, int_ax1_zoom, int_ax2_zoom, plot_customs,
+        imin, imax = update_interactive_plot(spans, zoom_plots, plot_customs,
                                   xmin, xmax, x_time, y_rf, y_dis, plot_customs['time_scale'])
         interactive_plot_analysis(int_plot_analysis.formatted_fn, selected_df, input.which_range_selecting,
-                                  imin, imax, input.which_plot[data_fmt].items(), which_fmt)
+                                  imin, imax, input.which_plot[data_fmt].items(), which_fmt, range_stats, stats_session)
 
             
         x_entry.delete(0,"end") # update text field to match
         x_entry.insert(0,f"{xmin:.2f},{xmax:.2f}") 
-        canvas.draw()
-        canvas.get_tk_widget().pack()
 
     # using plt's span selector to select area of top plot
     span1 = SpanSelector(int_ax1, on_clean_select, 'horizontal', useblit=True,
@@ -757,308 +1052,33 @@ def interactive_plot(input, selected_df, x_time, time_col, data_fmt):
     
     spans = [span1, span2]
     plot_win.mainloop()
+    stats_session.close() # in case the window was closed some other way
 
     plt.show()
 
 
 ''' Main routine for data analysis and visualization
 This function is called with the input object containing all the user input specs from main.py
-All data processing is done here, with preceeding functions being called by this one as utilities
+All data processing and plotting is done by the headless engine (src/engine.py), this adds the interactive plot on top
 '''
 def analyze_data(input):
-    analysis = Analysis(input.file) # analysis object contains relevant file/data information
-    t0_str = str(input.abs_base_t0).lstrip('0') # baseline time t=0 spec'd by user
-    tf_str = str(input.abs_base_tf).lstrip('0') # baseline time t=f spec'd by user
-    # grab singular file and create dataframe from it
-    df = pd.read_csv(analysis.formatted_fn)
-    print(f"dataframe {df}")
-
-    # check missing values, distinguishing between some values in a row missing and entire rows missing
-    # some missing in a row indicates problematic data
-    # all missing is likely with qsense where there may be more values recorded for temperature
-    threshold_rows_missing = df.shape[0] * 0.001 # threshold missing rows
-    exists_some_missing = (df.isna().sum(axis=1) > threshold_rows_missing).any()
-    if exists_some_missing:
-        columns_with_missing = df.columns[df.isna().any()].tolist()
-        msg = "WARNING: There is missing data in this file. This is likely a few missing values at the start or end, no cause for concern \n" +\
-                "However it could potentially be an issue with the exporting of data or experiment itself.\n"+\
-                "You may proceed with analysis, the software will drop rows with empty values, but proceed cautiously as erroneous results may occur."+\
-                f"\n\nMISSING COLUMNS:\n{columns_with_missing}"
-        print(msg)
-        Exceptions.warning_popup(msg)
-
-    freq_color_map, dis_color_map = map_colors()
+    from src.engine import AnalysisOptions, run_analysis # import in function to avoid circular import
 
-    plot_customs = get_plot_preferences()
-    dpi = plot_customs['fig_dpi'] # resolution of figure from plot customization (200 default)
-    points_idx = plot_customs['points_plotted_index'] # plot every 'xth' point
-
-    # cleaning data and plotting clean data
-    if input.will_plot_clean_data:
-        clean_freqs, clean_disps = get_channels(input.which_plot['clean'].items())
-        freq_plot_cap = len(clean_freqs)
-        disp_plot_cap = len(clean_disps)
-        diff = len(clean_freqs) - len(clean_disps) # account for potentially different num of freq and dis overtones
-
-        # plotting objects
-        freq_fig = plt.figure()
-        freq_ax = freq_fig.add_subplot(111)
-        dis_fig = plt.figure()
-        dis_ax = dis_fig.add_subplot(111)            
-
-        if input.will_plot_dD_v_dF:
-            disVfreq_fig = plt.figure()
-            disVfreq_ax = disVfreq_fig.add_subplot(111)
-
-        if input.will_plot_dF_dD_together:
-            mult_fig, mult_ax1 = plt.subplots()
-            mult_ax2 = mult_ax1.twinx()
-
-        if input.file_src_type != 'Qsense':
-            analysis.temp_time_col = analysis.time_col
-        if input.will_plot_temp_v_time:
-            try:
-                temperature_df = df[[analysis.temp_time_col, analysis.temp_col]].copy()
-                temperature_df.dropna(axis=0, how='any', inplace=True)
-                print(f"***\n\n {df}\n\n{temperature_df}\n\n***")
-            except Exception as e:
-                msg = f"Experiment file does not have temperature data, setting temperature values to 0.\nerr: {e}"
-                print(msg)
-                Exceptions.error_popup(msg)
-                temperature_df = df[[analysis.time_col]]
-                temperature_df[analysis.temp_col] = 0
-
-
-        # if different num of freq and raw channels, must do equal amount for plotting,
-        # but can just not plot the results later; set plot cap for the lesser
-        # diff pos -> more freq channels than disp
-        if diff > 0:
-            clean_iters = len(clean_freqs)
-
-            for i, ov in enumerate(clean_freqs):
-                if ov not in clean_disps:
-                    corr_dis = 'fundamental_dis' if ov.__contains__('fundamental') else ordinal(get_num_from_string(ov)) + '_dis'
-                    clean_disps.insert(i, corr_dis)
-
-        # diff neg -> more disp channels than freq
-        elif diff < 0:
-            clean_iters = len(clean_disps)
-            for i in range(abs(diff)):
-                clean_freqs.append(analysis.freqs[i])
-        # if length same, then iterations is length of either
-        else:
-            clean_iters = len(clean_freqs)
-            
-        # remove everything before baseline
-        if input.is_relative_time: 
-            base_t0_ind = find_nearest_time(input.rel_t0, df, analysis.time_col, input.is_relative_time) # baseline correction
-        else:
-            base_t0_ind = find_nearest_time(t0_str, df, analysis.abs_time_col, input.is_relative_time) # baseline correction
-        df = df[base_t0_ind:] # baseline correction
-        df = df.reset_index(drop=True)
-        # find baseline and grab values from baseline for avg
-        if input.is_relative_time: 
-            base_tf_ind = find_nearest_time(input.rel_tf, df, analysis.time_col, input.is_relative_time) # baseline correction
-        else:
-            base_tf_ind = find_nearest_time(tf_str, df, analysis.abs_time_col, input.is_relative_time) # baseline correction
-        baseline_df = df[:base_tf_ind].copy()
-
-        if input.will_calculate_offset:
-            find_offset_values(baseline_df)
-        
-        for i in range(clean_iters):
-            # grab data from df and grab only columns we need, then drop nan values
-            data_df = df[[analysis.time_col,clean_freqs[i],clean_disps[i]]].copy().dropna()
-            print(clean_disps,'********\n********', data_df)
-            print(f"clean freq ch: {clean_freqs[i]}; clean disp ch: {clean_disps[i]}")
-            print(f"clean freq ch: {clean_freqs[i]}; clean disp ch: {clean_disps[i]}")
-            
-            if data_df.empty: # check for if data is missing
-                msg = f"ERROR: there is no data for either {clean_freqs[i]} or {clean_disps[i]}"+\
-                      "\nPlease either uncheck these overtones, or check file for missing data and try again"
-                Exceptions.error_popup(msg)
-                print(msg)
-
-            # normalize by overtone
-            if input.will_normalize_F:
-                overtone = get_num_from_string(clean_freqs[i])
-                data_df[clean_freqs[i]] /= overtone
-                baseline_df[clean_freqs[i]] /= overtone
-
-            # compute average of rf and dis
-            if baseline_df[clean_freqs[i]].values.size == 0 or baseline_df[clean_disps[i]].values.size == 0:
-                msg = f"ERROR: Found no datapoints between {input.rel_t0} and {input.rel_tf} seconds.\nPlease adjust baseline time range."
-                Exceptions.error_popup(msg)
-                break
-            rf_base_avg = baseline_df[clean_freqs[i]].mean() # baseline correction
-            dis_base_avg = baseline_df[clean_disps[i]].mean() # baseline correction
-
-
-            # lower rf curve s.t. baseline is approx at y=0
-            data_df[clean_freqs[i]] -= rf_base_avg # baseline correction
-            data_df[clean_disps[i]] -= dis_base_avg # baseline correction
-            # shift x to left to start at 0
-            baseline_start = data_df[analysis.time_col].iloc[0]
-            data_df[analysis.time_col] -= baseline_start # baseline correction
-            data_df[analysis.time_col] /= get_time_scale_divisor(plot_customs['time_scale'])
-            
-            x_time = data_df[analysis.time_col]
-            y_freq = data_df[clean_freqs[i]]
-            if not input.is_qsd:
-                data_df[clean_disps[i]] *= 1000000 # magnitude conversion
-            y_dis = data_df[clean_disps[i]]
-
-            if input.will_correct_slope:
-                slope_corrected_df = data_df.copy()
-                x_time_freq, y_freq = shift_by_slope(x_time, y_freq ,baseline_df, analysis.time_col, clean_freqs[i])
-                x_time_dis, y_dis = shift_by_slope(x_time, y_dis, baseline_df, analysis.time_col, clean_disps[i])
-                slope_corrected_df[clean_freqs[i]] = y_freq
-                slope_corrected_df[clean_disps[i]] = y_dis
-            else:
-                x_time_freq = x_time
-                x_time_dis = x_time
-
-            if input.will_normalize_F: # need freqs NOT normalized for int plot and modeling purposes
-                if input.will_correct_slope:
-                    unnormalized_df = slope_corrected_df.copy()
-                else:
-                    unnormalized_df = data_df.copy()
-                unnormalized_df[clean_freqs[i]] *= overtone
-
-            # PLOTTING
-            if i < freq_plot_cap:
-                freq_ax.plot(x_time_freq[::points_idx], y_freq[::points_idx], '.', markersize=1, label=ordinal(get_num_from_string(clean_freqs[i])), color=freq_color_map[clean_freqs[i]])
-        
-            if i < disp_plot_cap:
-                dis_ax.plot(x_time_dis[::points_idx], y_dis[::points_idx], '.', markersize=1, label=ordinal(get_num_from_string(clean_disps[i])), color=dis_color_map[clean_disps[i]])
-
-            # plotting change in disp vs change in freq
-            if input.will_plot_dD_v_dF:
-                disVfreq_ax.plot(y_freq[::points_idx], y_dis[::points_idx], '.', markersize=1, label=ordinal(get_num_from_string(clean_freqs[i])))
-            
-            # multi axis plot for change in freq and change in dis vs time
-            if input.will_plot_dF_dD_together:
-                plot_multiaxis(input, (x_time_freq, x_time_dis), y_freq, y_dis,
-                               ordinal(get_num_from_string(clean_freqs[i])),
-                               ordinal(get_num_from_string(clean_disps[i])),
-                               mult_fig, mult_ax1, mult_ax2,freq_color_map[clean_freqs[i]])
-
-            print(f"rf average: {rf_base_avg}; dis average: {dis_base_avg}\n")
-
-            # put cleaned data back into original df for interactive plot
-            if input.will_overwrite_file or input.enable_interactive_plot:
-                if i == 0:
-                    cleaned_df = data_df[[analysis.time_col]]
-                    if input.will_normalize_F:
-                        unnormalized_cleaned_df = data_df[[analysis.time_col]]
-                    if input.will_correct_slope:
-                        slope_corrected_cleaned_df = data_df[[analysis.time_col]]
-                cleaned_df = pd.concat([cleaned_df,data_df[clean_freqs[i]]], axis=1)
-                cleaned_df = pd.concat([cleaned_df,data_df[clean_disps[i]]], axis=1)
-                if input.will_normalize_F:
-                    unnormalized_cleaned_df = pd.concat([unnormalized_cleaned_df,unnormalized_df[clean_freqs[i]]], axis=1)
-                    unnormalized_cleaned_df = pd.concat([unnormalized_cleaned_df,unnormalized_df[clean_disps[i]]], axis=1)
-                if input.will_correct_slope:
-                    slope_corrected_cleaned_df = pd.concat([slope_corrected_cleaned_df,slope_corrected_df[clean_freqs[i]]], axis=1)
-                    slope_corrected_cleaned_df = pd.concat([slope_corrected_cleaned_df,slope_corrected_df[clean_disps[i]]], axis=1)
-                
-        if input.will_plot_temp_v_time:
-            tempVtime_fig = plt.figure()
-            tempVtime_ax = tempVtime_fig.add_subplot(111)
-            temperature_df[analysis.temp_time_col] /= get_time_scale_divisor(plot_customs['time_scale'])
-            plot_temp_v_time(tempVtime_fig, tempVtime_ax, temperature_df[analysis.temp_time_col].values, temperature_df[analysis.temp_col].values, plot_customs['time_scale'])    
-
-        # Titles, lables, etc. for plots
-        rf_fig_title = "QCM-D Resonant Frequency"
-        rf_fn = "qcmd-plots/resonant-freq-plot"
-        fig_x = determine_xlabel(plot_customs['time_scale'])
-
-        dis_fig_title = "QCM-D Dissipation"
-        dis_fn = f"qcmd-plots/dissipation-plot"
-
-        # format and save figures
-        setup_plot(freq_fig, freq_ax, fig_x, determine_ylabel('freq', input.will_normalize_F),
-                   rf_fig_title, rf_fn)
-        setup_plot(dis_fig, dis_ax, fig_x, determine_ylabel('dis', input.will_normalize_F),
-                   dis_fig_title, dis_fn)
-        
-        freq_fig.savefig(f"qcmd-plots/frequency_plot.{plot_customs['fig_format']}", format=plot_customs['fig_format'], bbox_inches='tight', transparent=True, dpi=dpi)
-        dis_fig.savefig(f"qcmd-plots/dissipation_plot.{plot_customs['fig_format']}", format=plot_customs['fig_format'], bbox_inches='tight', transparent=True, dpi=dpi)
-        
-        if input.will_plot_dD_v_dF:
-            dVf_fn = f"qcmd-plots/disp_V_freq-plot"
-            setup_plot(disVfreq_fig, disVfreq_ax, determine_ylabel('freq', input.will_normalize_F), determine_ylabel('dis', input.will_normalize_F),
-                       dis_fig_title, dVf_fn)
-            disVfreq_fig.savefig(f"qcmd-plots/disp_V_freq_plot.{plot_customs['fig_format']}", format=plot_customs['fig_format'], bbox_inches='tight', transparent=True, dpi=dpi)
-            
-
-        # saving multiaxis plot.
-        if input.will_plot_dF_dD_together:
-            box = mult_ax1.get_position()
-            mult_ax1.set_position([box.x0, box.y0 + box.height * 0.1, box.width, box.height * 0.9])
-            mult_fig.legend(loc='upper center', bbox_to_anchor=(0.5, 0.1), ncol=2, fancybox=True, shadow=True, fontsize=plot_customs['legend_text_size'], prop={'family': 'Arial'}, framealpha=0.1)
-            mult_fig.savefig(f"qcmd-plots/freq_dis_V_time.{plot_customs['fig_format']}", format=plot_customs['fig_format'], bbox_inches='tight', transparent=True, dpi=dpi*1.25) # slightly higher dpi for dense graph
-
-    # Gathering raw data for individual plots
-    if input.will_plot_raw_data:
-        # plot definitions
-        rf_fig_title = "RAW QCM-D Resonant Frequency"
-        fig_x = determine_xlabel(plot_customs['time_scale'])
-        dis_fig_title = "RAW QCM-D Dissipation"
-        
-        df[analysis.time_col] /= get_time_scale_divisor(plot_customs['time_scale'])
-        print(df)
-
-        raw_freqs, raw_disps = get_channels(input.which_plot['raw'].items())
-        raw_freq_fig = plt.figure()
-        raw_freq_ax = raw_freq_fig.add_subplot(111)
-        # gather and plot raw frequency data
-        for i in range(len(raw_freqs)):
-            freq_df = df[[analysis.time_col,raw_freqs[i]]]
-            x_time = freq_df[analysis.time_col]
-            y_freq = freq_df[raw_freqs[i]]
-        
-            raw_freq_ax.plot(x_time[::points_idx], y_freq[::points_idx], '.', markersize=1, label=ordinal(get_num_from_string(raw_freqs[i])), color=freq_color_map[raw_freqs[i]])
-            
-        # gather and plot raw dissipation data
-        raw_dis_fig = plt.figure()
-        raw_dis_ax = raw_dis_fig.add_subplot(111)
-        for i in range(len(raw_disps)):
-            dis_df = df[[analysis.time_col,raw_disps[i]]]
-            x_time = dis_df[analysis.time_col]
-            y_dis = dis_df[raw_disps[i]]
-            raw_dis_ax.plot(x_time[::points_idx], y_dis[::points_idx], '.', markersize=1, label=ordinal(get_num_from_string(raw_disps[i])), color=dis_color_map[raw_disps[i]])
-            
-        # save raw frequency plots
-        rf_fn = f"qcmd-plots/RAW-resonant-freq-plot"
-        setup_plot(raw_freq_fig, raw_freq_ax, fig_x, determine_ylabel('freq', False, True), rf_fig_title, rf_fn, plot_customs['fig_format'])
-        raw_freq_fig.savefig(rf_fn + '.' + plot_customs['fig_format'], format=plot_customs['fig_format'], bbox_inches='tight', transparent=True, dpi=dpi)
-
-        # save raw dissipation plots
-        dis_fn = f"qcmd-plots/RAW-dissipation-plot"
-        setup_plot(raw_dis_fig, raw_dis_ax, fig_x, determine_ylabel('dis', False, True), dis_fig_title, dis_fn,  plot_customs['fig_format'])
-        raw_dis_fig.savefig(dis_fn + '.' + plot_customs['fig_format'], format=plot_customs['fig_format'], bbox_inches='tight', transparent=True, dpi=dpi)
+    options = AnalysisOptions.from_input(input)
+    result = run_analysis(options)
+    time_col = result.time_col
 
     # interactive plot
     if input.enable_interactive_plot:
-        if input.interactive_plot_data_fmt['clean']:
-            if input.will_normalize_F:
-                interactive_plot(input, unnormalized_cleaned_df, (x_time_freq, x_time_dis), analysis.time_col, 'clean')
-            elif input.will_correct_slope:
-                interactive_plot(input, slope_corrected_cleaned_df, (x_time_freq, x_time_dis), analysis.time_col, 'clean')
-            else:
-                interactive_plot(input, cleaned_df, (x_time_freq, x_time_dis), analysis.time_col, 'clean')
+        if input.interactive_plot_data_fmt['clean'] and result.clean_x_time is not None: # no cleaned data if baseline was empty
+            interactive_plot(input, result.interactive_clean_df(options), result.clean_x_time, time_col, 'clean')
 
         if input.interactive_plot_data_fmt['raw']:
-            print(df)
-            interactive_plot(input, df, (x_time, x_time), analysis.time_col, 'raw')
+            print(result.raw_df)
+            interactive_plot(input, result.raw_df, (result.raw_x_time, result.raw_x_time), time_col, 'raw')
 
-    # clear plots and lists for next iteration
-    if input.will_plot_clean_data:
-        clean_freqs.clear()
-        clean_disps.clear()
     print("*** Plots Generated ***")
-
+    return result
 
 if __name__ == '__main__':
     analyze_data()
\ No newline at end of file
@@ -0,0 +1,145 @@
+import os
+import sys
+import glob
+import json
+import time
+import argparse
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from . import Exceptions
+from src.format_file import format_raw_data
+
+'''formats a whole directory (or glob) of instrument exports in parallel, one file per worker process
+formatted files are written to raw_data/ as when formatting from the UI, so run from the pyQCM directory
+a json manifest records the outputs, timing, and any error of every file
+
+usage: python -m src.batch_format <directory or glob> --device QCM-i [--workers N] [--manifest fn]'''
+
+DEVICES = ('QCM-d', 'QCM-i', 'Qsense', 'AWSensors')
+DATA_EXTS = ('.csv', '.txt', '.xls', '.xlsx', '.xlsm', '.qsd')
+DEFAULT_MANIFEST_FN = 'raw_data/batch_manifest.json'
+
+
+class BatchFormatError(Exception):
+    pass
+
+def batch_reporter(level, msg):
+    # workers have no UI to show popups, so errors fail the file instead and end up in the manifest
+    if level == 'error':
+        raise BatchFormatError(msg if msg else "unknown error while formatting")
+    Exceptions.print_reporter(level, msg)
+
+def init_worker():
+    Exceptions.set_reporter(batch_reporter)
+
+def find_data_files(path):
+    """data files to format from a directory or glob pattern, skipping previously formatted files
+
+    Args:
+        path (str): directory containing data files or glob pattern matching them
+
+    Returns:
+        list of str: sorted data file paths
+    """    
+    pattern = os.path.join(path, '*') if os.path.isdir(path) else path
+    data_files = [fn for fn in glob.glob(pattern)
+                  if os.path.isfile(fn) and os.path.splitext(fn)[1].lower() in DATA_EXTS
+                  and not os.path.basename(fn).startswith('Formatted')]
+    return sorted(data_files)
+
+def format_one(data_file, src_type, will_use_theoretical_vals, all_sensors, export_csv):
+    """format a single file in a worker, returning its manifest entry instead of raising"""
+    start = time.perf_counter()
+    entry = {'file': data_file, 'status': 'ok', 'outputs': [], 'seconds': 0.0, 'error': None}
+    try:
+        entry['outputs'] = format_raw_data(src_type, data_file, will_use_theoretical_vals, all_sensors, export_csv)
+        if not entry['outputs']:
+            raise BatchFormatError("no formatted data written")
+    except Exception as e:
+        entry['status'] = 'failed'
+        entry['error'] = f"{type(e).__name__}: {e}"
+        entry['traceback'] = traceback.format_exc()
+    entry['seconds'] = time.perf_counter() - start
+    return entry
+
+def batch_format(data_files, src_type, will_use_theoretical_vals=True, all_sensors=False, export_csv=False,
+                 workers=None, manifest_fn=DEFAULT_MANIFEST_FN):
+    """format many data files across a process pool, continuing past files that fail
+
+    Args:
+        data_files (list of str): data file paths
+        src_type (str): device that recorded the data, one of DEVICES
+        will_use_theoretical_vals (bool, optional): use theoretical instead of user offset values. Defaults to True.
+        all_sensors (bool, optional): format every sensor of 4 sensor .qsd files. Defaults to False.
+        export_csv (bool, optional): also save formatted data as csv. Defaults to False.
+        workers (int, optional): number of worker processes. Defaults to None (number of cores).
+        manifest_fn (str, optional): where to write the json manifest. Defaults to DEFAULT_MANIFEST_FN.
+
+    Returns:
+        dict: manifest with one entry per data file, in input order
+    """    
+    start = time.perf_counter()
+    entries = {}
+
+    # formatted files are named after the data file, so files with the same name would overwrite each other
+    seen_names = {}
+    to_format = []
+    for data_file in data_files:
+        file_name = os.path.splitext(os.path.basename(data_file))[0]
+        if file_name in seen_names:
+            entries[data_file] = {'file': data_file, 'status': 'failed', 'outputs': [], 'seconds': 0.0,
+                                  'error': f"same file name as {seen_names[file_name]}, would overwrite its formatted data"}
+        else:
+            seen_names[file_name] = data_file
+            to_format.append(data_file)
+
+    n_files = len(data_files)
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as pool:
+        futures = {pool.submit(format_one, data_file, src_type, will_use_theoretical_vals, all_sensors, export_csv): data_file
+                   for data_file in to_format}
+        for i, future in enumerate(as_completed(futures), start=n_files - len(to_format) + 1):
+            entry = future.result()
+            entries[entry['file']] = entry
+            print(f"[{i}/{n_files}] {entry['status'].upper()} {entry['file']} ({entry['seconds']:.2f}s)" +
+                  (f" - {entry['error']}" if entry['error'] else ''))
+
+    manifest = {
+        'device': src_type,
+        'will_use_theoretical_vals': will_use_theoretical_vals,
+        'n_files': n_files,
+        'n_failed': sum(entry['status'] != 'ok' for entry in entries.values()),
+        'seconds': time.perf_counter() - start,
+        'files': [entries[data_file] for data_file in data_files],
+    }
+    if manifest_fn:
+        with open(manifest_fn, 'w') as fp:
+            json.dump(manifest, fp, indent=4)
+        print(f"manifest written to {manifest_fn}")
+
+    return manifest
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="format a directory of QCM data files in parallel")
+    parser.add_argument('path', help="directory of data files or glob pattern (quote it)")
+    parser.add_argument('--device', required=True, choices=DEVICES, help="device that recorded the data")
+    parser.add_argument('--workers', type=int, default=None, help="worker processes, defaults to number of cores")
+    parser.add_argument('--user-offsets', action='store_true', help="add offset values from offset_data/ instead of theoretical values")
+    parser.add_argument('--all-sensors', action='store_true', help="format every sensor of 4 sensor .qsd files")
+    parser.add_argument('--export-csv', action='store_true', help="also save formatted data as csv")
+    parser.add_argument('--manifest', default=DEFAULT_MANIFEST_FN, help="json manifest output path")
+    args = parser.parse_args(argv)
+
+    data_files = find_data_files(args.path)
+    if not data_files:
+        print(f"no data files found in {args.path}")
+        return 1
+    manifest = batch_format(data_files, args.device, not args.user_offsets, args.all_sensors, args.export_csv,
+                            args.workers, args.manifest)
+    print(f"formatted {manifest['n_files'] - manifest['n_failed']}/{manifest['n_files']} files in {manifest['seconds']:.2f}s")
+    return 1 if manifest['n_failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
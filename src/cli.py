@@ -0,0 +1,296 @@
+import os
+os.environ.setdefault('MPLBACKEND', 'Agg') # before matplotlib is imported anywhere, no display is needed (or used)
+import sys
+import json
+import time
+import argparse
+import traceback
+import multiprocessing
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import src.Exceptions as Exceptions
+from src.format_file import format_raw_data
+from src.stats_store import export_range_stats
+
+'''runs analysis and modeling without the UI, as spec'd by a json job file, so whole archives can be reprocessed unattended
+every job formats its data file, baseline corrects and plots it as analyze_data() does, then saves the statistics of each range
+to the range stats database in selected_ranges/ as if the ranges were selected in the interactive plot. once all jobs are done the modeling routines
+listed in the job file run on those statistics. jobs and models are spread across a pool of worker processes
+run from the pyQCM directory, a json report records the outcome, timing, and any error of every job and model
+
+usage: python -m src.cli jobs.json [--workers N] [--report fn] [--export-csv]
+
+job file example (ranges are in the time scale of the plots, as typed in the interactive plot):
+{
+    "workers": 4,
+    "defaults": {"device": "QCM-i", "is_relative_time": true, "baseline": [10, 100],
+                 "overtones": ["fundamental", "3rd", "5th"], "will_plot_clean_data": true},
+    "jobs": [
+        {"file": "archive/run1.csv", "ranges": {"protein": [120, 300], "rinse": [400, 500]}},
+        {"file": "archive/run2.csv", "baseline": [20, 110], "will_normalize_F": true}
+    ],
+    "models": ["sauerbrey", "avgs_analysis"]
+}
+job settings are any AnalysisOptions attribute (see src/engine.py) plus the shorthands below, values in "defaults" apply to every job'''
+
+MODELS = ('sauerbrey', 'thin_film_liquid_analysis', 'thin_film_air_analysis', 'gordon_kanazawa', 'crystal_thickness', 'avgs_analysis')
+DEFAULT_REPORT_FN = 'selected_ranges/cli_report.json'
+
+# job settings that are not AnalysisOptions attributes
+JOB_SHORTHANDS = {
+    'device': "device that recorded the data, one of src.batch_format.DEVICES (file_src_type)",
+    'baseline': "[t0, tf] of baseline, seconds if relative time else 'H:MM:SS' strings",
+    'overtones': "overtones to analyze, e.g. ['fundamental', '3rd'], selects freq and dis for raw and clean data",
+    'ranges': "range name -> [xmin, xmax] to save statistics of",
+    'range_data_fmt': "'clean' or 'raw', which data ranges are taken from (defaults to clean)",
+    'will_use_theoretical_vals': "use theoretical instead of user offset values when formatting (defaults to true)",
+    'all_sensors': "format every sensor of 4 sensor .qsd files",
+}
+
+stats_lock = None # shared by workers, range statistics of all jobs go to the same files
+model_aggregates = None # saved range statistics as read by this worker's models, see modeling.RangeAggregates
+
+
+class JobError(Exception):
+    pass
+
+def init_worker(lock):
+    global stats_lock
+    stats_lock = lock
+    import matplotlib
+    matplotlib.use('Agg') # forked workers inherit the parent's backend, which may be Tk if run from a session that already plotted
+    Exceptions.set_reporter(Exceptions.raise_reporter) # errors fail the job, and end up in the report
+
+def describe_error(e):
+    with Exceptions.use_reporter(Exceptions.print_reporter): # some of the repo's exceptions report themselves when converted to str
+        return f"{type(e).__name__}: {e}"
+
+def parse_abs_time(time_str):
+    return datetime.strptime(time_str, '%H:%M:%S').time()
+
+def overtone_selections(overtones):
+    """which_plot dict with freq and dis of overtones selected for both raw and clean data
+
+    Args:
+        overtones (list of str): overtones as named in which_plot, e.g. ['fundamental', '3rd']
+
+    Returns:
+        dict: 'raw' and 'clean' dicts of channel name -> if selected
+    """
+    from src.engine import default_channels
+    which_plot = default_channels()
+    for fmt in ('raw', 'clean'):
+        for overtone in overtones:
+            for channel in (f"{overtone}_freq", f"{overtone}_dis"):
+                if channel not in which_plot[fmt]:
+                    raise JobError(f"unknown overtone '{overtone}'")
+                which_plot[fmt][channel] = True
+    return which_plot
+
+def build_options(job):
+    """AnalysisOptions from a job's settings
+
+    Args:
+        job (dict): settings of one job, with defaults already applied
+
+    Returns:
+        AnalysisOptions: analysis settings for the job
+    """
+    from src.engine import AnalysisOptions
+    option_names = set(AnalysisOptions.__dataclass_fields__)
+    unknown = [key for key in job if key not in option_names and key not in JOB_SHORTHANDS and key != 'file']
+    if unknown:
+        raise JobError(f"unknown job settings: {unknown}")
+
+    options = AnalysisOptions(**{key: val for key, val in job.items() if key in option_names})
+    options.file_src_type = job.get('device', options.file_src_type)
+    options.is_qsd = options.file.endswith('.qsd')
+    if 'baseline' in job:
+        t0, tf = job['baseline']
+        if options.is_relative_time:
+            options.rel_t0, options.rel_tf = float(t0), float(tf)
+        else:
+            options.abs_base_t0, options.abs_base_tf = parse_abs_time(t0), parse_abs_time(tf)
+    elif not options.is_relative_time: # json has no time type
+        options.abs_base_t0, options.abs_base_tf = parse_abs_time(str(options.abs_base_t0)), parse_abs_time(str(options.abs_base_tf))
+    if 'overtones' in job:
+        options.which_plot = overtone_selections(job['overtones'])
+    if not options.will_plot_raw_data and not options.will_plot_clean_data:
+        options.will_plot_clean_data = True # nothing to analyze otherwise
+    options.will_keep_cleaned_data = bool(job.get('ranges')) # ranges are taken from the same data as in the interactive plot
+    options.render_workers = job.get('render_workers', 1) # jobs are already spread across the pool, figures are saved in the job's process by default
+
+    # plots of each job go to their own folder so parallel jobs do not overwrite each other's
+    if 'plot_dir' not in job:
+        options.plot_dir = os.path.join('qcmd-plots', os.path.splitext(os.path.basename(options.file))[0])
+    return options
+
+def save_range_stats(job, options, result):
+    """save statistics of each of the job's ranges as selecting them in the interactive plot would"""
+    from src.analyze import Analysis, range_indices, interactive_plot_analysis
+    which_fmt = job.get('range_data_fmt', 'clean')
+    if which_fmt == 'raw':
+        df, x_time = result.raw_df, result.raw_x_time
+    else:
+        df, x_time = result.interactive_clean_df(options), result.clean_x_time[0] if result.clean_x_time else None
+    if df is None or x_time is None:
+        raise JobError(f"ranges need {which_fmt} data, set will_plot_{which_fmt}_data")
+
+    formatted_fn = Analysis(options.file).formatted_fn # stats are labelled with the data file as in the UI
+    for range_name, (xmin, xmax) in job['ranges'].items():
+        imin, imax = range_indices(x_time, xmin, xmax)
+        if imax <= imin: # stats of an empty selection would be written as NANs that the models cannot read
+            raise JobError(f"range '{range_name}' [{xmin}, {xmax}] contains no data")
+        with stats_lock:
+            interactive_plot_analysis(formatted_fn, df, {which_fmt: range_name}, imin, imax,
+                                      options.which_plot[which_fmt].items(), which_fmt)
+
+def run_job(job):
+    """format, analyze, and save range statistics of one data file in a worker, returning its report entry instead of raising"""
+    from src.engine import run_analysis
+    start = time.perf_counter()
+    entry = {'file': job.get('file'), 'status': 'ok', 'figures': [], 'ranges': list(job.get('ranges', {})), 'seconds': 0.0, 'error': None}
+    try:
+        options = build_options(job)
+        if not format_raw_data(options.file_src_type, options.file, job.get('will_use_theoretical_vals', True), job.get('all_sensors', False)):
+            raise JobError("no formatted data written")
+        os.makedirs(options.plot_dir, exist_ok=True)
+        result = run_analysis(options)
+        entry['figures'] = list(result.figure_fns.values())
+        if job.get('ranges'):
+            save_range_stats(job, options, result)
+    except Exception as e:
+        entry['status'] = 'failed'
+        entry['error'] = describe_error(e)
+        entry['traceback'] = traceback.format_exc()
+    entry['seconds'] = time.perf_counter() - start
+    return entry
+
+def run_model(model, which_plot, will_use_theoretical_vals):
+    """run one modeling routine on the saved range statistics in a worker, returning its report entry instead of raising"""
+    global model_aggregates
+    from src import modeling
+    start = time.perf_counter()
+    entry = {'model': model, 'status': 'ok', 'seconds': 0.0, 'error': None}
+    if model_aggregates is None: # a worker running several models reads and averages the stats once
+        model_aggregates = modeling.RangeAggregates()
+    try:
+        if model == 'sauerbrey':
+            modeling.sauerbrey(will_use_theoretical_vals, model_aggregates)
+        elif model == 'thin_film_liquid_analysis':
+            modeling.thin_film_liquid_analysis(which_plot['clean'], will_use_theoretical_vals, False, model_aggregates)
+        elif model == 'thin_film_air_analysis':
+            modeling.thin_film_air_analysis(which_plot['clean'], will_use_theoretical_vals, False, model_aggregates)
+        elif model == 'gordon_kanazawa':
+            modeling.gordon_kanazawa((which_plot['clean'], will_use_theoretical_vals))
+        elif model == 'crystal_thickness':
+            modeling.crystal_thickness(which_plot['raw'], will_use_theoretical_vals)
+        elif model == 'avgs_analysis':
+            modeling.avgs_analysis(model_aggregates)
+    except Exception as e:
+        entry['status'] = 'failed'
+        entry['error'] = describe_error(e)
+        entry['traceback'] = traceback.format_exc()
+    entry['seconds'] = time.perf_counter() - start
+    return entry
+
+def load_job_file(job_fn):
+    """read job file, applying its defaults to every job
+
+    Returns:
+        list of dict: settings of each job
+        list of str: models to run
+        dict: job file contents
+    """
+    with open(job_fn, 'r') as fp:
+        spec = json.load(fp)
+    defaults = spec.get('defaults', {})
+    jobs = [{**defaults, **job} for job in spec.get('jobs', [])]
+    models = spec.get('models', [])
+    unknown = [model for model in models if model not in MODELS]
+    if unknown:
+        raise JobError(f"unknown models: {unknown}, choose from {MODELS}")
+    return jobs, models, spec
+
+def run_jobs(jobs, models=(), workers=None, report_fn=DEFAULT_REPORT_FN, model_overtones=None, will_use_theoretical_vals=True):
+    """run analysis jobs across a process pool, then the modeling routines on the statistics they saved
+
+    Args:
+        jobs (list of dict): settings of each job, see module docstring
+        models (list of str, optional): modeling routines to run after all jobs, from MODELS. Defaults to ().
+        workers (int, optional): number of worker processes. Defaults to None (number of cores).
+        report_fn (str, optional): where to write the json report. Defaults to DEFAULT_REPORT_FN.
+        model_overtones (list of str, optional): overtones the models use. Defaults to None (overtones of the first job).
+        will_use_theoretical_vals (bool, optional): models use theoretical instead of user offset values. Defaults to True.
+
+    Returns:
+        dict: report with one entry per job and per model, in input order
+    """
+    start = time.perf_counter()
+    os.makedirs('qcmd-plots/modeling', exist_ok=True)
+    os.makedirs('selected_ranges', exist_ok=True)
+    ctx = multiprocessing.get_context()
+    lock = ctx.Lock()
+
+    job_entries = [None] * len(jobs)
+    model_entries = [None] * len(models)
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx, initializer=init_worker, initargs=(lock,)) as pool:
+        futures = {pool.submit(run_job, job): i for i, job in enumerate(jobs)}
+        for n_done, future in enumerate(as_completed(futures), start=1):
+            entry = future.result()
+            job_entries[futures[future]] = entry
+            print(f"[{n_done}/{len(jobs)}] {entry['status'].upper()} {entry['file']} ({entry['seconds']:.2f}s)" +
+                  (f" - {entry['error']}" if entry['error'] else ''))
+
+        # models read the statistics of every job's ranges, so they only start once all jobs are done
+        if models:
+            if model_overtones is None:
+                model_overtones = jobs[0].get('overtones', []) if jobs else []
+            which_plot = overtone_selections(model_overtones)
+            futures = {pool.submit(run_model, model, which_plot, will_use_theoretical_vals): i for i, model in enumerate(models)}
+            for future in as_completed(futures):
+                entry = future.result()
+                model_entries[futures[future]] = entry
+                print(f"{entry['status'].upper()} {entry['model']} ({entry['seconds']:.2f}s)" +
+                      (f" - {entry['error']}" if entry['error'] else ''))
+
+    report = {
+        'n_jobs': len(jobs),
+        'n_failed': sum(entry['status'] != 'ok' for entry in job_entries + model_entries),
+        'seconds': time.perf_counter() - start,
+        'jobs': job_entries,
+        'models': model_entries,
+    }
+    if report_fn:
+        with open(report_fn, 'w') as fp:
+            json.dump(report, fp, indent=4)
+        print(f"report written to {report_fn}")
+
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="run QCM analysis and modeling from a json job file, without the UI")
+    parser.add_argument('job_file', help="json file of jobs, see src/cli.py for the format")
+    parser.add_argument('--workers', type=int, default=None, help="worker processes, overrides the job file, defaults to number of cores")
+    parser.add_argument('--report', default=DEFAULT_REPORT_FN, help="json report output path")
+    parser.add_argument('--export-csv', action='store_true', help="also write all saved range stats to csv files in selected_ranges/")
+    args = parser.parse_args(argv)
+
+    jobs, models, spec = load_job_file(args.job_file)
+    if not jobs and not models:
+        print(f"no jobs or models in {args.job_file}")
+        return 1
+    workers = args.workers if args.workers is not None else spec.get('workers')
+    report = run_jobs(jobs, models, workers, args.report, spec.get('model_overtones'),
+                      spec.get('defaults', {}).get('will_use_theoretical_vals', True))
+    if args.export_csv:
+        export_range_stats()
+    n_total = len(jobs) + len(models)
+    print(f"completed {n_total - report['n_failed']}/{n_total} jobs and models in {report['seconds']:.2f}s")
+    return 1 if report['n_failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
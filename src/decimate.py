@@ -0,0 +1,230 @@
+import numpy as np
+
+'''reduces data to what can actually be seen before plotting, so plot time depends on figure size rather than run length
+'stride' plots every 'points_plotted_index'th point as before, which can skip over spikes and steps
+'minmax' keeps the lowest and highest point of every pixel column, so spikes, steps, and noise bands keep their extent
+'lttb' (largest triangle three buckets) keeps the point of every pixel column that best preserves the shape of the curve'''
+
+DECIMATION_MODES = ('stride', 'minmax', 'lttb')
+
+
+def plot_width_px(fig, dpi, plot_customs=None, x=None):
+    """number of pixel columns data is spread across when fig is saved at dpi
+    when time bounds are set only part of the data is visible, so the budget is scaled up by the zoom
+
+    Args:
+        fig (matplotlib.figure.Figure): figure data is plotted on
+        dpi (float): resolution figure is saved at
+        plot_customs (dict, optional): plot customizations, for time bounds. Defaults to None.
+        x (array like, optional): time data, needed to account for time bounds. Defaults to None.
+
+    Returns:
+        int: pixel columns
+    """
+    width_px = fig.get_figwidth() * dpi
+    if plot_customs is not None and x is not None and len(x) > 1:
+        lower, upper = plot_customs['time_lower_bound'], plot_customs['time_upper_bound']
+        if lower != 'auto' or upper != 'auto':
+            x_min, x_max = np.nanmin(x), np.nanmax(x)
+            lower = x_min if lower == 'auto' else max(float(lower), x_min)
+            upper = x_max if upper == 'auto' else min(float(upper), x_max)
+            if upper > lower:
+                width_px *= (x_max - x_min) / (upper - lower)
+    return int(width_px)
+
+def minmax_indices(x, y, n_buckets):
+    """indices of min and max y of each of n_buckets equal width buckets of x, plus first and last points
+
+    Args:
+        x (np.ndarray): x data, no nans
+        y (np.ndarray): y data, no nans
+        n_buckets (int): number of buckets, one per pixel column
+
+    Returns:
+        np.ndarray: sorted indices of points to keep
+    """
+    n = x.shape[0]
+    x_min, x_max = x.min(), x.max()
+    if x_max == x_min:
+        buckets = np.zeros(n, dtype=np.int64)
+    else:
+        buckets = np.minimum(((x - x_min) * (n_buckets / (x_max - x_min))).astype(np.int64), n_buckets - 1)
+
+    # runs of points in the same bucket, time only increases so each bucket is one run
+    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    run_ids = np.repeat(np.arange(starts.shape[0]), np.diff(np.r_[starts, n]))
+    idxs = [np.array([0, n - 1])]
+    for run_extreme in (np.minimum.reduceat(y, starts), np.maximum.reduceat(y, starts)):
+        is_extreme = np.flatnonzero(y == run_extreme[run_ids])
+        _, first = np.unique(run_ids[is_extreme], return_index=True) # first extreme point of each run
+        idxs.append(is_extreme[first])
+    return np.unique(np.concatenate(idxs))
+
+def lttb_indices(x, y, n_out):
+    """largest triangle three buckets, indices of n_out points that keep the visual shape of the data
+    first and last points are kept, of every bucket between them the point forming the largest triangle
+    with the previously kept point and the average of the next bucket is kept
+
+    Args:
+        x (np.ndarray): x data, no nans
+        y (np.ndarray): y data, no nans
+        n_out (int): number of points to keep, one per pixel column
+
+    Returns:
+        np.ndarray: sorted indices of points to keep
+    """
+    n = x.shape[0]
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64) # bucket i is edges[i]:edges[i+1]
+    idxs = np.empty(n_out, dtype=np.int64)
+    idxs[0], idxs[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i+1]
+        next_lo, next_hi = hi, edges[i+2] if i + 2 < n_out - 1 else n
+        avg_x, avg_y = x[next_lo:next_hi].mean(), y[next_lo:next_hi].mean()
+        # twice the triangle area, constant factor does not change which is largest
+        areas = np.abs((x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a]))
+        a = lo + int(np.argmax(areas))
+        idxs[i+1] = a
+    return idxs
+
+def decimation_indices(x, ys, plot_customs, width_px):
+    """positions of points to plot, reduced as spec'd by the 'decimation' plot customization
+    with more than one y series (e.g. freq and dis plotted against each other) points kept for any of them are kept
+
+    Args:
+        x (pd.Series or np.ndarray): x data buckets are taken over, sorted (time)
+        ys (list of pd.Series or np.ndarray): y data, each the same length as x
+        plot_customs (dict): plot customization options
+        width_px (int): pixel columns x spans, from plot_width_px()
+
+    Returns:
+        slice or np.ndarray: positions to plot, a slice when striding or keeping everything
+    """
+    mode = str(plot_customs.get('decimation', 'stride')).strip().lower()
+    if mode == 'stride':
+        return slice(None, None, plot_customs['points_plotted_index']) # plot every 'xth' point
+    if mode not in DECIMATION_MODES:
+        raise ValueError(f"unknown decimation mode '{mode}', choose from {DECIMATION_MODES}")
+
+    n_buckets = max(int(width_px), 3)
+    if len(x) <= 2 * n_buckets: # already about as many points as pixels
+        return slice(None)
+
+    x_vals = np.asarray(x, dtype=float)
+    idxs = []
+    for y in ys:
+        y_vals = np.asarray(y, dtype=float)
+        # missing points are not drawn anyway
+        valid = np.isfinite(x_vals) & np.isfinite(y_vals)
+        positions = np.flatnonzero(valid)
+        if positions.shape[0] <= 2 * n_buckets:
+            idxs.append(positions)
+        elif mode == 'minmax':
+            idxs.append(positions[minmax_indices(x_vals[positions], y_vals[positions], n_buckets)])
+        else:
+            idxs.append(positions[lttb_indices(x_vals[positions], y_vals[positions], n_buckets)])
+    return idxs[0] if len(idxs) == 1 else np.unique(np.concatenate(idxs))
+
+def take(data, idxs):
+    """positional selection of series or array"""
+    if isinstance(idxs, slice):
+        return data[idxs] if idxs != slice(None) else data
+    return data.iloc[idxs] if hasattr(data, 'iloc') else data[idxs]
+
+def decimate(x, y, plot_customs, width_px):
+    """x and y to plot, reduced as spec'd by the 'decimation' plot customization, see decimation_indices()
+
+    Returns:
+        tuple: x and y to plot, same types as given
+    """
+    idxs = decimation_indices(x, [y], plot_customs, width_px)
+    return take(x, idxs), take(y, idxs)
+
+
+class MinMaxPyramid:
+    """min and max of a series precomputed over buckets of 8, 16, 32, ... points, so any range of it can be reduced
+    to about a given number of points without looking at every point in the range
+    used by the interactive plot, where the overview shows all of the data and the zoomed plot whatever range is selected
+
+    Args:
+        y (array like): data to reduce, in time order
+    """
+    MIN_BUCKET = 8 # ranges with fewer points per pixel than this are plotted in full
+
+    def __init__(self, y):
+        y = np.asarray(y, dtype=float)
+        self.n = y.shape[0]
+        idx_dtype = np.int32 if self.n < 2**31 else np.int64
+        # missing values are never a bucket's min or max
+        y_lo = np.where(np.isnan(y), np.inf, y)
+        y_hi = np.where(np.isnan(y), -np.inf, y)
+
+        # first level straight from the data, each next level from pairs of buckets of the one before it
+        self.bucket_sizes = []
+        self.mins = []
+        self.maxs = []
+        bucket = self.MIN_BUCKET
+        n_full = self.n // bucket
+        starts = np.arange(0, self.n, bucket)
+        mins = np.empty(starts.shape[0], dtype=idx_dtype)
+        maxs = np.empty(starts.shape[0], dtype=idx_dtype)
+        mins[:n_full] = y_lo[:n_full*bucket].reshape(n_full, bucket).argmin(axis=1) + starts[:n_full]
+        maxs[:n_full] = y_hi[:n_full*bucket].reshape(n_full, bucket).argmax(axis=1) + starts[:n_full]
+        if n_full < starts.shape[0]: # partial last bucket
+            mins[-1] = y_lo[n_full*bucket:].argmin() + n_full*bucket
+            maxs[-1] = y_hi[n_full*bucket:].argmax() + n_full*bucket
+        while mins.shape[0] > 1:
+            self.bucket_sizes.append(bucket)
+            self.mins.append(mins)
+            self.maxs.append(maxs)
+            mins = self.pair_extremes(mins, y_lo, np.less_equal)
+            maxs = self.pair_extremes(maxs, y_hi, np.greater_equal)
+            bucket *= 2
+
+    @staticmethod
+    def pair_extremes(idxs, y, keep_first):
+        """extremes of buckets twice the size, from extremes of consecutive pairs of buckets"""
+        firsts, seconds = idxs[0:-1:2], idxs[1::2]
+        paired = np.where(keep_first(y[firsts], y[seconds]), firsts, seconds)
+        if idxs.shape[0] % 2: # odd bucket out carries over as is
+            paired = np.append(paired, idxs[-1])
+        return paired
+
+    def query(self, imin, imax, max_points):
+        """positions of points in [imin, imax) to plot with about max_points points, keeping every min and max
+        as well as the first and last points of the range
+
+        Args:
+            imin (int): first position of range
+            imax (int): end position of range (exclusive)
+            max_points (int): about how many points to plot, i.e. twice the pixel width of the axis
+
+        Returns:
+            np.ndarray: sorted positions
+        """
+        imin, imax = max(int(imin), 0), min(int(imax), self.n)
+        if imax - imin <= max(max_points, self.MIN_BUCKET) or not self.bucket_sizes:
+            return np.arange(imin, imax)
+        # smallest buckets that give no more than max_points mins and maxes over the range
+        level = int(np.searchsorted(self.bucket_sizes, 2 * (imax - imin) / max_points))
+        parts = [np.array([imin, imax - 1])]
+        self.cover(imin, imax, min(level, len(self.bucket_sizes) - 1), parts)
+        return np.unique(np.concatenate(parts))
+
+    def cover(self, lo, hi, level, parts):
+        """extremes of whole buckets of level within [lo, hi), the partial buckets at either end from smaller levels"""
+        if hi <= lo:
+            return
+        if level < 0: # less than the smallest bucket left, take the points themselves
+            parts.append(np.arange(lo, hi))
+            return
+        bucket = self.bucket_sizes[level]
+        first, last = -(-lo // bucket), hi // bucket
+        if first >= last:
+            self.cover(lo, hi, level - 1, parts)
+            return
+        parts.append(self.mins[level][first:last])
+        parts.append(self.maxs[level][first:last])
+        self.cover(lo, first * bucket, level - 1, parts)
+        self.cover(last * bucket, hi, level - 1, parts)
@@ -0,0 +1,440 @@
+"""
+headless analysis engine, everything analyze_data() does short of the interactive plot
+takes a formatted data file (or dataframe) and an AnalysisOptions, returns cleaned data, baseline values, and figures,
+without Tk or pyplot's global figure state so it can run on machines without a display or in parallel
+"""
+
+import os
+import atexit
+from dataclasses import dataclass, field, fields
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import time
+import numpy as np
+import pandas as pd
+from matplotlib.figure import Figure
+
+import src.Exceptions as Exceptions
+from src.formatted_store import load_formatted
+from src.decimate import plot_width_px, decimation_indices, decimate, take
+from src.analyze import Analysis, get_plot_preferences, get_channels, get_num_from_string, ordinal, shift_by_slope,\
+    determine_xlabel, determine_ylabel, setup_plot, get_analysis_columns, build_time_index, find_nearest_time,\
+    clean_overtones, frame_from_block, plot_multiaxis, plot_temp_v_time, find_offset_values, map_colors, get_time_scale_divisor
+
+
+def default_channels():
+    channels = {}
+    for overtone in ['fundamental', '3rd', '5th', '7th', '9th', '11th', '13th']:
+        channels[f"{overtone}_freq"] = False
+        channels[f"{overtone}_dis"] = False
+    return {'raw': channels, 'clean': dict(channels)}
+
+@dataclass
+class AnalysisOptions:
+    """analysis settings, same names and defaults as the matching attributes of main.Input"""
+    file: str = ''
+    file_src_type: str = ''
+    is_relative_time: bool = False
+    rel_t0: float = 0
+    rel_tf: float = 0
+    abs_base_t0: time = time(0, 0, 0)
+    abs_base_tf: time = time(0, 0, 0)
+    will_plot_raw_data: bool = False
+    will_plot_clean_data: bool = False
+    will_overwrite_file: bool = False
+    will_plot_dF_dD_together: bool = False
+    will_normalize_F: bool = False
+    will_plot_dD_v_dF: bool = False
+    will_plot_temp_v_time: bool = False
+    will_correct_slope: bool = False
+    will_calculate_offset: bool = False
+    is_qsd: bool = False
+    enable_interactive_plot: bool = False
+    interactive_plot_data_fmt: dict = field(default_factory=lambda: {'raw': False, 'clean': False})
+    interactive_plot_overtone: dict = field(default_factory=lambda: {'raw': 0, 'clean': 0})
+    which_plot: dict = field(default_factory=default_channels)
+    plot_dir: str = 'qcmd-plots' # where figures are saved
+    will_save_figures: bool = True
+    will_keep_cleaned_data: bool = False # keep the unnormalized/slope corrected cleaned data even without the interactive plot
+    render_workers: int = None # processes saving figures, None for one per figure up to the number of cores, 1 to save in this process
+
+    @classmethod
+    def from_input(cls, input):
+        """options from the attributes of the UI's Input object"""
+        return cls(**{opt.name: getattr(input, opt.name) for opt in fields(cls) if hasattr(input, opt.name)})
+
+@dataclass
+class AnalysisResult:
+    """everything produced by run_analysis(), fields are None when the options did not call for them"""
+    cleaned_df: pd.DataFrame = None # baseline corrected data, time followed by freq/dis of each selected overtone
+    unnormalized_cleaned_df: pd.DataFrame = None # cleaned data with frequency not normalized, if normalizing
+    slope_corrected_cleaned_df: pd.DataFrame = None # cleaned data after slope correction, if correcting slope
+    raw_df: pd.DataFrame = None # data from t0 on, time in the plots' time scale, if plotting raw data
+    clean_x_time: tuple = None # time of frequency and of dissipation of the last cleaned overtone
+    raw_x_time: pd.Series = None
+    time_col: str = 'Time' # name of relative time column in the dataframes
+    baseline_averages: dict = field(default_factory=dict) # channel name -> baseline average subtracted from it
+    figures: dict = field(default_factory=dict) # figure name -> matplotlib Figure
+    figure_fns: dict = field(default_factory=dict) # figure name -> file it was saved to
+    render_jobs: list = field(default_factory=list) # figures waiting to be saved by render_figures()
+
+    def interactive_clean_df(self, options):
+        """cleaned data in the form the interactive plot and modeling work with
+        (unnormalized if normalizing, else slope corrected if correcting slope, else as cleaned)"""
+        if options.will_normalize_F:
+            return self.unnormalized_cleaned_df
+        elif options.will_correct_slope:
+            return self.slope_corrected_cleaned_df
+        return self.cleaned_df
+
+
+render_pool = None # kept between analyses so repeat runs from the UI do not pay for starting processes again
+render_pool_workers = 0
+
+def save_figure(options, result, name, fig, fn, plot_customs, dpi=None):
+    """keep figure in result, and queue it to be saved to the plot directory in the user's format if saving figures"""
+    result.figures[name] = fig
+    if not options.will_save_figures:
+        return
+    fig_format = plot_customs['fig_format']
+    fig_fn = os.path.join(options.plot_dir, f"{fn}.{fig_format}")
+    result.render_jobs.append((fig, fig_fn, fig_format, dpi if dpi else plot_customs['fig_dpi']))
+    result.figure_fns[name] = fig_fn
+
+def render_figure(fig, fig_fn, fig_format, dpi):
+    """save one figure, a figure pickles with all of its data and styling so this runs the same in a worker process"""
+    fig.savefig(fig_fn, format=fig_format, bbox_inches='tight', transparent=True, dpi=dpi)
+    return fig_fn
+
+def get_render_pool(workers):
+    global render_pool, render_pool_workers
+    if render_pool is None or render_pool_workers < workers:
+        if render_pool is not None:
+            render_pool.shutdown()
+        render_pool = ProcessPoolExecutor(max_workers=workers)
+        render_pool_workers = workers
+    return render_pool
+
+def shutdown_render_pool():
+    """stop the render worker processes, called on exit and when a worker died and took the pool down with it"""
+    global render_pool, render_pool_workers
+    if render_pool is not None:
+        render_pool.shutdown()
+    render_pool = None
+    render_pool_workers = 0
+
+atexit.register(shutdown_render_pool)
+
+def render_figures(options, result):
+    """save queued figures, one per worker process since drawing dense data at high dpi is most of the time spent
+
+    Args:
+        options (AnalysisOptions): analysis settings, render_workers decides how many processes save figures
+        result (AnalysisResult): result with figures queued by save_figure()
+    """
+    render_jobs, result.render_jobs = result.render_jobs, []
+    workers = options.render_workers if options.render_workers else min(len(render_jobs), os.cpu_count() or 1)
+    if workers <= 1 or len(render_jobs) <= 1:
+        for render_job in render_jobs:
+            render_figure(*render_job)
+        return
+
+    try:
+        pooled_render(get_render_pool(workers), render_jobs)
+    except BrokenProcessPool: # a worker was killed (e.g. out of memory), pool can't be used again so start a new one
+        print("render pool broken, restarting it")
+        shutdown_render_pool()
+        pooled_render(get_render_pool(workers), render_jobs) # figures already saved are just saved again
+
+def pooled_render(pool, render_jobs):
+    futures = [pool.submit(render_figure, *render_job) for render_job in render_jobs]
+    for future in futures:
+        future.result() # reraise any error saving a figure
+
+
+def run_analysis(options, data=None, reporter=None):
+    """baseline corrects and plots data as spec'd by options, see analyze_data() for the UI version
+
+    Args:
+        options (AnalysisOptions): analysis settings
+        data (pd.DataFrame, optional): formatted data to analyze instead of loading the formatted file of options.file. Defaults to None.
+        reporter (function, optional): error/warning reporter used for this run, see Exceptions.set_reporter(). Defaults to None (current reporter).
+
+    Returns:
+        AnalysisResult: cleaned data, baseline averages, and figures
+    """    
+    if reporter is not None:
+        with Exceptions.use_reporter(reporter):
+            return run_analysis(options, data)
+
+    result = AnalysisResult()
+    analysis = Analysis(options.file) # analysis object contains relevant file/data information
+    result.time_col = analysis.time_col
+    t0_str = str(options.abs_base_t0).lstrip('0') # baseline time t=0 spec'd by user
+    tf_str = str(options.abs_base_tf).lstrip('0') # baseline time t=f spec'd by user
+    # grab singular file and create dataframe from it, loading only the columns needed for selections
+    if data is None:
+        df = load_formatted(analysis.formatted_fn, get_analysis_columns(options, analysis))
+    else:
+        df = data.copy()
+    print(f"dataframe {df}")
+
+    # check missing values, distinguishing between some values in a row missing and entire rows missing
+    # some missing in a row indicates problematic data
+    # all missing is likely with qsense where there may be more values recorded for temperature
+    threshold_rows_missing = df.shape[0] * 0.001 # threshold missing rows
+    exists_some_missing = (df.isna().sum(axis=1) > threshold_rows_missing).any()
+    if exists_some_missing:
+        columns_with_missing = df.columns[df.isna().any()].tolist()
+        msg = "WARNING: There is missing data in this file. This is likely a few missing values at the start or end, no cause for concern \n" +\
+                "However it could potentially be an issue with the exporting of data or experiment itself.\n"+\
+                "You may proceed with analysis, the software will drop rows with empty values, but proceed cautiously as erroneous results may occur."+\
+                f"\n\nMISSING COLUMNS:\n{columns_with_missing}"
+        print(msg)
+        Exceptions.warning_popup(msg)
+
+    freq_color_map, dis_color_map = map_colors()
+
+    plot_customs = get_plot_preferences()
+    dpi = plot_customs['fig_dpi'] # resolution of figure from plot customization (200 default)
+
+    # cleaning data and plotting clean data
+    if options.will_plot_clean_data:
+        clean_freqs, clean_disps = get_channels(options.which_plot['clean'].items())
+        freq_plot_cap = len(clean_freqs)
+        disp_plot_cap = len(clean_disps)
+        diff = len(clean_freqs) - len(clean_disps) # account for potentially different num of freq and dis overtones
+
+        # plotting objects
+        freq_fig = Figure()
+        freq_ax = freq_fig.add_subplot(111)
+        dis_fig = Figure()
+        dis_ax = dis_fig.add_subplot(111)            
+
+        if options.will_plot_dD_v_dF:
+            disVfreq_fig = Figure()
+            disVfreq_ax = disVfreq_fig.add_subplot(111)
+
+        if options.will_plot_dF_dD_together:
+            mult_fig = Figure()
+            mult_ax1 = mult_fig.subplots()
+            mult_ax2 = mult_ax1.twinx()
+
+        if options.file_src_type != 'Qsense':
+            analysis.temp_time_col = analysis.time_col
+        if options.will_plot_temp_v_time:
+            try:
+                temperature_df = df[[analysis.temp_time_col, analysis.temp_col]].copy()
+                temperature_df.dropna(axis=0, how='any', inplace=True)
+                print(f"***\n\n {df}\n\n{temperature_df}\n\n***")
+            except Exception as e:
+                msg = f"Experiment file does not have temperature data, setting temperature values to 0.\nerr: {e}"
+                print(msg)
+                Exceptions.error_popup(msg)
+                temperature_df = df[[analysis.time_col]]
+                temperature_df[analysis.temp_col] = 0
+
+
+        # if different num of freq and raw channels, must do equal amount for plotting,
+        # but can just not plot the results later; set plot cap for the lesser
+        # diff pos -> more freq channels than disp
+        if diff > 0:
+            clean_iters = len(clean_freqs)
+
+            for i, ov in enumerate(clean_freqs):
+                if ov not in clean_disps:
+                    corr_dis = 'fundamental_dis' if ov.__contains__('fundamental') else ordinal(get_num_from_string(ov)) + '_dis'
+                    clean_disps.insert(i, corr_dis)
+
+        # diff neg -> more disp channels than freq
+        elif diff < 0:
+            clean_iters = len(clean_disps)
+            for i in range(abs(diff)):
+                clean_freqs.append(analysis.freqs[i])
+        # if length same, then iterations is length of either
+        else:
+            clean_iters = len(clean_freqs)
+            
+        # remove everything before baseline
+        # time column is parsed and sorted once, then both baseline times are binary searched
+        base_time_col = analysis.time_col if options.is_relative_time else analysis.abs_time_col
+        base_t0, base_tf = (options.rel_t0, options.rel_tf) if options.is_relative_time else (t0_str, tf_str)
+        time_index = build_time_index(df, base_time_col, options.is_relative_time)
+        base_t0_ind = find_nearest_time(base_t0, df, base_time_col, options.is_relative_time, time_index) # baseline correction
+        base_tf_ind = find_nearest_time(base_tf, df, base_time_col, options.is_relative_time, time_index) # baseline correction
+        base_tf_ind = max(base_tf_ind - base_t0_ind, 0) # relative to data after t0
+        df = df[base_t0_ind:] # baseline correction
+        df = df.reset_index(drop=True)
+        # find baseline and grab values from baseline for avg
+        baseline_df = df[:base_tf_ind].copy()
+
+        if options.will_calculate_offset:
+            find_offset_values(baseline_df)
+
+        if baseline_df.shape[0] == 0:
+            msg = f"ERROR: Found no datapoints between {options.rel_t0} and {options.rel_tf} seconds.\nPlease adjust baseline time range."
+            Exceptions.error_popup(msg)
+            return result
+
+        # baseline correct every selected channel in one pass
+        cleaned_df, clean_pairs, rf_base_avgs, dis_base_avgs = clean_overtones(df, baseline_df.shape[0], analysis.time_col,
+            clean_freqs[:clean_iters], clean_disps[:clean_iters], options.will_normalize_F, options.is_qsd,
+            get_time_scale_divisor(plot_customs['time_scale']))
+        print(f"*** Cleaned data\n{cleaned_df}")
+        result.cleaned_df = cleaned_df
+        for i in range(clean_iters):
+            result.baseline_averages[clean_freqs[i]] = rf_base_avgs[i]
+            result.baseline_averages[clean_disps[i]] = dis_base_avgs[i]
+        if options.will_normalize_F:
+            for freq in set(clean_freqs[:clean_iters]): # slope correction fits against normalized baseline
+                baseline_df[freq] /= get_num_from_string(freq)
+
+        # slope corrected data for interactive plot is written in place per overtone into one preallocated copy of the cleaned data
+        # rows are [time, freq, dis, freq, dis, ...] in the same order as cleaned_df
+        will_keep_cleaned = options.will_overwrite_file or options.enable_interactive_plot or options.will_keep_cleaned_data
+        if will_keep_cleaned and options.will_correct_slope:
+            slope_corrected_block = np.array([cleaned_df.iloc[:, j].to_numpy() for j in range(cleaned_df.shape[1])])
+
+        for i in range(clean_iters):
+            print(f"clean freq ch: {clean_freqs[i]}; clean disp ch: {clean_disps[i]}")
+            x_time, y_freq, y_dis = clean_pairs[i]
+
+            if y_freq.empty: # check for if data is missing
+                msg = f"ERROR: there is no data for either {clean_freqs[i]} or {clean_disps[i]}"+\
+                      "\nPlease either uncheck these overtones, or check file for missing data and try again"
+                Exceptions.error_popup(msg)
+                print(msg)
+                continue
+
+            if options.will_correct_slope:
+                x_time_freq, y_freq = shift_by_slope(x_time, y_freq ,baseline_df, analysis.time_col, clean_freqs[i])
+                x_time_dis, y_dis = shift_by_slope(x_time, y_dis, baseline_df, analysis.time_col, clean_disps[i])
+                if will_keep_cleaned:
+                    # pairs with gaps only fill the rows they have data for
+                    pair_pos = slice(None) if x_time.shape[0] == cleaned_df.shape[0] else cleaned_df.index.get_indexer(x_time.index)
+                    slope_corrected_block[2*i + 1, pair_pos] = y_freq
+                    slope_corrected_block[2*i + 2, pair_pos] = y_dis
+            else:
+                x_time_freq = x_time
+                x_time_dis = x_time
+
+            # PLOTTING
+            if i < freq_plot_cap:
+                freq_ax.plot(*decimate(x_time_freq, y_freq, plot_customs, plot_width_px(freq_fig, dpi, plot_customs, x_time_freq)), '.', markersize=1, label=ordinal(get_num_from_string(clean_freqs[i])), color=freq_color_map[clean_freqs[i]])
+        
+            if i < disp_plot_cap:
+                dis_ax.plot(*decimate(x_time_dis, y_dis, plot_customs, plot_width_px(dis_fig, dpi, plot_customs, x_time_dis)), '.', markersize=1, label=ordinal(get_num_from_string(clean_disps[i])), color=dis_color_map[clean_disps[i]])
+
+            # plotting change in disp vs change in freq
+            if options.will_plot_dD_v_dF:
+                # reduced in time order, keeping points either channel needs
+                dVf_idxs = decimation_indices(x_time, [y_freq, y_dis], plot_customs, plot_width_px(disVfreq_fig, dpi))
+                disVfreq_ax.plot(take(y_freq, dVf_idxs), take(y_dis, dVf_idxs), '.', markersize=1, label=ordinal(get_num_from_string(clean_freqs[i])))
+            
+            # multi axis plot for change in freq and change in dis vs time
+            if options.will_plot_dF_dD_together:
+                plot_multiaxis(options, (x_time_freq, x_time_dis), y_freq, y_dis,
+                               ordinal(get_num_from_string(clean_freqs[i])),
+                               ordinal(get_num_from_string(clean_disps[i])),
+                               mult_fig, mult_ax1, mult_ax2,freq_color_map[clean_freqs[i]])
+
+            print(f"rf average: {rf_base_avgs[i]}; dis average: {dis_base_avgs[i]}\n")
+            result.clean_x_time = (x_time_freq, x_time_dis)
+
+        if will_keep_cleaned:
+            if options.will_correct_slope:
+                slope_corrected_cleaned_df = frame_from_block(slope_corrected_block, cleaned_df.columns, cleaned_df.index)
+                result.slope_corrected_cleaned_df = slope_corrected_cleaned_df
+            if options.will_normalize_F: # need freqs NOT normalized for int plot and modeling purposes
+                unnormalized_source_df = slope_corrected_cleaned_df if options.will_correct_slope else cleaned_df
+                unnormalized_block = np.array([unnormalized_source_df.iloc[:, j].to_numpy() for j in range(cleaned_df.shape[1])])
+                overtones = np.array([get_num_from_string(freq) for freq in clean_freqs[:clean_iters]], dtype=float)
+                unnormalized_block[1::2] *= overtones[:, np.newaxis]
+                result.unnormalized_cleaned_df = frame_from_block(unnormalized_block, cleaned_df.columns, cleaned_df.index)
+
+        if options.will_plot_temp_v_time:
+            tempVtime_fig = Figure()
+            tempVtime_ax = tempVtime_fig.add_subplot(111)
+            temperature_df[analysis.temp_time_col] /= get_time_scale_divisor(plot_customs['time_scale'])
+            plot_temp_v_time(tempVtime_fig, tempVtime_ax, temperature_df[analysis.temp_time_col].values, temperature_df[analysis.temp_col].values, plot_customs['time_scale'], None)
+            save_figure(options, result, 'temp_vs_time', tempVtime_fig, "temp_vs_time_plot", plot_customs)
+
+        # Titles, lables, etc. for plots
+        rf_fig_title = "QCM-D Resonant Frequency"
+        rf_fn = os.path.join(options.plot_dir, "resonant-freq-plot")
+        fig_x = determine_xlabel(plot_customs['time_scale'])
+
+        dis_fig_title = "QCM-D Dissipation"
+        dis_fn = os.path.join(options.plot_dir, "dissipation-plot")
+
+        # format and save figures
+        setup_plot(freq_fig, freq_ax, fig_x, determine_ylabel('freq', options.will_normalize_F),
+                   rf_fig_title, rf_fn)
+        setup_plot(dis_fig, dis_ax, fig_x, determine_ylabel('dis', options.will_normalize_F),
+                   dis_fig_title, dis_fn)
+        
+        save_figure(options, result, 'frequency', freq_fig, "frequency_plot", plot_customs)
+        save_figure(options, result, 'dissipation', dis_fig, "dissipation_plot", plot_customs)
+        
+        if options.will_plot_dD_v_dF:
+            dVf_fn = os.path.join(options.plot_dir, "disp_V_freq-plot")
+            setup_plot(disVfreq_fig, disVfreq_ax, determine_ylabel('freq', options.will_normalize_F), determine_ylabel('dis', options.will_normalize_F),
+                       dis_fig_title, dVf_fn)
+            save_figure(options, result, 'disp_V_freq', disVfreq_fig, "disp_V_freq_plot", plot_customs)
+            
+
+        # saving multiaxis plot.
+        if options.will_plot_dF_dD_together:
+            box = mult_ax1.get_position()
+            mult_ax1.set_position([box.x0, box.y0 + box.height * 0.1, box.width, box.height * 0.9])
+            mult_fig.legend(loc='upper center', bbox_to_anchor=(0.5, 0.1), ncol=2, fancybox=True, shadow=True, fontsize=plot_customs['legend_text_size'], prop={'family': 'Arial'}, framealpha=0.1)
+            save_figure(options, result, 'freq_dis_V_time', mult_fig, "freq_dis_V_time", plot_customs, dpi*1.25) # slightly higher dpi for dense graph
+
+    # Gathering raw data for individual plots
+    if options.will_plot_raw_data:
+        # plot definitions
+        rf_fig_title = "RAW QCM-D Resonant Frequency"
+        fig_x = determine_xlabel(plot_customs['time_scale'])
+        dis_fig_title = "RAW QCM-D Dissipation"
+        
+        df[analysis.time_col] /= get_time_scale_divisor(plot_customs['time_scale'])
+        print(df)
+
+        raw_freqs, raw_disps = get_channels(options.which_plot['raw'].items())
+        raw_freq_fig = Figure()
+        raw_freq_ax = raw_freq_fig.add_subplot(111)
+        # gather and plot raw frequency data
+        for i in range(len(raw_freqs)):
+            freq_df = df[[analysis.time_col,raw_freqs[i]]]
+            x_time = freq_df[analysis.time_col]
+            y_freq = freq_df[raw_freqs[i]]
+        
+            raw_freq_ax.plot(*decimate(x_time, y_freq, plot_customs, plot_width_px(raw_freq_fig, dpi, plot_customs, x_time)), '.', markersize=1, label=ordinal(get_num_from_string(raw_freqs[i])), color=freq_color_map[raw_freqs[i]])
+            
+        # gather and plot raw dissipation data
+        raw_dis_fig = Figure()
+        raw_dis_ax = raw_dis_fig.add_subplot(111)
+        for i in range(len(raw_disps)):
+            dis_df = df[[analysis.time_col,raw_disps[i]]]
+            x_time = dis_df[analysis.time_col]
+            y_dis = dis_df[raw_disps[i]]
+            raw_dis_ax.plot(*decimate(x_time, y_dis, plot_customs, plot_width_px(raw_dis_fig, dpi, plot_customs, x_time)), '.', markersize=1, label=ordinal(get_num_from_string(raw_disps[i])), color=dis_color_map[raw_disps[i]])
+            
+        # save raw frequency plots
+        rf_fn = os.path.join(options.plot_dir, "RAW-resonant-freq-plot")
+        setup_plot(raw_freq_fig, raw_freq_ax, fig_x, determine_ylabel('freq', False, True), rf_fig_title, rf_fn)
+        save_figure(options, result, 'raw_frequency', raw_freq_fig, "RAW-resonant-freq-plot", plot_customs)
+
+        # save raw dissipation plots
+        dis_fn = os.path.join(options.plot_dir, "RAW-dissipation-plot")
+        setup_plot(raw_dis_fig, raw_dis_ax, fig_x, determine_ylabel('dis', False, True), dis_fig_title, dis_fn)
+        save_figure(options, result, 'raw_dissipation', raw_dis_fig, "RAW-dissipation-plot", plot_customs)
+
+        result.raw_df = df
+        result.raw_x_time = df[analysis.time_col]
+
+    render_figures(options, result)
+
+    print("*** Analysis complete ***")
+    return result
+
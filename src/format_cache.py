@@ -0,0 +1,159 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+from contextlib import contextmanager
+
+from src.formatted_store import FORMATTED_EXT, get_formatted_fn, load_formatted
+
+'''cache of formatted outputs keyed on the contents of the source file and the options that affect formatting
+lets an unchanged file skip formatting (and the slow spreadsheet parsing before it) regardless of its name or path,
+while a changed file with the same name is always reformatted'''
+
+FORMAT_CACHE_DIR = 'raw_data/.format_cache'
+FORMAT_CACHE_MAX_BYTES = 2 * 1024**3 # least recently used entries are evicted beyond this total size
+FORMAT_CACHE_VERSION = 1 # bump when formatting output changes so old entries are not reused
+FORMAT_CACHE_LOCK_STALE_S = 60 # lock file older than this was left behind by a process that died holding it
+OFFSET_FN = "offset_data/COPY-PASTE_OFFSET_VALUES_HERE.csv"
+
+
+class FormatCache:
+    """on disk cache of formatted data files with a small json index for LRU eviction
+
+    Args:
+        cache_dir (str, optional): directory holding cached files and index. Defaults to FORMAT_CACHE_DIR.
+        max_bytes (int, optional): max total size of cached files. Defaults to FORMAT_CACHE_MAX_BYTES.
+    """
+    def __init__(self, cache_dir=FORMAT_CACHE_DIR, max_bytes=FORMAT_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.index_fn = os.path.join(cache_dir, 'index.json')
+        self.lock_fn = os.path.join(cache_dir, 'index.lock')
+
+    def make_key(self, data_file, src_type, will_use_theoretical_vals, all_sensors=False, offset_fn=None):
+        """hash of source file bytes, device type, offset option, and offset file contents
+
+        Args:
+            offset_fn (str, optional): offset values file the formatting adds to the data. Defaults to None (offsets not used, so not hashed).
+
+        Returns:
+            str: hex digest identifying the formatted output of this file with these options
+        """
+        sha = hashlib.sha256()
+        with open(data_file, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                sha.update(chunk)
+        options = f"{FORMAT_CACHE_VERSION}|{os.path.splitext(data_file)[1]}|{src_type}|{will_use_theoretical_vals}|{all_sensors}"
+        sha.update(options.encode())
+        if offset_fn is not None and os.path.exists(offset_fn):
+            with open(offset_fn, 'rb') as f:
+                sha.update(f.read())
+        return sha.hexdigest()
+
+    @contextmanager
+    def lock(self):
+        """exclusive access to the index across processes, parallel format workers would otherwise overwrite each other's entries"""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        while True:
+            try:
+                fd = os.open(self.lock_fn, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                break
+            except FileExistsError:
+                try:
+                    if time.time() - os.path.getmtime(self.lock_fn) > FORMAT_CACHE_LOCK_STALE_S:
+                        os.remove(self.lock_fn)
+                except FileNotFoundError: # released in the meantime
+                    pass
+                time.sleep(0.01)
+        try:
+            yield
+        finally:
+            os.close(fd)
+            os.remove(self.lock_fn)
+
+    def load_index(self):
+        try:
+            with open(self.index_fn, 'r') as fp:
+                return json.load(fp)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def save_index(self, index):
+        # write then swap so a reader never sees a partially written index
+        tmp_fn = self.index_fn + f".{os.getpid()}.tmp"
+        with open(tmp_fn, 'w') as fp:
+            json.dump(index, fp, indent=4)
+        os.replace(tmp_fn, self.index_fn)
+
+    def cached_fn(self, key, suffix):
+        return os.path.join(self.cache_dir, f"{key}{suffix}{FORMATTED_EXT}")
+
+    def restore(self, key, file_name, export_csv=False):
+        """copy cached formatted files for key to where analysis expects them
+
+        Args:
+            key (str): cache key from make_key()
+            file_name (str): base name of data file without extension
+            export_csv (bool, optional): also write csv copies of the formatted data. Defaults to False.
+
+        Returns:
+            list of str: suffixes of the formatted files restored, None if key was not cached
+        """
+        if not os.path.exists(self.index_fn): # nothing cached yet
+            return None
+        with self.lock(): # held while copying so another process can't evict the cached files halfway through
+            index = self.load_index()
+            entry = index.get(key)
+            if entry is None:
+                return None
+            cached_fns = [self.cached_fn(key, suffix) for suffix in entry['suffixes']]
+            if not all(os.path.exists(fn) for fn in cached_fns): # evicted by another process
+                return None
+
+            for suffix, cached_fn in zip(entry['suffixes'], cached_fns):
+                shutil.copyfile(cached_fn, get_formatted_fn(f"{file_name}{suffix}"))
+
+            entry['last_used'] = time.time()
+            self.save_index(index)
+
+        if export_csv:
+            for suffix in entry['suffixes']:
+                load_formatted(get_formatted_fn(f"{file_name}{suffix}")).to_csv(get_formatted_fn(f"{file_name}{suffix}", '.csv'), index=False)
+        return entry['suffixes']
+
+    def store(self, key, file_name, suffixes=('',)):
+        """add freshly formatted files to the cache, then evict least recently used entries over the size limit
+
+        Args:
+            key (str): cache key from make_key()
+            file_name (str): base name of data file without extension
+            suffixes (tuple of str, optional): suffixes of formatted files written for this data file. Defaults to ('',).
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+        size = 0
+        for suffix in suffixes:
+            cached_fn = self.cached_fn(key, suffix)
+            shutil.copyfile(get_formatted_fn(f"{file_name}{suffix}"), cached_fn)
+            size += os.path.getsize(cached_fn)
+
+        with self.lock():
+            index = self.load_index()
+            index[key] = {'source': file_name, 'suffixes': list(suffixes), 'size': size, 'last_used': time.time()}
+            self.evict(index, keep=key)
+            self.save_index(index)
+
+    def evict(self, index, keep=None):
+        """remove least recently used entries from index and disk until total size is within max_bytes"""
+        total_size = sum(entry['size'] for entry in index.values())
+        for key in sorted(index, key=lambda k: index[k]['last_used']):
+            if total_size <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            for suffix in index[key]['suffixes']:
+                try:
+                    os.remove(self.cached_fn(key, suffix))
+                except FileNotFoundError:
+                    pass
+            total_size -= index.pop(key)['size']
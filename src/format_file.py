@@ -5,19 +5,92 @@ import sys
 import re
 from . import Exceptions
 
-from src.format_qsd import read_qsd, extract_sensor_data
+from src.format_qsd import read_qsd, extract_sensor_data, extract_all_sensors_data
+from src.formatted_store import get_formatted_fn, save_formatted, FormattedWriter
+from src.format_cache import FormatCache, OFFSET_FN
 
 '''lists of col names for frequency and dissipation to be formatted to'''
 freqs = ['fundamental_freq', '3rd_freq', '5th_freq', '7th_freq', '9th_freq', '11th_freq', '13th_freq']
 disps = ['fundamental_dis', '3rd_dis', '5th_dis', '7th_dis', '9th_dis', '11th_dis', '13th_dis']
-    
+brtd_cols = ['Time', 'abs_time', 'Temp', 'Temp_Time'] + freqs + disps
+
+'''device specific dictionaries of original column name to BraTaDio column name
+also used to only read these columns from the data file'''
+QCM_NEXT_COLS = {'Time':'abs_time', 'Relative_time':'Time',
+        'Frequency_0':freqs[0],'Dissipation_0':disps[0],
+        'Frequency_1':freqs[1], 'Dissipation_1':disps[1],
+        'Frequency_2':freqs[2], 'Dissipation_2':disps[2],
+        'Frequency_3':freqs[3], 'Dissipation_3':disps[3],
+        'Frequency_4':freqs[4], 'Dissipation_4':disps[4],
+        'Temperature':'Temp'}
+
+QCMI_COLS = {'Channel A QCM Time [sec]':'Time',
+        'Channel A Fundamental Frequency [Hz]':freqs[0],'Channel A Fundamental Dissipation [ ]':disps[0],
+        'Channel A 3. Overtone [Hz]':freqs[1], 'Channel A 3. Dissipation  [ ]':disps[1],
+        'Channel A 5. Overtone [Hz]':freqs[2], 'Channel A 5. Dissipation  [ ]':disps[2],
+        'Channel A 7. Overtone [Hz]':freqs[3], 'Channel A 7. Dissipation  [ ]':disps[3],
+        'Channel A 9. Overtone [Hz]':freqs[4], 'Channel A 9. Dissipation  [ ]':disps[4],
+        'Channel A 11. Overtone [Hz]':freqs[5], 'Channel A 11. Dissipation  [ ]':disps[5],
+        'Channel A 13. Overtone [Hz]':freqs[6], 'Channel A 13. Dissipation  [ ]':disps[6],
+        'Channel A Temp [Celsius]':'Temp'}
+
+QSENSE_COLS = {'Time_1':'Time',
+        'F_1:1':freqs[0], 'D_1:1':disps[0],
+        'F_1:3':freqs[1], 'D_1:3':disps[1],
+        'F_1:5':freqs[2], 'D_1:5':disps[2],
+        'F_1:7':freqs[3], 'D_1:7':disps[3],
+        'F_1:9':freqs[4], 'D_1:9':disps[4],
+        'F_1:11':freqs[5], 'D_1:11':disps[5],
+        'F_1:13':freqs[6], 'D_1:13':disps[6],
+        'Meas. Temp. Time':'Temp_Time', 'Tact':'Temp'}
+
+AWSENSORS_COLS = {'Time_(s)':'Time',
+        'Delta_F/n_n=3_(Hz)':freqs[1], 'Delta_D_n=3_()':disps[1],
+        'Delta_F/n_n=5_(Hz)':freqs[2], 'Delta_D_n=5_()':disps[2],
+        'Delta_F/n_n=7_(Hz)':freqs[3], 'Delta_D_n=7_()':disps[3],
+        'Delta_F/n_n=9_(Hz)':freqs[4], 'Delta_D_n=9_()':disps[4],
+        'Delta_F/n_n=11_(Hz)':freqs[5], 'Delta_D_n=11_()':disps[5]}
+
+FORMAT_CHUNK_ROWS = 250000 # rows per chunk when streaming csv/txt files through formatting
+STREAMED_EXTS = ('.csv', '.txt') # formats that can be read in chunks, excel files are read whole
+
+DEVICE_COLS = {'QCM-d': QCM_NEXT_COLS, 'QCM-i': QCMI_COLS, 'Qsense': QSENSE_COLS, 'AWSensors': AWSENSORS_COLS}
+
+
+def get_read_opts(cols_dict):
+    """turn a device rename dictionary into read_csv/read_excel arguments so only those columns are parsed
+    columns already in BraTaDio format are also kept so previously formatted files are still recognized
+
+    Args:
+        cols_dict (dict): device specific dictionary of original column name to BraTaDio column name
+
+    Returns:
+        dict: usecols and dtype keyword arguments, empty if no dictionary given (read all columns)
+    """    
+    if cols_dict is None:
+        return {}
+    keep_cols = set(cols_dict.keys()) | set(brtd_cols)
+    # everything except absolute time stamps is numeric
+    float_cols = {col: 'float64' for col, brtd_col in cols_dict.items() if brtd_col != 'abs_time'}
+    return {'usecols': lambda col: col in keep_cols, 'dtype': float_cols}
+
+def read_spreadsheet(file, ext, read_opts):
+    if ext == '.csv':
+        return pd.read_csv(file, **read_opts)
+    elif ext == '.txt':
+        return pd.read_csv(file, sep='\t', **read_opts)
+    elif ext == '.xls':
+        return pd.read_excel(file, engine='xlrd', **read_opts)
+    else:
+        return pd.read_excel(file, engine='openpyxl', **read_opts)
 
 # using the user defn file name and path (if provided) open file as dataframe
-def open_df_from_file(file):
+def open_df_from_file(file, cols_dict=None):
     """opens the file as a dataframe
 
     Args:
         file (str): global path and name of data file
+        cols_dict (dict, optional): device specific rename dictionary, if given only its columns are read. Defaults to None (all columns).
 
     Returns:
         pd.DataFrame: dataframe of opened spreadsheet file
@@ -25,16 +98,15 @@ def open_df_from_file(file):
     fn = os.path.basename(file)
     print(fn)
     fn, ext = os.path.splitext(fn)
+    read_opts = get_read_opts(cols_dict)
     
     try:
-        if ext == '.csv':
-            df = pd.read_csv(file)
-        elif ext == '.txt':
-            df = pd.read_csv(file, sep='\t')
-        elif ext == '.xls':
-            df = pd.read_excel(file, engine='xlrd')
-        elif ext =='.xlsx' or ext == '.xlsm':
-            df = pd.read_excel(file, engine='openpyxl')
+        if ext in ('.csv', '.txt', '.xls', '.xlsx', '.xlsm'):
+            try:
+                df = read_spreadsheet(file, ext, read_opts)
+            except ValueError: # some column expected as numeric has text in it, let pandas infer types instead
+                read_opts.pop('dtype', None)
+                df = read_spreadsheet(file, ext, read_opts)
         elif ext =='.qsd':
             df = extract_sensor_data(*read_qsd(file))
         else:
@@ -47,6 +119,24 @@ def open_df_from_file(file):
     
     return df
 
+def iter_df_chunks(file, cols_dict=None, chunk_rows=FORMAT_CHUNK_ROWS, use_dtypes=True):
+    """opens a csv or tab delimited txt file as an iterator of dataframes of at most chunk_rows rows
+
+    Args:
+        file (str): global path and name of data file
+        cols_dict (dict, optional): device specific rename dictionary, if given only its columns are read. Defaults to None (all columns).
+        chunk_rows (int, optional): max number of rows per chunk. Defaults to FORMAT_CHUNK_ROWS.
+        use_dtypes (bool, optional): read device columns as floats instead of letting pandas infer types. Defaults to True.
+
+    Returns:
+        pandas TextFileReader: iterable of dataframe chunks
+    """    
+    read_opts = get_read_opts(cols_dict)
+    if not use_dtypes:
+        read_opts.pop('dtype', None)
+    sep = '\t' if os.path.splitext(file)[1] == '.txt' else ','
+    return pd.read_csv(file, sep=sep, chunksize=chunk_rows, **read_opts)
+
 def extract_num_from_string(string):
     """takes string of column header and returns the overtone number it is associated with
 
@@ -74,12 +164,8 @@ def rename_cols(df, cols_dict):
     Returns:
         pd.DataFrame: dataframe post column name formatting
     """
-    relevant_cols = []
-    for col in list(cols_dict.keys()):
-        if col in df.columns:
-            relevant_cols.append(col)
-        else:
-            del cols_dict[col]
+    cols_dict = {col: brtd_col for col, brtd_col in cols_dict.items() if col in df.columns}
+    relevant_cols = list(cols_dict.keys())
     if not relevant_cols:
         msg = "Found no column headers corresponding to the selected device in data file.\n"+\
                 "Please ensure that the correct device was selected (e.g. QSense, QCMi, etc.).\n"+\
@@ -147,6 +233,35 @@ def dissipation_magnitude_adjustment(df, full_columns=False):
     return df
 
 
+def calibrate(df, calibration_df):
+    """single pass equivalent of dissipation_magnitude_adjustment(), unnormalize(), then add_offsets()
+    overtone numbers and offsets are looked up from the column headers once,
+    then all frequency and dissipation columns are scaled and offset together in one array operation
+
+    Args:
+        df (pd.DataFrame): experimental data that has had column renaming a priori
+        calibration_df (pd.DataFrame): dataframe of offset values, entered by user in window or directly into file
+
+    Returns:
+        pd.DataFrame: dataframe with dissipation on the order of 1e-6, unnormalized frequency, and offsets added
+    """    
+    cols = [col for col in df.columns if col in freqs or col in disps]
+    if not cols:
+        return df
+    # frequency is multiplied by its overtone number, dissipation by 1e-6
+    scales = np.array([extract_num_from_string(col) if col in freqs else 1e-6 for col in cols])
+    offsets = np.array([calibration_df[col].iloc[0] if col in calibration_df.columns else 0 for col in cols], dtype=float)
+
+    # one row per column so each channel is contiguous, then scale and offset in place
+    block = np.array([df[col].to_numpy(dtype=float) for col in cols])
+    block *= scales[:, np.newaxis]
+    block += offsets[:, np.newaxis]
+
+    block_rows = {col: i for i, col in enumerate(cols)}
+    return pd.DataFrame({col: block[block_rows[col]] if col in block_rows else df[col] for col in df.columns},
+                        index=df.index, copy=False)
+
+
 def format_QCM_next(df):
     """format data from openQCM-Next to fit BraTaDio execution
     renames columns
@@ -157,15 +272,7 @@ def format_QCM_next(df):
     Returns:
         pd.DataFrame: dataframe formatted to BraTaDio standard
     """    
-    renamed_cols_dict = {'Time':'abs_time', 'Relative_time':'Time',
-            'Frequency_0':freqs[0],'Dissipation_0':disps[0],
-            'Frequency_1':freqs[1], 'Dissipation_1':disps[1],
-            'Frequency_2':freqs[2], 'Dissipation_2':disps[2],
-            'Frequency_3':freqs[3], 'Dissipation_3':disps[3],
-            'Frequency_4':freqs[4], 'Dissipation_4':disps[4],
-            'Temperature':'Temp'}
-
-    fmt_df = rename_cols(df, renamed_cols_dict)
+    fmt_df = rename_cols(df, QCM_NEXT_COLS)
     
     return fmt_df
 
@@ -179,18 +286,7 @@ def format_QCMi(df):
     Returns:
         pd.DataFrame: dataframe formatted to BraTaDio standard
     """    
-    print("QCM-i selected")
-    renamed_cols_dict = {'Channel A QCM Time [sec]':'Time',
-            'Channel A Fundamental Frequency [Hz]':freqs[0],'Channel A Fundamental Dissipation [ ]':disps[0],
-            'Channel A 3. Overtone [Hz]':freqs[1], 'Channel A 3. Dissipation  [ ]':disps[1],
-            'Channel A 5. Overtone [Hz]':freqs[2], 'Channel A 5. Dissipation  [ ]':disps[2],
-            'Channel A 7. Overtone [Hz]':freqs[3], 'Channel A 7. Dissipation  [ ]':disps[3],
-            'Channel A 9. Overtone [Hz]':freqs[4], 'Channel A 9. Dissipation  [ ]':disps[4],
-            'Channel A 11. Overtone [Hz]':freqs[5], 'Channel A 11. Dissipation  [ ]':disps[5],
-            'Channel A 13. Overtone [Hz]':freqs[6], 'Channel A 13. Dissipation  [ ]':disps[6],
-            'Channel A Temp [Celsius]':'Temp'}
-    
-    fmt_df = rename_cols(df, renamed_cols_dict)
+    fmt_df = rename_cols(df, QCMI_COLS)
 
     return fmt_df
 
@@ -205,27 +301,12 @@ def format_Qsense(df, calibration_df=pd.DataFrame({})):
     Returns:
         pd.DataFrame: dataframe formatted to BraTaDio standard
     """    
-    print("Qsense selected")
-
-    renamed_cols_dict = {'Time_1':'Time',
-        'F_1:1':freqs[0], 'D_1:1':disps[0],
-        'F_1:3':freqs[1], 'D_1:3':disps[1],
-        'F_1:5':freqs[2], 'D_1:5':disps[2],
-        'F_1:7':freqs[3], 'D_1:7':disps[3],
-        'F_1:9':freqs[4], 'D_1:9':disps[4],
-        'F_1:11':freqs[5], 'D_1:11':disps[5],
-        'F_1:13':freqs[6], 'D_1:13':disps[6],
-        'Meas. Temp. Time':'Temp_Time', 'Tact':'Temp'}
-
-    df = rename_cols(df, renamed_cols_dict)
+    df = rename_cols(df, QSENSE_COLS)
 
     if calibration_df.empty:
-        print("Opting for theoretical values, calibration values will NOT be added to data")
         return df
     
-    df = dissipation_magnitude_adjustment(df)    
-    df = unnormalize(df)
-    df = add_offsets(calibration_df, df)
+    df = calibrate(df, calibration_df)
 
     return df
 
@@ -239,25 +320,13 @@ def format_AWSensors(df, calibration_df):
     Returns:
         pd.DataFrame: dataframe formatted to BraTaDio standard
     """    
-    print("AWSensors selected")
-
-    renamed_cols_dict = {'Time_(s)':'Time',
-        'Delta_F/n_n=3_(Hz)':freqs[1], 'Delta_D_n=3_()':disps[1],
-        'Delta_F/n_n=5_(Hz)':freqs[2], 'Delta_D_n=5_()':disps[2],
-        'Delta_F/n_n=7_(Hz)':freqs[3], 'Delta_D_n=7_()':disps[3],
-        'Delta_F/n_n=9_(Hz)':freqs[4], 'Delta_D_n=9_()':disps[4],
-        'Delta_F/n_n=11_(Hz)':freqs[5], 'Delta_D_n=11_()':disps[5]}
-
-    fmt_df = rename_cols(df, renamed_cols_dict)
+    fmt_df = rename_cols(df, AWSENSORS_COLS)
 
     if calibration_df.empty:
-        print("Opting for theoretical values, calibration values will NOT be added to data")
         return fmt_df
     
 
-    fmt_df = dissipation_magnitude_adjustment(fmt_df)    
-    fmt_df = unnormalize(fmt_df)
-    fmt_df = add_offsets(calibration_df, fmt_df)
+    fmt_df = calibrate(fmt_df, calibration_df)
 
     return fmt_df
 
@@ -293,23 +362,169 @@ def check_file_previously_formatted(df, ext):
         return False
 
 
-def format_raw_data(src_type, data_file, will_use_theoretical_vals):
+def format_qsd_all_sensors(data_file, file_name, export_csv=False):
+    """formats every sensor of a multi sensor .qsd file from a single parse
+    first sensor is saved to the usual formatted file so analysis picks it up by default,
+    remaining sensors are saved alongside it with a '_sensor<n>' suffix
+
+    Args:
+        data_file (str): .qsd file path/name
+        file_name (str): base name of data file without extension
+        export_csv (bool, optional): also save formatted data as csv. Defaults to False.
+
+    Returns:
+        list of str: file name suffixes of the formatted files written
+    """    
+    sensor_dfs = extract_all_sensors_data(*read_qsd(data_file))
+    sensor_suffixes = []
+    for sensor, sensor_df in sensor_dfs.items():
+        sensor_suffix = '' if sensor == 1 else f"_sensor{sensor}"
+        print(f"*** Sensor {sensor} after formatting\n{sensor_df}")
+        save_formatted(sensor_df, get_formatted_fn(f"{file_name}{sensor_suffix}"), export_csv)
+        sensor_suffixes.append(sensor_suffix)
+
+    return sensor_suffixes
+
+def get_calibration_df(src_type, ext, will_use_theoretical_vals):
+    """offset values to add to data, empty if theoretical values are used or the device does not need them"""
+    if src_type == 'Qsense' and ext == '.qsd':
+        return open_df_from_file(OFFSET_FN)
+    elif (src_type == 'Qsense' or src_type == 'AWSensors') and not will_use_theoretical_vals:
+        return open_df_from_file(OFFSET_FN)
+    return pd.DataFrame()
+
+def print_device_selected(src_type, ext, calibration_df):
+    """device specific formatting messages, printed once per file rather than once per chunk formatted"""
+    if src_type == 'Qsense' and ext == '.qsd': # qsd data is formatted while it is read
+        return
+    if src_type in ('QCM-i', 'Qsense', 'AWSensors'):
+        print(f"{src_type} selected")
+    if src_type in ('Qsense', 'AWSensors') and calibration_df.empty:
+        print("Opting for theoretical values, calibration values will NOT be added to data")
+
+def format_df(src_type, df, ext, calibration_df):
+    """calls the formatting function of the device that recorded the data
+
+    Args:
+        src_type (str): indicates selection from UI regarding which device recorded the given data
+        df (pd.DataFrame): experimental data as opened from file (or one chunk of it)
+        ext (str): data file extension
+        calibration_df (pd.DataFrame): offset values from get_calibration_df()
+
+    Returns:
+        pd.DataFrame: dataframe formatted to BraTaDio standard, None if device columns were not found
+    """    
+    if src_type == 'QCM-d':
+        return format_QCM_next(df)
+    elif src_type == 'QCM-i':
+        return format_QCMi(df)
+    elif src_type == 'Qsense' and ext == '.qsd':
+        return df
+    elif src_type == 'Qsense':
+        return format_Qsense(df, calibration_df)
+    elif src_type == 'AWSensors':
+        return format_AWSensors(df, calibration_df)
+    else:
+        print("invalid option selected")
+
+class ColumnTypeError(Exception):
+    """a device column read as float has text in it"""
+    pass
+
+def raise_column_type_errors(chunks):
+    """pass chunks through, turning read_csv failing to convert a column to float into ColumnTypeError
+    errors raised while formatting a chunk happen outside of this generator, so they are never mistaken for it"""
+    try:
+        yield from chunks
+    except ValueError as e:
+        raise ColumnTypeError(e) from e
+
+def format_stream(src_type, data_file, file_name, ext, will_use_theoretical_vals, export_csv=False, chunk_rows=FORMAT_CHUNK_ROWS):
+    """formats a csv/txt file chunk by chunk, appending each formatted chunk to the formatted output
+    all formatting steps act row by row, so peak memory depends on chunk_rows rather than file size
+
+    Args:
+        src_type (str): indicates selection from UI regarding which device recorded the given data
+        data_file (str): data file path/name
+        file_name (str): base name of data file without extension
+        ext (str): data file extension, one of STREAMED_EXTS
+        will_use_theoretical_vals (bool): indicates to use experimental (from user) or theoretical (from file) offset values
+        export_csv (bool, optional): also save formatted data as csv. Defaults to False.
+        chunk_rows (int, optional): max number of rows formatted at a time. Defaults to FORMAT_CHUNK_ROWS.
+
+    Returns:
+        bool: True if formatted data was written, False if formatting failed
+    """    
+    calibration_df = get_calibration_df(src_type, ext, will_use_theoretical_vals)
+    print_device_selected(src_type, ext, calibration_df)
+    for use_dtypes in (True, False): # if a device column turns out to have text in it, start over with inferred types
+        writer = FormattedWriter(get_formatted_fn(file_name), export_csv)
+        chunks = iter_df_chunks(data_file, DEVICE_COLS.get(src_type), chunk_rows, use_dtypes)
+        try:
+            for i, chunk in enumerate(raise_column_type_errors(chunks) if use_dtypes else chunks):
+                if i == 0:
+                    print(f"*** Before formatting (first {chunk.shape[0]} rows)\n{chunk}")
+                    is_preformatted = check_file_previously_formatted(chunk, ext)
+                formatted_chunk = chunk if is_preformatted else format_df(src_type, chunk, ext, calibration_df)
+                if formatted_chunk is None:
+                    writer.discard()
+                    return False
+                if i == 0:
+                    print(f"*** After formatting (first {formatted_chunk.shape[0]} rows)\n{formatted_chunk}")
+                writer.write(formatted_chunk)
+        except ColumnTypeError:
+            writer.discard()
+            continue
+        except BaseException:
+            writer.discard()
+            raise
+        writer.close()
+        print(f"{file_name}: formatted {writer.n_rows} rows")
+        return True
+
+def format_raw_data(src_type, data_file, will_use_theoretical_vals, all_sensors=False, export_csv=False):
     """main function for data formatting/column header renaming
     determines which file is being worked with and calls functions appropriately
+    formatted data is saved in binary format to raw_data/Formatted-<file name>.npz
+    files previously formatted with the same contents and options are restored from the format cache instead
 
     Args:
         src_type (str): indicates selection from UI regarding which device recorded the given data
         data_file (str): data file path/name
         will_use_theoretical_vals (bool): indicates to use experimental (from user) or theoretical (from file) offset values
+        all_sensors (bool, optional): for 4 sensor QSense .qsd files, format every sensor instead of only the first. Defaults to False.
+        export_csv (bool, optional): also save formatted data as raw_data/Formatted-<file name>.csv. Defaults to False.
+
+    Returns:
+        list of str: paths of the formatted files written, empty if nothing was formatted
     """    
     file_name, ext = os.path.splitext(data_file)
     file_name = os.path.basename(file_name)
-    # check if file has already been formatted previously
-    if data_file.__contains__("Formatted"):
-        print(f"{file_name} has been formatted previously, using previously formatted file...")
-        return
-    
-    data_df = open_df_from_file(data_file)
+    # skip formatting entirely if this exact file was formatted before with the same options, regardless of its name
+    # previously formatted files are recognized by their column headers (check_file_previously_formatted()) and cached the same way
+    all_sensors = all_sensors and ext == '.qsd'
+    format_cache = FormatCache()
+    # offset values only change spreadsheets from devices that are calibrated with them, see get_calibration_df() and format_df()
+    uses_offsets = src_type in ('Qsense', 'AWSensors') and ext != '.qsd' and not will_use_theoretical_vals
+    cache_key = format_cache.make_key(data_file, src_type, will_use_theoretical_vals, all_sensors, OFFSET_FN if uses_offsets else None)
+    cached_suffixes = format_cache.restore(cache_key, file_name, export_csv)
+    if cached_suffixes is not None:
+        print(f"{file_name} unchanged since last formatted, using cached formatted data...")
+        return [get_formatted_fn(f"{file_name}{suffix}") for suffix in cached_suffixes]
+
+    if all_sensors:
+        sensor_suffixes = format_qsd_all_sensors(data_file, file_name, export_csv)
+        format_cache.store(cache_key, file_name, sensor_suffixes)
+        return [get_formatted_fn(f"{file_name}{suffix}") for suffix in sensor_suffixes]
+
+    if ext in STREAMED_EXTS:
+        if not format_stream(src_type, data_file, file_name, ext, will_use_theoretical_vals, export_csv):
+            return []
+        format_cache.store(cache_key, file_name)
+        return [get_formatted_fn(file_name)]
+
+    # only parse the columns the selected device's formatting will keep
+    data_df = open_df_from_file(data_file, DEVICE_COLS.get(src_type))
 
     # check if column headers match BraTaDio fmt
     is_preformatted = check_file_previously_formatted(data_df, ext)
@@ -318,27 +533,18 @@ def format_raw_data(src_type, data_file, will_use_theoretical_vals):
 
     else:
         print(f"*** Before formatting\n{data_df}")
-        if src_type == 'QCM-d':
-            formatted_df = format_QCM_next(data_df)
-        elif src_type == 'QCM-i':
-            formatted_df = format_QCMi(data_df)
-        elif src_type == 'Qsense' and ext == '.qsd':
-            calibration_df = open_df_from_file("offset_data/COPY-PASTE_OFFSET_VALUES_HERE.csv")
-            formatted_df = data_df
-        elif src_type == 'Qsense' or src_type == 'AWSensors':
-            if not will_use_theoretical_vals:
-                calibration_df = open_df_from_file("offset_data/COPY-PASTE_OFFSET_VALUES_HERE.csv")
-            else:
-                calibration_df = pd.DataFrame()
-            formatted_df = format_Qsense(data_df, calibration_df) if src_type == 'Qsense' else format_AWSensors(data_df, calibration_df)
-        else:
-            print("invalid option selected")
+        calibration_df = get_calibration_df(src_type, ext, will_use_theoretical_vals)
+        print_device_selected(src_type, ext, calibration_df)
+        formatted_df = format_df(src_type, data_df, ext, calibration_df)
+        if formatted_df is None:
+            return []
 
     
     print(file_name)
     print(f"*** After formatting\n{formatted_df}")
-    formatted_df.to_csv(f"raw_data/Formatted-{file_name}.csv", index=False)
-
+    save_formatted(formatted_df, get_formatted_fn(file_name), export_csv)
+    format_cache.store(cache_key, file_name)
+    return [get_formatted_fn(file_name)]
 
 if __name__ == '__main__':
     format_raw_data('Qsense', 'sample_generations/2020-02-05-Col-I only with wash.qsd', False)
@@ -1,3 +1,5 @@
+import os
+import mmap
 import struct
 import numpy as np
 from matplotlib import pyplot as plt # for demo only: remove otherwise
@@ -5,12 +7,54 @@ import pandas as pd
 
 from src.analyze import ordinal
 
-def read_qsd(filename):
+def open_qsd_buffer(filename):
+    """memory map a .qsd file read only, so data blocks can be viewed in place
+    instead of reading the whole file into memory
+
+    Args:
+        filename (str): path and name of .qsd file
+
+    Returns:
+        mmap.mmap: read only map of the entire file
+    """    
     with open(filename, 'rb') as f:
-        d = f.read()
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+def qsd_block(d, pointer, n):
+    """zero copy view of n little endian doubles starting at byte offset pointer
+    the view keeps the underlying buffer alive for as long as it is referenced
+    """    
+    return np.frombuffer(d, dtype='<f8', count=n, offset=pointer)
+
+def read_uint(d, pointer):
+    """little endian unsigned int (block lengths) at byte offset pointer"""
+    return struct.unpack_from('<I', d, pointer)[0]
+
+QSD_HEADER = bytes("XtalDriveTimeFloat".encode('ascii'))
+
+def find_qsd_header(d):
+    """byte offset of the sensor header that the data blocks follow"""
+    nmodes = d.rfind(QSD_HEADER) # r = start from end
+    if nmodes == -1:
+        raise Exception("Could not find sensor header, aborting")
+    return nmodes
+
+def scan_qsd(d, nmodes=None):
+    """first pass over a .qsd buffer, walks the block headers to locate every data block without decoding any values
+    blocks are ordered the same as the rows returned by read_qsd:
+    [overtone1 sensor1], [overtone2 sensor1], ... , [overtone_n sensor_ns]
 
-    reslen=[]
-    nmodes = d.rindex(bytes("XtalDriveTimeFloat".encode('ascii'))) # r = start from end
+    Args:
+        d (bytes-like): contents of .qsd file, typically from open_qsd_buffer()
+        nmodes (int, optional): offset of the sensor header from find_qsd_header(), if already known. Defaults to None (search for it).
+
+    Returns:
+        blocks (list of tuples): (time offset, time length, freq offset, dis offset, freq/dis length) for each block
+        ns (int): num sensors
+    """    
+    blocks = []
+    if nmodes is None:
+        nmodes = find_qsd_header(d)
 
     pointer = nmodes + 30
     nsensors = d[pointer]
@@ -20,13 +64,13 @@ def read_qsd(filename):
         raise Exception("Invalid number of sensors, aborting")
     
     pointer += 4
-    n = struct.unpack('<I', d[pointer:pointer+4])[0]
+    n = read_uint(d, pointer)
     pointer += 4     # skip length information
     pointer += (4 * nsensors)
     if d[pointer] != 0xee:
         raise Exception("Invalid value: != 0xee")
     pointer += 16
-    newn = struct.unpack('<I', d[pointer:pointer+4])[0]
+    newn = read_uint(d, pointer)
     if newn != n+1:
         raise Exception("Invalid size repetition")
     pointer += 4     # skip length information
@@ -39,68 +83,84 @@ def read_qsd(filename):
         raise Exception("Invalid value: != 0x0b")
     
     pointer += 6
-    val = struct.unpack('<{}d'.format(n), d[pointer:pointer+n*8])
-    val = np.array(val)
-    tim = (val - val[0])*86400;
+    tim_pointer, tim_n = pointer, n
     
     pointer += n*8-1+8*1+3
-    n = struct.unpack('<I', d[pointer:pointer+4])[0]
-    reslen.append(n)
+    n = read_uint(d, pointer)
     pointer += 4
-    val = struct.unpack('<{}d'.format(n), d[pointer:pointer+n*8])
-    fre = np.array(val)
+    fre_pointer = pointer
     
     pointer += n*8-1
     pointer += 7
-    val = struct.unpack('<{}d'.format(n), d[pointer:pointer+n*8])
-    dis = np.array(val)
+    blocks.append((tim_pointer, tim_n, fre_pointer, pointer, n))
     
     pointer += n*8-1
     while True:
         pointer += 9
-        n = struct.unpack('<I', d[pointer:pointer+4])[0]
+        n = read_uint(d, pointer)
         
         if n == 0:
             nsensors -= 1
             pointer += 40
-            n = struct.unpack('<I', d[pointer:pointer+4])[0]
+            n = read_uint(d, pointer)
             
             if nsensors == 0:
                 break
         
-        reslen.append(n)
         pointer -= 2
         pointer += 3*8
-        val = np.array(struct.unpack('<{}d'.format(n), d[pointer:pointer+n*8]))
-        timtmp = (val - val[0]) * 86400 
-        if (len(timtmp)<max(np.shape((tim)))):
-            timtmp=np.append(timtmp,0)
-        if (len(timtmp)>max(np.shape((tim)))):
-            tim=np.append(tim,0)
-        tim=np.vstack([tim,timtmp])
+        tim_pointer, tim_n = pointer, n
         
         pointer += n*8-1
         pointer += 3
-        n = struct.unpack('<I', d[pointer:pointer+4])[0]
+        n = read_uint(d, pointer)
         
         pointer += 4
-        val = struct.unpack('<{}d'.format(n), d[pointer:pointer+n*8])
-        val = np.array(val)
-        if (len(val)<max(np.shape((fre)))):
-            val=np.append(val,0)
-        fre=np.vstack([fre,val])        
+        fre_pointer = pointer
         
         pointer += n*8-1
         pointer += 7
-        val = struct.unpack('<{}d'.format(n), d[pointer:pointer+n*8])
-        if (len(val)<max(np.shape((dis)))):
-            val=np.append(val,0)
-        dis=np.vstack([dis,val])        
+        blocks.append((tim_pointer, tim_n, fre_pointer, pointer, n))
 
         pointer += n*8-1
+    return blocks, ns
+
+def read_qsd(filename):
+    """decode all time, frequency, and dissipation blocks of a .qsd file
+    block locations are found first with scan_qsd(), then each quantity is copied once into a preallocated 2d array
+    blocks shorter than the longest block are padded at the end with 0s
+
+    Args:
+        filename (str): path and name of .qsd file
+
+    Returns:
+        tim (np.Array): time in seconds from the start of each block, one row per block
+        fre (np.Array): frequency values, one row per block
+        dis (np.Array): dissipation values, one row per block
+        reslen (list of int): num of entries in each block
+        ns (int): num sensors
+    """    
+    # every block is copied into the arrays below, so the map can be closed once they are filled
+    with open_qsd_buffer(filename) as d:
+        blocks, ns = scan_qsd(d)
+
+        nblocks = len(blocks)
+        tim = np.zeros((nblocks, max(block[1] for block in blocks)))
+        fre = np.zeros((nblocks, max(block[4] for block in blocks)))
+        dis = np.zeros_like(fre)
+        reslen = []
+
+        for i, (tim_pointer, tim_n, fre_pointer, dis_pointer, n) in enumerate(blocks):
+            tim[i, :tim_n] = qsd_block(d, tim_pointer, tim_n)
+            tim[i, :tim_n] -= tim[i, 0]
+            tim[i, :tim_n] *= 86400
+            fre[i, :n] = qsd_block(d, fre_pointer, n)
+            dis[i, :n] = qsd_block(d, dis_pointer, n)
+            reslen.append(n)
+
     return tim, fre, dis, reslen, ns
 
-def extract_sensor_data(time,freq,dis,reslen,ns):
+def extract_sensor_data(time,freq,dis,reslen,ns,sensor=0):
     """take the formatted raw qsd file and put it into a dataframe, into a csv for later use
     time, freq, dis are 2d arrs as follows:
     arr -> [ [overtone1 sensor1], [overtone2 sensor1], ... ,
@@ -112,26 +172,27 @@ def extract_sensor_data(time,freq,dis,reslen,ns):
         dis (np.Array): formatted dissipation values from raw .qsd
         reslen (int): reslen is num of total entries (ns * n overtones)
         ns (int): num sensors
+        sensor (int, optional): 0 based index of sensor to extract. Defaults to 0 (first sensor).
 
     Returns:
-        _type_: _description_
+        pd.DataFrame: time, frequency, and dissipation columns of the given sensor in BraTaDio format
     """    
     df = pd.DataFrame()
     reslen = len(reslen)
     n_overtones = int(reslen / ns)
+    first_row = sensor * n_overtones # rows of each sensor are contiguous
 
     # ensure lengths are consistent (time and data may be offset by 1)
-    if len(time[0]) < len(freq[0]) and len(time[0]) < len(dis[0]):
-        global_time = np.insert(time[0], 0, 0)
+    if len(time[first_row]) < len(freq[first_row]) and len(time[first_row]) < len(dis[first_row]):
+        global_time = np.insert(time[first_row], 0, 0)
     else:
-        global_time = time[0]    
+        global_time = time[first_row]    
     df["Time"] = global_time
 
-    # devices use either 1 or 4 sensors, use only 1 sensor
     for i in range(n_overtones):
         cur_overtone = 'fundamental' if i == 0 else ordinal(i * 2 + 1)
-        df[f"{cur_overtone}_freq"] = freq[i]
-        df[f"{cur_overtone}_dis"] = dis[i]
+        df[f"{cur_overtone}_freq"] = freq[first_row + i]
+        df[f"{cur_overtone}_dis"] = dis[first_row + i]
 
     # remove 0 entries
     df = df.loc[(df >= 1e-8).all(axis=1)]
@@ -139,6 +200,95 @@ def extract_sensor_data(time,freq,dis,reslen,ns):
     print(df.head)    
     return df
 
+def extract_all_sensors_data(time,freq,dis,reslen,ns):
+    """extract every sensor of a single read_qsd() parse, rather than only the first
+
+    Args:
+        same as extract_sensor_data()
+
+    Returns:
+        dict (int:pd.DataFrame): 1 based sensor number mapped to that sensor's dataframe
+    """    
+    return {sensor + 1: extract_sensor_data(time, freq, dis, reslen, ns, sensor) for sensor in range(ns)}
+
+class QsdTail:
+    """incremental reader for a .qsd file that is still being recorded
+    remembers how many samples of each block have been decoded,
+    so each poll only decodes what was appended since the previous poll
+
+    Args:
+        filename (str): path and name of .qsd file being recorded
+        sensor (int, optional): 0 based index of sensor to follow. Defaults to 0 (first sensor).
+    """    
+    def __init__(self, filename, sensor=0):
+        self.filename = filename
+        self.sensor = sensor
+        self.file_size = 0
+        self.blocks = [] # block offsets found on the last poll
+        self.n_decoded = 0 # rows already handed back
+        self.t0 = None # first timestamp of the time block, all times are relative to it
+        self.columns = None
+        self.nmodes = None # sensor header offset, searching for it reads most of the file so it is only done once
+
+    def reset(self):
+        """start over from the beginning of the file, e.g. if the file was replaced"""
+        self.file_size = 0
+        self.blocks = []
+        self.n_decoded = 0
+        self.t0 = None
+        self.nmodes = None
+
+    def poll(self):
+        """decode rows appended since the last poll
+
+        Returns:
+            pd.DataFrame: new rows in the same column layout as extract_sensor_data(), empty if nothing new
+        """    
+        file_size = os.path.getsize(self.filename)
+        if file_size < self.file_size: # file was truncated or rewritten
+            self.reset()
+        if file_size == self.file_size:
+            return pd.DataFrame(columns=self.columns)
+
+        # map is closed again before returning, values handed back are copied out of it
+        with open_qsd_buffer(self.filename) as d:
+            # header stays in place as data is appended, so only the block lengths after it are walked again
+            if self.nmodes is None or d[self.nmodes:self.nmodes + len(QSD_HEADER)] != QSD_HEADER:
+                self.nmodes = find_qsd_header(d)
+            blocks, ns = scan_qsd(d, self.nmodes)
+            n_overtones = len(blocks) // ns
+            self.blocks = blocks[self.sensor * n_overtones:(self.sensor + 1) * n_overtones]
+            self.file_size = file_size
+
+            # time may be recorded with 1 less sample than the data, see extract_sensor_data()
+            tim_pointer, tim_n = self.blocks[0][:2]
+            time_shift = 1 if max(block[1] for block in blocks) < max(block[4] for block in blocks) else 0
+            # only hand back rows that are complete for every overtone
+            n_rows = min(min(block[4] for block in self.blocks), tim_n + time_shift)
+            if n_rows <= self.n_decoded:
+                return pd.DataFrame(columns=self.columns)
+
+            if self.t0 is None and tim_n > 0: # no time recorded yet if the data leads the time
+                self.t0 = qsd_block(d, tim_pointer, 1)[0]
+            rows = np.arange(self.n_decoded, n_rows)
+            time = np.zeros(rows.size)
+            has_time = rows >= time_shift
+            first_time = rows[has_time][0] - time_shift if has_time.any() else 0
+            time[has_time] = (qsd_block(d, tim_pointer + first_time * 8, has_time.sum()) - self.t0) * 86400
+
+            df = pd.DataFrame({"Time": time}, index=rows)
+            for i, (_, _, fre_pointer, dis_pointer, _) in enumerate(self.blocks):
+                cur_overtone = 'fundamental' if i == 0 else ordinal(i * 2 + 1)
+                df[f"{cur_overtone}_freq"] = qsd_block(d, fre_pointer + self.n_decoded * 8, rows.size).copy()
+                df[f"{cur_overtone}_dis"] = qsd_block(d, dis_pointer + self.n_decoded * 8, rows.size).copy()
+
+        self.n_decoded = n_rows
+        self.columns = df.columns
+
+        # remove 0 entries
+        return df.loc[(df >= 1e-8).all(axis=1)]
+
+
 if __name__ == '__main__':
     [tim,fre,dis,reslen,ns]=read_qsd("raw_data/qsense_bsa/BSA.1mgml-1.280723.qsd")
 
@@ -0,0 +1,134 @@
+import os
+import shutil
+import zipfile
+import tempfile
+import numpy as np
+import pandas as pd
+
+'''formatted data is stored as a typed binary .npz with one array per column,
+so analysis can load only the columns it needs without any float to text round trip
+CSV can still be exported alongside it for users that want to open the formatted data elsewhere'''
+
+FORMATTED_DIR = 'raw_data'
+FORMATTED_EXT = '.npz'
+
+
+def get_formatted_fn(file_name, ext=FORMATTED_EXT):
+    """file path of formatted data for a given data file name (without extension)"""
+    return os.path.join(FORMATTED_DIR, f"Formatted-{file_name}{ext}")
+
+def find_formatted_fn(file_name):
+    """locate previously formatted data for a data file name (without extension)
+    binary format is preferred, falling back to formatted csv from older versions or exports
+
+    Args:
+        file_name (str): base name of the original data file
+
+    Returns:
+        str: path of formatted data, binary path if neither exists yet
+    """
+    binary_fn = get_formatted_fn(file_name)
+    csv_fn = get_formatted_fn(file_name, '.csv')
+    if not os.path.exists(binary_fn) and os.path.exists(csv_fn):
+        return csv_fn
+    return binary_fn
+
+def column_array(col):
+    """numpy array of a formatted column as it is stored, text columns (such as absolute time) as fixed width unicode"""
+    if not pd.api.types.is_numeric_dtype(col):
+        return col.fillna('').astype(str).to_numpy(dtype=str)
+    return col.to_numpy()
+
+def save_formatted(df, fn, export_csv=False):
+    """save formatted dataframe column by column in binary format
+
+    Args:
+        df (pd.DataFrame): formatted data in BraTaDio column format
+        fn (str): output path, ending in .npz
+        export_csv (bool, optional): also write a csv copy next to it with the same name. Defaults to False.
+    """
+    columns = {col: column_array(df[col]) for col in df.columns}
+    np.savez(fn, **columns)
+
+    if export_csv:
+        df.to_csv(os.path.splitext(fn)[0] + '.csv', index=False)
+
+def load_formatted(fn, columns=None):
+    """open formatted data as a dataframe, reading only the requested columns
+
+    Args:
+        fn (str): path of formatted data, either .npz or .csv
+        columns (list of str, optional): columns to load, ones not in the file are skipped. Defaults to None (all columns).
+
+    Returns:
+        pd.DataFrame: formatted data with columns in file order
+    """
+    if os.path.splitext(fn)[1] == '.csv':
+        if columns is None:
+            return pd.read_csv(fn)
+        return pd.read_csv(fn, usecols=lambda col: col in columns)
+
+    with np.load(fn) as npz:
+        load_cols = [col for col in npz.files if columns is None or col in columns]
+        df = pd.DataFrame({col: npz[col] for col in load_cols})
+
+    for col in df.columns:
+        if not pd.api.types.is_numeric_dtype(df[col]): # restore empty text entries as missing values
+            df[col] = df[col].replace('', np.nan)
+    return df
+
+
+class FormattedWriter:
+    """writes formatted data one chunk of rows at a time, for files too big to format in memory
+    each chunk's columns are spooled to a temporary directory, close() then writes them into the same .npz
+    layout as save_formatted() so only one chunk is ever held in memory
+
+    Args:
+        fn (str): output path, ending in .npz
+        export_csv (bool, optional): also write a csv copy next to it with the same name. Defaults to False.
+    """
+    def __init__(self, fn, export_csv=False):
+        self.fn = fn
+        self.csv_fn = os.path.splitext(fn)[0] + '.csv' if export_csv else None
+        self.spool_dir = tempfile.mkdtemp(prefix='formatted_', dir=os.path.dirname(fn) or None)
+        self.columns = None
+        self.chunk_dtypes = [] # per chunk, dict of column name to dtype of that chunk
+        self.n_rows = 0
+
+    def chunk_fn(self, i, col_i):
+        return os.path.join(self.spool_dir, f"{i}_{col_i}.npy")
+
+    def write(self, df):
+        """append rows of formatted dataframe, columns must match those of the first chunk written"""
+        if self.columns is None:
+            self.columns = list(df.columns)
+        i = len(self.chunk_dtypes)
+        dtypes = {}
+        for col_i, col in enumerate(self.columns):
+            arr = column_array(df[col])
+            np.save(self.chunk_fn(i, col_i), arr)
+            dtypes[col] = arr.dtype
+        self.chunk_dtypes.append(dtypes)
+        self.n_rows += df.shape[0]
+
+        if self.csv_fn is not None:
+            df.to_csv(self.csv_fn, mode='w' if i == 0 else 'a', header=(i == 0), index=False)
+
+    def close(self):
+        """assemble spooled chunks into the final .npz, each column cast to one dtype across all chunks
+        (e.g. widest absolute time string) and streamed chunk by chunk into its archive member"""
+        try:
+            with zipfile.ZipFile(self.fn, 'w', compression=zipfile.ZIP_STORED, allowZip64=True) as zf:
+                for col_i, col in enumerate(self.columns or []):
+                    dtype = np.result_type(*[dtypes[col] for dtypes in self.chunk_dtypes])
+                    header = {'descr': np.lib.format.dtype_to_descr(dtype), 'fortran_order': False, 'shape': (self.n_rows,)}
+                    with zf.open(f"{col}.npy", 'w', force_zip64=True) as member:
+                        np.lib.format.write_array_header_1_0(member, header)
+                        for i in range(len(self.chunk_dtypes)):
+                            member.write(np.load(self.chunk_fn(i, col_i)).astype(dtype, copy=False).tobytes())
+        finally:
+            self.discard()
+
+    def discard(self):
+        """remove spooled chunks without writing output"""
+        shutil.rmtree(self.spool_dir, ignore_errors=True)
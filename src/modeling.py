@@ -11,6 +11,7 @@ from scipy.optimize import curve_fit, least_squares
 
 import src.Exceptions as Exceptions
 from src.analyze import get_plot_preferences, get_num_from_string, prepare_stats_file, range_statistics
+from src.stats_store import load_range_stats, stats_version, STATS_DB_FN
 
 PI = np.pi
 
@@ -23,6 +24,7 @@ def propogate_bandwidth_err(val, pair):
 
     returns propogated multiplication error of set of average data
     main purpose is to find error in bandwidth calculation (delta_D * f_0 / 2)
+    values may be of any shape, e.g. (ranges x overtones) for all ranges at once
 
     Args:
         val (np.array): array of values that are the result of the multiplication that is now being propagated
@@ -31,44 +33,31 @@ def propogate_bandwidth_err(val, pair):
     Returns:
         np.array: array of error values corresponding to the values resulting from the bandwidth multiplication requiring this function
     """    
-    comp = np.zeros(len(pair[0]), dtype=float)
-    # pair[0] is the array of values, pair[1] is the array of errors corresponding with those values
-    for i in range(len(pair[0])):
-        if pair[0][i] == 0: # this is 0 for overtones not recorded/selected
-            comp[i] = 0 # error for overtones with no data is 0
-        else: # error propagation for multiplication
-            comp[i] = np.power(float(( pair[1][i] / pair[0][i] )), 2) # (sigma_x / x_mu) ** 2
+    vals, errs = np.asarray(pair[0], dtype=float), np.asarray(pair[1], dtype=float)
+    # error for overtones with no data (value of 0, not recorded/selected) is 0, otherwise (sigma_x / x_mu) ** 2
+    comp = np.square(np.divide(errs, vals, out=np.zeros(np.broadcast(errs, vals).shape), where=vals != 0))
 
     err = val * np.sqrt( comp )
     return (err)
 
-def propogate_mean_err(n_means, errs, n_srcs):
+def propogate_mean_err(sq_err_sums, n_srcs, carry_over=True):
     """propagation of error for mean calculations
     we already have the error values assoc with the values we found the mean of,
     so the propagation is simply a sum of squares of these errors, div by n-1 (or n if just 1 mean)
 
-    appears unnecessarily complicated, but this will work for multiple sources in one pass
+    works on any number of ranges at once, e.g. (ranges x overtones) arrays from RangeAggregate
 
     Args:
-        n_means (int): number of mean values to have errors propagated
-        errs (list): error values associated with mean calculations
-        n_srcs (int): number of range selections made
+        sq_err_sums (np.ndarray): sums over sources of squared error values associated with mean calculations, overtones along the last axis
+        n_srcs (np.ndarray): number of range selections (sources) each sum is over
+        carry_over (bool, optional): carry sums on into later overtones, as the thin film models always have. Defaults to True.
 
     Returns:
-        list: list of propagated error values associated with the means
+        np.ndarray: propagated error values associated with the means
     """    
-    comp = 0
-    sigmas = []
-    # the new error is the square root of the sum of the squares of the errors and divide it by n_srcs
-    for i in range(n_means):
-        for j in range(n_srcs):
-            comp += np.power( ( errs[j][i] ), 2 )
-        if n_srcs == 1:
-            sigmas.append(np.sqrt(comp))
-        else:
-            sigmas.append(np.sqrt( comp/( n_srcs-1 ) ))
-
-    return sigmas
+    # the new error is the square root of the sum of the squares of the errors and divide it by n_srcs - 1
+    comp = np.cumsum(sq_err_sums, axis=-1) if carry_over else sq_err_sums
+    return np.sqrt( comp / np.maximum(n_srcs - 1, 1) )
 
 def linear(x, m, b):
     """linear equation y = mx + b used for linear regression"""
@@ -214,55 +203,63 @@ def get_calibration_values(which_plot, use_theoretical_vals):
         
     return calibration_freq
 
-def avg_and_propogate(label, sources, df, is_frequency):
-    """group data, average it w.r.t. overtones, and propagate
+class RangeAggregate:
+    """averages of saved range stats over the sources each range was selected from, and their propagated errors,
+    for every (range, overtone) in one group by pass over the stats table
 
     Args:
-        label (str): user specified identifier of the range of data they selected
-        source (str): file name that data originated from
-        df (_type_): dataframe of statistical calculations of range selected by user
-        is_frequency (bool): _description_
-
-    Returns:
-        _type_: _description_
-    """    
-    df_ranges = df.loc[df['range_name'] == label]
-
-    # group data by range and then source
-    # values get averaged across sources respective to their range
-    # i.e. average( <num from range 'x' source1>, <num from range 'x' source2>, ... )
-    delta_vals = []
-    sigma_delta_vals = []
-    if is_frequency:
-        delta_col = 'Dfreq_average'
-        sigma_delta_col = 'Dfreq_std_dev'
-    else:
-        delta_col = 'Ddis_average'
-        sigma_delta_col = 'Ddis_std_dev'
-
-    for source in sources: # grabs data grouped by label and further groups into source
-        df_range = df_ranges.loc[df_ranges['data_source'] == source]
-        delta_vals.append(df_range[delta_col].values)
-        sigma_delta_vals.append(df_range[sigma_delta_col].values)
-        
-    # take average described above
-    n_srcs = len(sources) # num sources -> number of ranges used for average
-    mean_delta_vals = np.zeros(delta_vals[0].shape)
-    for i in range(n_srcs):
-        print(mean_delta_vals, delta_vals)
-        mean_delta_vals += delta_vals[i]
-    
-    mean_delta_vals /= n_srcs
-    sigma_mean_delta_vals = propogate_mean_err(len(mean_delta_vals), sigma_delta_vals, n_srcs)
-    
-    # make 0 for non selected overtones
-    zero_idxs = np.where(mean_delta_vals == 0)[0].astype(int)
-    sigma_mean_delta_vals = np.array(sigma_mean_delta_vals)
-    sigma_mean_delta_vals[zero_idxs] = 0
+        df (pd.DataFrame): range stats from load_range_stats(), overtones as index or 'overtone' column
+        is_frequency (bool): True for frequency stats, False for dissipation
+    """
+    def __init__(self, df, is_frequency):
+        prefix = 'Dfreq' if is_frequency else 'Ddis'
+        overtone_col = df['overtone'] if 'overtone' in df.columns else df.index.to_series()
+        # ranges and overtones in the order they were saved
+        label_codes, self.labels = pd.factorize(df['range_name'].to_numpy())
+        overtone_codes, self.overtones = pd.factorize(overtone_col.to_numpy())
+        self.sources = pd.unique(df['data_source'].to_numpy())
+
+        # group by (range, overtone), there is at most one row of each per source
+        shape = (len(self.labels), len(self.overtones))
+        groups = label_codes * shape[1] + overtone_codes
+        group_sum = lambda vals: np.bincount(groups, weights=vals, minlength=shape[0]*shape[1]).reshape(shape)
+        self.n_srcs = np.bincount(groups, minlength=shape[0]*shape[1]).reshape(shape)
+        self.sq_err_sums = group_sum(np.square(df[f'{prefix}_std_dev'].to_numpy(dtype=float)))
+        self.means = np.divide(group_sum(df[f'{prefix}_average'].to_numpy(dtype=float)), self.n_srcs,
+                               out=np.zeros(shape), where=self.n_srcs > 0)
+
+    def errs(self, carry_over=False):
+        """propagated errors of the means, 0 for overtones not selected (mean of 0), see propogate_mean_err()"""
+        sigmas = propogate_mean_err(self.sq_err_sums, self.n_srcs, carry_over)
+        sigmas[self.means == 0] = 0
+        return sigmas
+
+    def label_rows(self, labels):
+        """row of each of labels in means and errs"""
+        rows = pd.Index(self.labels).get_indexer(labels)
+        if (rows < 0).any():
+            raise ValueError(f"ERROR: no stats saved for range(s) {list(np.asarray(labels)[rows < 0])}")
+        return rows
+
+class RangeAggregates:
+    """aggregates of saved range stats kept for a modelling session, so running several models reads and groups them once
+    they are made again only when the saved stats change, e.g. a range is selected with the modelling window open
 
-    print(zero_idxs, sigma_mean_delta_vals)
+    Args:
+        db_fn (str, optional): stats database path. Defaults to STATS_DB_FN.
+    """
+    def __init__(self, db_fn=STATS_DB_FN):
+        self.db_fn = db_fn
+        self.cache = {} # (which_fmt, kind) -> (stats version, RangeAggregate)
 
-    return mean_delta_vals, sigma_mean_delta_vals
+    def get(self, which_fmt='clean', kind='rf'):
+        version = stats_version(self.db_fn)
+        cached = self.cache.get((which_fmt, kind))
+        if cached is None or cached[0] != version:
+            print(f"aggregating {which_fmt} {kind} range stats")
+            cached = (version, RangeAggregate(load_range_stats(which_fmt, kind, self.db_fn), kind == 'rf'))
+            self.cache[(which_fmt, kind)] = cached
+        return cached[1]
 
 
 def remove_zero_elements(arrs):
@@ -320,7 +317,99 @@ def plot_data(xdata, ydata, xerr, yerr, label, has_err, color='black'):
 
     return fig, ax
 
-def linearly_analyze(x, y, ax, label_prefix='', label_postfix=''):
+def weighted_linear_fit(x, y, sigma=None, axis=-1):
+    """closed form least squares straight line fit of y over x, optionally weighted by 1/sigma²
+    any number of independent fits stacked along the other axes of y are done at once, e.g. frequency and dissipation drift
+    sums are taken about the weighted means so large x (e.g. time) or near constant data do not lose precision
+    points with a missing x or y are left out
+
+    Args:
+        x (array like): x data, broadcastable with y
+        y (array like): y data, points along axis
+        sigma (array like, optional): errors of y, e.g. propagated errors of averages. Fits with any error
+            that is 0 or missing are unweighted. Defaults to None (unweighted).
+        axis (int, optional): axis the points of each fit are along. Defaults to -1.
+
+    Returns:
+        tuple of np.ndarray: slope, y-intercept, covariance of (slope, y-intercept) along 2 new last axes, and R²
+            as curve_fit() would give, the slope is 0 with infinite variance where all x are the same,
+            and slope and intercept are nan where there are no points
+    """
+    # 1D x and sigma are shared by every fit, otherwise they are shaped like y
+    points_last = lambda arr: arr if arr.ndim <= 1 else np.moveaxis(arr, axis, -1)
+    y = np.moveaxis(np.asarray(y, dtype=float), axis, -1)
+    x, y = np.broadcast_arrays(points_last(np.asarray(x, dtype=float)), y)
+    is_valid = np.isfinite(x) & np.isfinite(y)
+    if sigma is None:
+        w = is_valid.astype(float)
+    else:
+        sigma = np.broadcast_to(points_last(np.asarray(sigma, dtype=float)), y.shape)
+        has_err = np.isfinite(sigma) & (sigma > 0)
+        is_weighted = (has_err | ~is_valid).all(axis=-1, keepdims=True)
+        w = np.where(is_valid, np.where(is_weighted, 1 / np.where(has_err, sigma, 1)**2, 1.0), 0.0)
+    x, y = np.where(is_valid, x, 0.0), np.where(is_valid, y, 0.0)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sum_w = w.sum(axis=-1)
+        n = is_valid.sum(axis=-1)
+        x_mean = (w * x).sum(axis=-1) / sum_w
+        y_mean = (w * y).sum(axis=-1) / sum_w
+        dx = np.where(is_valid, x - x_mean[..., None], 0.0)
+        dy = np.where(is_valid, y - y_mean[..., None], 0.0)
+        sxx = (w * dx * dx).sum(axis=-1)
+        sxy = (w * dx * dy).sum(axis=-1)
+        syy = (w * dy * dy).sum(axis=-1)
+
+        # x spread no bigger than round off of x, e.g. a single point, has no slope
+        x_max = np.abs(x).max(axis=-1, initial=0.0)
+        is_flat = sxx <= sum_w * (8 * np.finfo(float).eps * x_max)**2
+        m = np.where(n > 0, np.where(is_flat, 0.0, sxy / np.where(is_flat, 1.0, sxx)), np.nan)
+        b = y_mean - m * x_mean
+
+        # residuals about the line, from the centered sums, and the reduced chi² scaling curve_fit uses without absolute_sigma
+        ss_res = np.maximum(syy - m * sxy, 0.0)
+        s2 = np.where(n > 2, ss_res / np.maximum(n - 2, 1), np.inf)
+        var_m = np.where(is_flat, np.inf, s2 / np.where(is_flat, 1.0, sxx))
+        cov = np.empty(m.shape + (2, 2))
+        cov[..., 0, 0] = var_m
+        cov[..., 0, 1] = cov[..., 1, 0] = np.where(is_flat, np.nan, -x_mean * var_m)
+        cov[..., 1, 1] = s2 / sum_w + x_mean**2 * var_m
+
+        # a line through every point fits perfectly, including data with no spread in y
+        r_squared = np.where(syy > 0, 1 - ss_res / np.where(syy > 0, syy, 1.0), 1.0)
+    r_squared = np.where(n > 0, r_squared, np.nan)
+    return m, b, cov, r_squared
+
+def linear_fit(x, y, sigma=None):
+    """linear fit of y over x and how well the line fits, see weighted_linear_fit()
+
+    Args:
+        x (_type_): x data for linear fit
+        y (_type_): y data for fit
+        sigma (_type_, optional): errors of y to weight points by. Defaults to None (unweighted).
+
+    Raises:
+        ValueError: no points to fit
+
+    Returns:
+        slope, y-intercept, R²: results of the linear fit
+    """
+    m, b, _, rSquared = weighted_linear_fit(x, y, sigma)
+    m, b, rSquared = float(m), float(b), float(rSquared)
+    if not (np.isfinite(m) and np.isfinite(b)):
+        raise ValueError("no valid points to fit")
+    print(f"R² = {rSquared}")
+
+    return m, b, rSquared
+
+def linear_fit_label(m, b, label_prefix='', label_postfix=''):
+    """legend text of a linear fit, the equation of the line or the slope between label_prefix and label_postfix"""
+    sign = '-' if b < 0 else '+' 
+    if label_prefix == '' and label_postfix == '':
+        return f'Linear fit:\ny = {m:.4f}x {sign} {np.abs(b):.4f}'
+    return label_prefix + f"{m:.4e} " + label_postfix
+
+def linearly_analyze(x, y, ax, label_prefix='', label_postfix='', sigma=None):
     """handles the linear fit and necessary operations surrounding it
 
     Args:
@@ -329,33 +418,20 @@ def linearly_analyze(x, y, ax, label_prefix='', label_postfix=''):
         ax (plt.Axes): axes for plotting fit
         label_prefix (str, optional): text to write to legend preceeding the slope value. Defaults to ''.
         label_postfix (str, optional): text to write to legend following the slope value. Defaults to ''.
+        sigma (_type_, optional): errors of y to weight points by, e.g. propagated errors. Defaults to None (unweighted).
 
     Returns:
         slope, y-intercept: results of the linear fit
     """    
-    # performing the linear fit 
-    params, cov = curve_fit(linear, x, y)
-    m, b = params
-    sign = '-' if b < 0 else '+' 
-
-    # calculate linear fit data
-    y_fit = linear(np.asarray(x), m, b)
-
-    # determine quality of the fit
-    squaredDiffs = np.square(y - y_fit)
-    squaredDiffsFromMean = np.square(y - np.mean(y))
-    rSquared = 1 - np.sum(squaredDiffs) / np.sum(squaredDiffsFromMean)
-    print(f"R² = {rSquared}")
+    m, b, _ = linear_fit(x, y, sigma)
 
     # for reporting Sauerbrey mass given slope
 
     # put label together
-    if label_prefix == '' and label_postfix == '':
-        label = f'Linear fit:\ny = {m:.4f}x {sign} {np.abs(b):.4f}'
-    else:
-        label = label_prefix + f"{m:.4e} " + label_postfix
+    label = linear_fit_label(m, b, label_prefix, label_postfix)
     
     # plot curve fit
+    y_fit = linear(np.asarray(x), m, b)
     ax.plot(x, y_fit, 'r', label=label)
 
     return m, b
@@ -436,49 +512,52 @@ def get_labels(label, type, subtype='', usetex=False):
 
     return data_label, x, y, title
 
-def process_bandwidth_calculations_for_linear_regression(which_plot, sources, rf_df, dis_df, label, use_theoretical_vals):
+def process_bandwidth_calculations_for_linear_regression(which_plot, rf_agg, dis_agg, use_theoretical_vals):
     """takes statistical data from user's interactive plot selection,
     and prepares it for linear regression calculations for thin film models
     this involves getting calibration values, averaging, propagating, and converting dissipation to bandwidth
+    all ranges are averaged and propagated together
 
     Args:
         which_plot (dict): dictionary of overtones where they value is a bool indicating if overtone is selected
-        sources (list): list of strings indicating which files the data came from
-        rf_df (pd.DataFrame): dataframe from 'selected_ranges/clean_all_stats_rf.csv'
-        dis_df (pd.DataFrame): dataframe from 'selected_ranges/clean_all_stats_dis.csv'
-        label (str): user spec'd identifier of range being selected and models being applied to
+        rf_agg (RangeAggregate): clean frequency range stats
+        dis_agg (RangeAggregate): clean dissipation range stats
         use_theoretical_vals (bool): determines if offset values will be theoretical or experimental
 
     Returns:
-        np.Arrays: experimental values and their errors post processing
+        dict: label -> (n_mean_delta_freqs, delta_gamma, sigma_n_mean_delta_freqs, sigma_delta_gamma),
+            experimental values and their errors post processing
     """    
-    calibration_freq = get_calibration_values(which_plot, use_theoretical_vals)
-    print(rf_df, dis_df)
-    mean_delta_freqs, sigma_mean_delta_freqs = avg_and_propogate(label, sources, rf_df, True)
-    print("###", mean_delta_freqs, sigma_mean_delta_freqs)
-    n_mean_delta_freqs = [Df * (2*i+1) for i, Df in enumerate(mean_delta_freqs)] # 2i+1 corresponds to overtone number
-    sigma_n_mean_delta_freqs = [sDf * (2*i+1) for i, sDf in enumerate(sigma_mean_delta_freqs)] 
-    mean_delta_dis, sigma_mean_delta_dis = avg_and_propogate(label, sources, dis_df, False)        
-    
-    print(f"*** rf for label: {label}\n\tn*means: {n_mean_delta_freqs}\n\tstddev: {sigma_n_mean_delta_freqs}\n")
-    print(f"*** dis for label: {label}:\n\tmeans: {mean_delta_dis}\n\tstddev: {sigma_mean_delta_dis}\n")
+    calibration_freq = np.asarray(get_calibration_values(which_plot, use_theoretical_vals), dtype=float)
+    labels = rf_agg.labels
+    mean_delta_freqs, sigma_mean_delta_freqs = rf_agg.means, rf_agg.errs(carry_over=True)
+    ov_nums = 2 * np.arange(mean_delta_freqs.shape[1]) + 1 # 2i+1 corresponds to overtone number
+    n_mean_delta_freqs = mean_delta_freqs * ov_nums
+    sigma_n_mean_delta_freqs = sigma_mean_delta_freqs * ov_nums
+    dis_rows = dis_agg.label_rows(labels)
+    mean_delta_dis, sigma_mean_delta_dis = dis_agg.means[dis_rows], dis_agg.errs(carry_over=True)[dis_rows]
 
     # calculate bandwidth shift and propogate error for this calculation
-    #dis_w_err = [np.array(mean_delta_dis), np.array(sigma_mean_delta_dis)]
-    delta_gamma = np.array(mean_delta_dis * calibration_freq / 2) # bandwidth shift, Γ
+    delta_gamma = mean_delta_dis * calibration_freq / 2 # bandwidth shift, Γ
     
     # due to refactor there is no y error only x, this means no mult error prop needed, the error is just x err times delta_gamma
-    #sigma_delta_gamma = propogate_bandwidth_err(delta_gamma, dis_w_err)
+    #sigma_delta_gamma = propogate_bandwidth_err(delta_gamma, [mean_delta_dis, sigma_mean_delta_dis])
     sigma_delta_gamma = delta_gamma * sigma_mean_delta_dis
 
-    # remove entries of freqs not being analyzed
-    arrs = [delta_gamma, sigma_delta_gamma, np.array(n_mean_delta_freqs), np.array(sigma_n_mean_delta_freqs)]
-    delta_gamma, sigma_delta_gamma, n_mean_delta_freqs, sigma_n_mean_delta_freqs = remove_zero_elements(arrs)
+    bandwidth_data = {}
+    for i, label in enumerate(labels):
+        print(f"*** rf for label: {label}\n\tn*means: {n_mean_delta_freqs[i]}\n\tstddev: {sigma_n_mean_delta_freqs[i]}\n")
+        print(f"*** dis for label: {label}:\n\tmeans: {mean_delta_dis[i]}\n\tstddev: {sigma_mean_delta_dis[i]}\n")
+
+        # remove entries of freqs not being analyzed
+        arrs = [delta_gamma[i], sigma_delta_gamma[i], n_mean_delta_freqs[i], sigma_n_mean_delta_freqs[i]]
+        label_delta_gamma, label_sigma_delta_gamma, label_n_mean_delta_freqs, label_sigma_n_mean_delta_freqs = remove_zero_elements(arrs)
+        bandwidth_data[label] = (label_n_mean_delta_freqs, label_delta_gamma, label_sigma_n_mean_delta_freqs, label_sigma_delta_gamma)
 
-    return n_mean_delta_freqs, delta_gamma, sigma_n_mean_delta_freqs, sigma_delta_gamma
+    return bandwidth_data
     
 
-def thin_film_liquid_analysis(which_plot, use_theoretical_vals, latex_installed):
+def thin_film_liquid_analysis(which_plot, use_theoretical_vals, latex_installed, aggregates=None):
     """application of thin film in liquid model
     works for multiple range selections at a time, as long as from same data file
 
@@ -488,6 +567,7 @@ def thin_film_liquid_analysis(which_plot, use_theoretical_vals, latex_installed)
         use_theoretical_vals (bool): indicates to use theoretical values for resonant frequency, or offset
         latex_installed: TO BE DEPRECATED
         )): rely on a tuple passed in of all necessary variables, since tkinter buttons can only pass 1 argument to function
+        aggregates (RangeAggregates, optional): saved range stats of the modelling session. Defaults to None (read here).
 
     Raises:
         Exceptions.ShapeMismatchException: raises when there is a different number of overtones selected in ui than found in stats file
@@ -497,19 +577,20 @@ def thin_film_liquid_analysis(which_plot, use_theoretical_vals, latex_installed)
     dpi = plot_customs['fig_dpi']
     print("Performing thin film in liquid analysis...")
 
-    # grab statistical data of overtones from files generated in interactive plot
-    rf_df = pd.read_csv("selected_ranges/clean_all_stats_rf.csv", index_col=0)
-    dis_df = pd.read_csv("selected_ranges/clean_all_stats_dis.csv", index_col=0)
+    # grab statistical data of overtones saved from interactive plot selections, averaged over sources
+    aggregates = aggregates or RangeAggregates()
+    rf_agg = aggregates.get('clean', 'rf')
+    dis_agg = aggregates.get('clean', 'dis')
 
     # grab all unique labels from dataset
-    labels = rf_df['range_name'].unique()
-    sources = rf_df['data_source'].unique()
+    labels = rf_agg.labels
+    sources = rf_agg.sources
     print(f"*** found labels: {labels}\n\t from sources: {sources}\n")
     
     # grab and analyze data for each range and indicated by the label
+    bandwidth_data = process_bandwidth_calculations_for_linear_regression(which_plot, rf_agg, dis_agg, use_theoretical_vals)
     for label in labels:
-        n_mean_delta_freqs, delta_gamma, sigma_n_mean_delta_freqs, sigma_delta_gamma = process_bandwidth_calculations_for_linear_regression(
-            which_plot, sources, rf_df, dis_df, label, use_theoretical_vals)
+        n_mean_delta_freqs, delta_gamma, sigma_n_mean_delta_freqs, sigma_delta_gamma = bandwidth_data[label]
     
         # plot data
         data_label, x_label, y_label, title = get_labels(label, 'film_liquid', '', latex_installed)
@@ -522,7 +603,7 @@ def thin_film_liquid_analysis(which_plot, use_theoretical_vals, latex_installed)
                                  sigma_delta_gamma, data_label, True)
         
         # take care of all linear fitting analysis 
-        m, b = linearly_analyze(n_mean_delta_freqs, delta_gamma, ax, 'Shear dependent compliance: ', r'$\frac{1}{Pa}$')
+        m, b = linearly_analyze(n_mean_delta_freqs, delta_gamma, ax, 'Shear dependent compliance: ', r'$\frac{1}{Pa}$', sigma=sigma_delta_gamma)
         delta_gamma_fit = linear(n_mean_delta_freqs, m, b)
 
         # save calculations to file
@@ -540,7 +621,7 @@ def thin_film_liquid_analysis(which_plot, use_theoretical_vals, latex_installed)
         print("Thin film in liquid analysis complete")
         plt.rc('text', usetex=False)
 
-def thin_film_air_analysis(which_plot, use_theoretical_vals, latex_installed):
+def thin_film_air_analysis(which_plot, use_theoretical_vals, latex_installed, aggregates=None):
     """application of thin film in air model
     works for multiple range selections at a time, as long as from same data file
     similar process to thin film in liquid, but a few extra steps
@@ -551,6 +632,7 @@ def thin_film_air_analysis(which_plot, use_theoretical_vals, latex_installed):
         use_theoretical_vals (bool): indicates to use theoretical values for resonant frequency, or offset
         latex_installed: TO BE DEPRECATED
         )): rely on a tuple passed in of all necessary variables, since tkinter buttons can only pass 1 argument to function
+        aggregates (RangeAggregates, optional): saved range stats of the modelling session. Defaults to None (read here).
 
     Raises:
         Exceptions.ShapeMismatchException: raises when there is a different number of overtones selected in ui than found in stats file
@@ -560,21 +642,22 @@ def thin_film_air_analysis(which_plot, use_theoretical_vals, latex_installed):
     dpi = plot_customs['fig_dpi']
     print("Performing thin film in liquid analysis...")
 
-    # grab statistical data of overtones from files generated in interactive plot
-    rf_df = pd.read_csv("selected_ranges/clean_all_stats_rf.csv", index_col=0)
-    dis_df = pd.read_csv("selected_ranges/clean_all_stats_dis.csv", index_col=0)
+    # grab statistical data of overtones saved from interactive plot selections, averaged over sources
+    aggregates = aggregates or RangeAggregates()
+    rf_agg = aggregates.get('clean', 'rf')
+    dis_agg = aggregates.get('clean', 'dis')
 
     # grab all unique labels from dataset
-    labels = rf_df['range_name'].unique()
-    sources = rf_df['data_source'].unique()
-    overtones_df = rf_df[(rf_df!= 0).all(1)] # remove rows with 0 (unselected rows)
-    overtones = overtones_df.index.unique()
+    labels = rf_agg.labels
+    sources = rf_agg.sources
+    overtones = rf_agg.overtones[(rf_agg.means != 0).any(axis=0)] # remove unselected overtones (0s)
     overtones = np.asarray([get_num_from_string(ov) for ov in overtones]) # get just the number from overtone labels
     print(f"*** found labels: {labels}\n\t from sources: {sources}\nfor overtones: {overtones}")
     
     # grab and analyze data for each range and indicated by the label
+    bandwidth_data = process_bandwidth_calculations_for_linear_regression(which_plot, rf_agg, dis_agg, use_theoretical_vals)
     for label in labels:
-        n_mean_delta_freqs, delta_gamma, sigma_n_mean_delta_freqs, sigma_delta_gamma = process_bandwidth_calculations_for_linear_regression(which_plot, sources, rf_df, dis_df, label, use_theoretical_vals)
+        n_mean_delta_freqs, delta_gamma, sigma_n_mean_delta_freqs, sigma_delta_gamma = bandwidth_data[label]
         
         # for thin film in air, Df and DGamma are normalized
         print("AAA", delta_gamma, overtones)
@@ -599,7 +682,7 @@ def thin_film_air_analysis(which_plot, use_theoretical_vals, latex_installed):
                                  sigma_delta_gamma_norm, data_label, True)
         
         # take care of all linear fitting analysis    
-        dG_m, dG_b = linearly_analyze(sq_overtones, delta_gamma_norm, ax) 
+        dG_m, dG_b = linearly_analyze(sq_overtones, delta_gamma_norm, ax, sigma=sigma_delta_gamma_norm)
         delta_gamma_norm_fit = linear(sq_overtones, dG_m, dG_b)
 
         # save figure
@@ -613,7 +696,7 @@ def thin_film_air_analysis(which_plot, use_theoretical_vals, latex_installed):
                                  sigma_delta_freqs_norm, data_label, True)
         
         # take care of all linear fitting analysis    
-        linearly_analyze(sq_overtones, delta_freqs_norm, ax) 
+        linearly_analyze(sq_overtones, delta_freqs_norm, ax, sigma=sigma_delta_freqs_norm)
         delta_freq_norm_fit = linear(sq_overtones, dG_m, dG_b)
 
         # save calculations to file
@@ -660,8 +743,8 @@ def gordon_kanazawa(user_input):
     header = "overtone,average_Df,average_Df_n,kinematic_viscosity,range_name,data_source\n"
     stats_out_fn = 'selected_ranges/gordon-kanazawa_output.csv'                
 
-    # grab data from file
-    stats_df = pd.read_csv("selected_ranges/clean_all_stats_rf.csv")
+    # grab saved range stats
+    stats_df = load_range_stats('clean', 'rf')
     stats_df = stats_df[(stats_df!= 0).all(1)] # remove freq rows with 0 (unselected rows)
     labels = stats_df['range_name'].unique()
     print(labels)
@@ -782,13 +865,14 @@ def sauerbrey_avgs(mu_Df, delta_mu_Df, C, overtones, label, fig_format, dpi):
 
     return mu_Dm, delta_mu_Dm
 
-def sauerbrey_fit(df, overtones, label, C, fig_format, dpi):
+def sauerbrey_fit(mu_Df, delta_mu_Df, overtones, label, C, fig_format, dpi):
     """method 2 of applying Sauerbrey model
     finds mu_Dm and delta_mu_Dm over the range selected for EACH overtone
     works for multiple range selections at a time, as long as from same data file
 
     Args:
-        df (pd.DataFrame): contains the statistical information from range selection in interactive plot
+        mu_Df (np.Array): average change in frequency of the range for each selected overtone
+        delta_mu_Df (np.Array): error of mu_Df
         overtones (np.Array): numpy array of integers containing overtone numbers selected
         label (str): label for legend in plot
         C (float): mass sensitivity constant obtained in parent sauerbrey() function 
@@ -804,11 +888,8 @@ def sauerbrey_fit(df, overtones, label, C, fig_format, dpi):
         mu_Df_fit (np.Array): array of floats containing the linear fit for average change in Sauerbrey mass (slope * C is mass)
 
     """    
-    # grabbing data from df
-    df_range = df.loc[df['range_name'] == label]
     # method 1 of Sauerbrey mass (linear fit slope * C)
-    mu_Df = df_range['Dfreq_average'].values.astype(np.float32) # average change in frequency (y)
-    delta_mu_Df = df_range['Dfreq_std_dev'].values # std dev of y
+    mu_Df = np.asarray(mu_Df).astype(np.float32) # average change in frequency (y)
     print('***',mu_Df,delta_mu_Df)
 
     if mu_Df.shape != overtones.shape:
@@ -821,7 +902,7 @@ def sauerbrey_fit(df, overtones, label, C, fig_format, dpi):
     avg_Df_fig, avg_Df_ax = plot_data(overtones, mu_Df, None, delta_mu_Df, data_label, True)
 
     # take care of all linear fitting analysis    
-    m, b = linearly_analyze(overtones, mu_Df, avg_Df_ax)
+    m, b = linearly_analyze(overtones, mu_Df, avg_Df_ax, sigma=delta_mu_Df) # overtones averaged over more precise ranges count for more
     mu_Df_fit = linear(overtones, m, b)
 
     format_plot(avg_Df_ax, x_label, y_label, title, overtones)
@@ -831,19 +912,21 @@ def sauerbrey_fit(df, overtones, label, C, fig_format, dpi):
 
     return mu_Df, delta_mu_Df, mu_Df_fit
 
-def sauerbrey(use_theoretical_vals):
+def sauerbrey(use_theoretical_vals, aggregates=None):
     plot_customs = get_plot_preferences()
     fig_format = plot_customs['fig_format']
     dpi = plot_customs['fig_dpi']
     print("Analyzing Sauerbrey equation...")
 
-    # grabbing df from csv
-    df = pd.read_csv("selected_ranges/clean_all_stats_rf.csv")
-    df = df[(df!= 0).all(1)] # remove freq rows with 0 (unselected rows)
-    labels = df['range_name'].unique()
-    overtones = df['overtone'].unique() # overtone number (x)
+    # grabbing saved range stats, averaged over sources
+    aggregates = aggregates or RangeAggregates()
+    rf_agg = aggregates.get('clean', 'rf')
+    is_selected = rf_agg.means != 0 # 0s are unselected overtones
+    labels = rf_agg.labels[is_selected.any(axis=1)]
+    overtones = rf_agg.overtones[is_selected.any(axis=0)] # overtone number (x)
     overtones = np.asarray([get_num_from_string(ov) for ov in overtones]) # get just the number from overtone labels
-    sources = df['data_source'].unique()
+    sources = rf_agg.sources
+    rf_errs = rf_agg.errs()
     print(f"LABELS: {labels}; OVERTONES: {overtones}")
 
     # calculate C for Sauerbrey mass formula if user opts to use calibration vals
@@ -859,8 +942,9 @@ def sauerbrey(use_theoretical_vals):
         C *= 1e8 # unit conversion
     print(f"C: {C}")
 
-    for label in labels:
-        mu_Df, delta_mu_Df, mu_Df_fit = sauerbrey_fit(df, overtones, label, C, fig_format, dpi)
+    for label, row in zip(labels, rf_agg.label_rows(labels)):
+        row_selected = is_selected[row]
+        mu_Df, delta_mu_Df, mu_Df_fit = sauerbrey_fit(rf_agg.means[row][row_selected], rf_errs[row][row_selected], overtones, label, C, fig_format, dpi)
         mu_Dm, delta_mu_Dm = sauerbrey_avgs(mu_Df, delta_mu_Df, C, overtones, label, fig_format, dpi)
 
         # save calculations to file
@@ -874,9 +958,12 @@ def sauerbrey(use_theoretical_vals):
     print("Sauerbrey analysis complete")
     plt.rc('text', usetex=False)
 
-def avgs_analysis():
+def avgs_analysis(aggregates=None):
     """plot the average change in frequency and dissipation of range selection for each overtone
 
+    Args:
+        aggregates (RangeAggregates, optional): saved range stats of the modelling session. Defaults to None (read here).
+
     Raises:
         Exceptions.ShapeMismatchException: raises when there is a different number of overtones selected in ui than found in stats file
     """    
@@ -885,24 +972,24 @@ def avgs_analysis():
     dpi = plot_customs['fig_dpi']
     print("Analyzing average change in frequency and dissipation...")
 
-    # grabbing df from csv
-    rf_df = pd.read_csv("selected_ranges/clean_all_stats_rf.csv")
-    rf_df = rf_df[(rf_df!= 0).all(1)] # remove freq rows with 0 (unselected rows)
-    dis_df = pd.read_csv("selected_ranges/clean_all_stats_dis.csv")
-    dis_df = dis_df[(dis_df!= 0).all(1)] # remove dis rows with 0 (unselected rows)
-    labels = rf_df['range_name'].unique()
-    overtones = rf_df['overtone'].unique() # overtone number (x)
+    # grabbing saved range stats, averaged over sources
+    aggregates = aggregates or RangeAggregates()
+    rf_agg = aggregates.get('clean', 'rf')
+    dis_agg = aggregates.get('clean', 'dis')
+    rf_selected = rf_agg.means != 0 # 0s are unselected overtones
+    dis_selected = dis_agg.means != 0
+    labels = rf_agg.labels[rf_selected.any(axis=1)]
+    overtones = rf_agg.overtones[rf_selected.any(axis=0)] # overtone number (x)
     overtones = np.asarray([get_num_from_string(ov) for ov in overtones]) # get just the number from overtone labels
+    rf_errs, dis_errs = rf_agg.errs(), dis_agg.errs()
     print(f"LABELS: {labels}; OVERTONES: {overtones}")
 
-    for label in labels:
-        # grabbing data from df
-        rf_df_range = rf_df.loc[rf_df['range_name'] == label]
-        dis_df_range = dis_df.loc[dis_df['range_name'] == label]
-        mu_Df = rf_df_range['Dfreq_average'].values # average change in frequency (y)
-        delta_mu_Df = rf_df_range['Dfreq_std_dev'].values # std dev of y
-        mu_Dd = dis_df_range['Ddis_average'].values # average change in dissipation (y)
-        delta_mu_Dd = dis_df_range['Ddis_std_dev'].values # std dev of y
+    for label, rf_row, dis_row in zip(labels, rf_agg.label_rows(labels), dis_agg.label_rows(labels)):
+        # grabbing data of range
+        mu_Df = rf_agg.means[rf_row][rf_selected[rf_row]] # average change in frequency (y)
+        delta_mu_Df = rf_errs[rf_row][rf_selected[rf_row]] # std dev of y
+        mu_Dd = dis_agg.means[dis_row][dis_selected[dis_row]] # average change in dissipation (y)
+        delta_mu_Dd = dis_errs[dis_row][dis_selected[dis_row]] # std dev of y
 
         if mu_Df.shape != overtones.shape:
             raise Exceptions.ShapeMismatchException((mu_Df.shape, overtones.shape),"ERROR: Different number of overtones selected in UI than found in stats file")
@@ -0,0 +1,125 @@
+import numpy as np
+
+from src.decimate import MinMaxPyramid
+
+'''statistics of any range of rows without scanning the range, for the many selections made in the interactive plot
+means and standard deviations come from cumulative sums and sums of squares, so cost the same for any range
+medians come from blocks of each column sorted once, counting in whole blocks which values of the range are below a guess'''
+
+
+class ColumnStats:
+    """mean, standard deviation, and median of any range of one column
+
+    Args:
+        y (np.ndarray): column data, may contain nans
+    """
+    DIRECT_MAX = 4096 # ranges up to this many points are computed straight from the data, as fast and with no round off
+    MIN_BLOCK = 1024 # points per sorted block for medians
+
+    def __init__(self, y):
+        self.y = np.asarray(y, dtype=float)
+        self.n = self.y.shape[0]
+        is_nan = np.isnan(self.y)
+        self.has_nan = bool(is_nan.any())
+        n_valid = self.n - int(is_nan.sum())
+
+        # sums are of differences from the column's mean so the sums of squares stay small
+        # (e.g. frequency shifts of tens of Hz with noise of hundredths)
+        self.shift = np.nansum(self.y) / n_valid if n_valid > 0 else 0.0
+        diffs = np.where(is_nan, 0.0, self.y - self.shift)
+        self.sums = np.concatenate(([0.0], np.cumsum(diffs)))
+        self.sq_sums = np.concatenate(([0.0], np.cumsum(diffs * diffs)))
+        self.nan_counts = np.concatenate(([0], np.cumsum(is_nan, dtype=np.int64))) if self.has_nan else None
+
+        # rank of each point among the whole column (nans last), and of each full block sorted and offset by
+        # block number * n, so counting ranks at or below a guess in every block is one searchsorted call
+        # blocks are made bigger for long runs so offset ranks still fit in int32
+        self.order = np.argsort(self.y, kind='stable').astype(np.int32)
+        self.ranks = np.empty(self.n, dtype=np.int32)
+        self.ranks[self.order] = np.arange(self.n, dtype=np.int32)
+        self.block = self.MIN_BLOCK
+        while (self.n // self.block) * self.n >= 2**31:
+            self.block *= 2
+        n_blocks = self.n // self.block
+        block_ranks = np.sort(self.ranks[:n_blocks*self.block].reshape(n_blocks, self.block), axis=1).astype(np.int64)
+        block_ranks += (np.arange(n_blocks, dtype=np.int64) * self.n)[:, None]
+        self.block_ranks = block_ranks.ravel().astype(np.int32)
+
+    def summary(self, lo, hi):
+        """mean, standard deviation, and median of rows [lo, hi)
+        as np.average(), np.std() of a series, and np.median() would give, so any nan in the range makes mean and median nan
+        while the standard deviation is of the rest
+
+        Returns:
+            tuple of float: mean, standard deviation, median
+        """
+        if hi - lo <= self.DIRECT_MAX:
+            y_sel = self.y[lo:hi]
+            valid = y_sel[~np.isnan(y_sel)]
+            std_dev = np.std(valid) if valid.shape[0] > 0 else np.nan
+            return np.average(y_sel) if hi > lo else np.nan, std_dev, np.median(y_sel) if hi > lo else np.nan
+        n_nan = self.nan_counts[hi] - self.nan_counts[lo] if self.has_nan else 0
+        mean, std_dev = self.mean_std(lo, hi, n_nan)
+        median = np.nan if n_nan else self.median(lo, hi)
+        return mean, std_dev, median
+
+    def mean_std(self, lo, hi, n_nan=0):
+        n_valid = hi - lo - n_nan
+        if n_valid <= 0:
+            return np.nan, np.nan
+        mean_diff = (self.sums[hi] - self.sums[lo]) / n_valid
+        var = max((self.sq_sums[hi] - self.sq_sums[lo]) / n_valid - mean_diff**2, 0.0)
+        mean = np.nan if n_nan else self.shift + mean_diff
+        return mean, np.sqrt(var)
+
+    def median(self, lo, hi):
+        count = hi - lo
+        return (self.kth(lo, hi, (count - 1) // 2) + self.kth(lo, hi, count // 2)) / 2
+
+    def kth(self, lo, hi, k):
+        """k'th smallest value (from 0) of rows [lo, hi), which must not contain nans"""
+        bucket = self.block
+        first, last = -(-lo // bucket), hi // bucket
+        if first >= last: # no whole block in range, so there are at most 2 blocks worth of points
+            return np.partition(self.y[lo:hi], k)[k]
+
+        edge_ranks = np.sort(np.concatenate((self.ranks[lo:first*bucket], self.ranks[last*bucket:hi])))
+        offsets = (np.arange(first, last, dtype=np.int64) * self.n).astype(np.int32) # same type as block_ranks so it is not copied
+        block_starts = np.arange(first, last, dtype=np.int64) * bucket
+
+        # smallest rank with k+1 points of the range ranked at or below it
+        low, high = 0, self.n - 1
+        while low < high:
+            guess = (low + high) // 2
+            n_below = np.searchsorted(edge_ranks, guess, side='right')
+            n_below += (np.searchsorted(self.block_ranks, offsets + guess, side='right') - block_starts).sum()
+            if n_below > k:
+                high = guess
+            else:
+                low = guess + 1
+        return self.y[self.order[low]]
+
+
+class RangeStats:
+    """statistics of any range of rows of the data shown in the interactive plot, see ColumnStats
+
+    Args:
+        df (pd.DataFrame): data selections are made from
+        columns (list of str): columns to keep statistics of, e.g. selected overtones
+        time_col (str, optional): name of time column, for bounds of ranges. Defaults to 'Time'.
+    """
+    def __init__(self, df, columns, time_col='Time'):
+        self.columns = {col: ColumnStats(df[col].to_numpy(dtype=float)) for col in columns}
+        self.time = df[time_col].to_numpy(dtype=float)
+        self.time_pyramid = MinMaxPyramid(self.time)
+
+    def summary(self, col, lo, hi):
+        """mean, standard deviation, and median of col over rows [lo, hi)"""
+        return self.columns[col].summary(lo, hi)
+
+    def time_bounds(self, lo, hi):
+        """earliest and latest time of rows [lo, hi), from the few points of the time pyramid holding them"""
+        if hi <= lo:
+            return np.nan, np.nan
+        idxs = self.time_pyramid.query(lo, hi, 2)
+        return np.nanmin(self.time[idxs]), np.nanmax(self.time[idxs])
@@ -0,0 +1,249 @@
+import os
+import sqlite3
+import numpy as np
+import pandas as pd
+from contextlib import closing
+
+'''statistics of ranges selected in the interactive plot (or by src/cli.py) are kept in a small sqlite database,
+one row per overtone of each range, keyed on range name, data source, and overtone
+saving a selection only upserts the rows of that range instead of rereading and rewriting every range ever saved
+the csv files older versions wrote (selected_ranges/{clean,raw}_all_stats_{rf,dis}.csv) are exported on demand,
+and are imported into the database the first time it is made so no saved ranges are lost'''
+
+STATS_DB_FN = 'selected_ranges/range_stats.db'
+STATS_CSV_FN = 'selected_ranges/{which_fmt}_all_stats_{kind}.csv' # legacy layout, see export_range_stats()
+STATS_FMTS = ('clean', 'raw')
+STATS_KINDS = {'rf': 'Dfreq', 'dis': 'Ddis'} # file suffix and prefix of its stats column names
+FLUSH_DELAY_MS = 1000 # interactive selections are saved once no new selection is made for this long
+n_writes = 0 # writes made by this process, part of stats_version()
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS range_stats (
+    range_name TEXT NOT NULL,
+    data_source TEXT NOT NULL,
+    overtone TEXT NOT NULL,
+    which_fmt TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    average REAL,
+    std_dev REAL,
+    median REAL,
+    x_lower REAL,
+    x_upper REAL,
+    seq INTEGER NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS range_stats_key ON range_stats (range_name, data_source, overtone, which_fmt, kind);
+'''
+
+
+def stats_columns(kind):
+    """column names of stats of kind ('rf' or 'dis') as in the legacy csv files"""
+    prefix = STATS_KINDS[kind]
+    return ['overtone', f'{prefix}_average', f'{prefix}_std_dev', f'{prefix}_median', 'range_name', 'x_lower', 'x_upper', 'data_source']
+
+def connect_stats(db_fn=STATS_DB_FN):
+    """open stats database, making it (and importing any legacy csv files next to it) if it does not exist yet"""
+    is_new = not os.path.exists(db_fn)
+    conn = sqlite3.connect(db_fn, timeout=30) # cli workers may write at the same time
+    conn.executescript(SCHEMA)
+    if is_new:
+        import_legacy_csvs(conn, os.path.dirname(db_fn))
+    return conn
+
+def import_legacy_csvs(conn, stats_dir):
+    """copy ranges from the csv files written by older versions into a newly made database, in file order"""
+    for which_fmt in STATS_FMTS:
+        for kind in STATS_KINDS:
+            csv_fn = os.path.join(stats_dir, os.path.basename(STATS_CSV_FN.format(which_fmt=which_fmt, kind=kind)))
+            try:
+                df = pd.read_csv(csv_fn)
+            except (FileNotFoundError, pd.errors.EmptyDataError):
+                continue
+            if df.shape[0] == 0 or list(df.columns) != stats_columns(kind):
+                print(f"not importing {csv_fn}, no ranges or unknown columns")
+                continue
+            df = df.loc[df['range_name'].notna() & (df['range_name'] != '')]
+            rows = list(df.itertuples(index=False, name=None))
+            print(f"importing {len(rows)} rows of range statistics from {csv_fn}")
+            upsert_rows(conn, which_fmt, kind, rows)
+    conn.commit()
+
+def upsert_rows(conn, which_fmt, kind, rows):
+    """insert or replace rows of (overtone, average, std_dev, median, range_name, x_lower, x_upper, data_source)
+    rows written last are ordered last, as ranges saved again were moved to the end of the legacy csv files"""
+    seq = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM range_stats").fetchone()[0]
+    conn.executemany('''
+        INSERT INTO range_stats (overtone, average, std_dev, median, range_name, x_lower, x_upper, data_source, which_fmt, kind, seq)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (range_name, data_source, overtone, which_fmt, kind) DO UPDATE SET
+            average=excluded.average, std_dev=excluded.std_dev, median=excluded.median,
+            x_lower=excluded.x_lower, x_upper=excluded.x_upper, seq=excluded.seq''',
+        [(row[0], *[to_real(val) for val in row[1:4]], row[4], to_real(row[5]), to_real(row[6]), row[7], which_fmt, kind, seq + i + 1)
+         for i, row in enumerate(rows)])
+
+def to_real(val):
+    """plain float for sqlite, nans are stored as NULL and read back as nan"""
+    val = float(val)
+    return None if np.isnan(val) else val
+
+def save_range_stats(which_fmt, rows, db_fn=STATS_DB_FN):
+    """save stats of one range selection, replacing any saved before for the same range, data source, and overtone
+
+    Args:
+        which_fmt (str): 'clean' or 'raw', data the range was selected from
+        rows (dict): 'rf' and 'dis' lists of rows of (overtone, average, std_dev, median, range_name, x_lower, x_upper, data_source)
+        db_fn (str, optional): stats database path. Defaults to STATS_DB_FN.
+    """
+    with closing(connect_stats(db_fn)) as conn:
+        write_ranges(conn, [(which_fmt, rows)]) # one transaction, so a range is never half saved
+
+def write_ranges(conn, ranges):
+    """upsert stats of several ranges in one transaction, ranges is a list of (which_fmt, rows) as save_range_stats() takes"""
+    global n_writes
+    n_writes += 1
+    with conn:
+        for which_fmt, rows in ranges:
+            for kind, kind_rows in rows.items():
+                upsert_rows(conn, which_fmt, kind, kind_rows)
+
+def load_range_stats(which_fmt='clean', kind='rf', db_fn=STATS_DB_FN):
+    """saved stats as the dataframe pd.read_csv() of the legacy csv file would give
+
+    Args:
+        which_fmt (str, optional): 'clean' or 'raw'. Defaults to 'clean'.
+        kind (str, optional): 'rf' or 'dis'. Defaults to 'rf'.
+        db_fn (str, optional): stats database path. Defaults to STATS_DB_FN.
+
+    Returns:
+        pd.DataFrame: one row per overtone of each range, in the order they were saved
+    """
+    flush_sessions(db_fn) # selections still waiting in an open interactive plot are included
+    with closing(connect_stats(db_fn)) as conn:
+        rows = conn.execute('''
+            SELECT overtone, average, std_dev, median, range_name, x_lower, x_upper, data_source FROM range_stats
+            WHERE which_fmt = ? AND kind = ? ORDER BY seq''', (which_fmt, kind)).fetchall()
+    df = pd.DataFrame(rows, columns=stats_columns(kind))
+    for col in df.columns[[1, 2, 3, 5, 6]]:
+        df[col] = df[col].astype(float) # NULLs back to nan
+    return df
+
+def export_range_stats(which_fmts=STATS_FMTS, db_fn=STATS_DB_FN):
+    """write saved stats to the legacy csv files, for opening elsewhere or older scripts
+
+    Returns:
+        list of str: csv files written
+    """
+    out_fns = []
+    for which_fmt in which_fmts:
+        for kind in STATS_KINDS:
+            df = load_range_stats(which_fmt, kind, db_fn)
+            out_fn = os.path.join(os.path.dirname(db_fn), os.path.basename(STATS_CSV_FN.format(which_fmt=which_fmt, kind=kind)))
+            with open(out_fn, 'w') as stat_file:
+                stat_file.write(','.join(df.columns) + '\n')
+                for row in df.itertuples(index=False, name=None):
+                    stat_file.write(f"{row[0]},{fmt_stat(row[1])},{fmt_stat(row[2])},{fmt_stat(row[3])},{row[4]},{row[5]},{row[6]},{row[7]}\n")
+            out_fns.append(out_fn)
+    print(f"range statistics exported to {out_fns}")
+    return out_fns
+
+def fmt_stat(val):
+    """stat as written to csv, missing values as 'nan' since pandas does not read the 'NAN' of %E formatting as missing"""
+    return 'nan' if np.isnan(val) else f"{val:.16E}"
+
+def clear_range_stats(db_fn=STATS_DB_FN):
+    """remove all saved ranges, and any selections waiting to be saved"""
+    for session in open_sessions:
+        if session.db_fn == db_fn:
+            session.discard()
+    global n_writes
+    n_writes += 1
+    with closing(connect_stats(db_fn)) as conn:
+        with conn:
+            conn.execute("DELETE FROM range_stats")
+
+def stats_version(db_fn=STATS_DB_FN):
+    """changes whenever saved stats change, so results made from them can be kept until then
+    writes by this process are counted, writes by others (e.g. cli workers) change the file's modified time or size"""
+    flush_sessions(db_fn)
+    try:
+        st = os.stat(db_fn)
+    except FileNotFoundError:
+        return n_writes, None
+    return n_writes, st.st_mtime_ns, st.st_size
+
+
+open_sessions = [] # StatsSessions not closed yet, flushed before stats are read
+
+def flush_sessions(db_fn=STATS_DB_FN):
+    for session in open_sessions:
+        if session.db_fn == db_fn:
+            session.flush()
+
+
+class StatsSession:
+    """stats of the selections made in one interactive plot, kept in memory and saved together
+    dragging a selection saves its stats many times a second, only the latest stats of each range and data source are kept
+    and written in one transaction once selections stop for flush_delay_ms, when stats are read, or when the session closes
+
+    Args:
+        widget (tk.Widget, optional): widget of the interactive plot whose after() runs the delayed save.
+            Defaults to None (saved only when stats are read or the session closes).
+        db_fn (str, optional): stats database path. Defaults to STATS_DB_FN.
+        flush_delay_ms (int, optional): how long after the last selection stats are saved. Defaults to FLUSH_DELAY_MS.
+    """
+    def __init__(self, widget=None, db_fn=STATS_DB_FN, flush_delay_ms=FLUSH_DELAY_MS):
+        self.widget = widget
+        self.db_fn = db_fn
+        self.flush_delay_ms = flush_delay_ms
+        self.pending = {} # (which_fmt, range_name, data_source) -> rows, in order of latest selection
+        self.after_id = None
+        open_sessions.append(self)
+
+    def add(self, which_fmt, which_range, data_source, rows):
+        """keep stats of a selection to save later, replacing stats of an earlier selection of the same range
+
+        Args:
+            which_fmt (str): 'clean' or 'raw', data the range was selected from
+            which_range (str): range name
+            data_source (str): data file name and path
+            rows (dict): 'rf' and 'dis' lists of rows, see save_range_stats()
+        """
+        key = (which_fmt, which_range, data_source)
+        self.pending.pop(key, None) # latest selection of a range is saved last, as when saved straight away
+        self.pending[key] = rows
+        self.schedule_flush()
+
+    def schedule_flush(self):
+        if self.widget is None:
+            return
+        self.cancel_flush()
+        self.after_id = self.widget.after(self.flush_delay_ms, self.flush)
+
+    def cancel_flush(self):
+        if self.after_id is not None:
+            from tkinter import TclError # only sessions with a window get here, headless use never loads tk
+            try:
+                self.widget.after_cancel(self.after_id)
+            except TclError: # window already destroyed, and its timers with it
+                pass
+            self.after_id = None
+
+    def flush(self):
+        """save all pending stats in one transaction"""
+        self.after_id = None
+        if not self.pending:
+            return
+        ranges = [(which_fmt, rows) for (which_fmt, _, _), rows in self.pending.items()]
+        self.pending = {}
+        with closing(connect_stats(self.db_fn)) as conn:
+            write_ranges(conn, ranges)
+        print(f"saved stats of {len(ranges)} range selection(s)")
+
+    def discard(self):
+        self.pending = {}
+
+    def close(self):
+        """save anything pending, call before the interactive plot's window is destroyed"""
+        if self in open_sessions:
+            open_sessions.remove(self)
+        self.cancel_flush()
+        self.flush()
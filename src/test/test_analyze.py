@@ -12,7 +12,10 @@ So for now please forgive my subpar coding practices in this early project of mi
 
 # Add the parent directory to the system path
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
-from src.analyze import analyze_data
+import pandas as pd
+import numpy as np
+import matplotlib.pyplot as plt
+from src.analyze import analyze_data, build_time_index, find_nearest_time, clean_overtones, generate_interactive_plot, update_interactive_plot, get_plot_preferences
 from src.format_file import format_raw_data
 from main import Input
 
@@ -179,5 +182,53 @@ def test_qsense_plots(init_qsense_input_data):
             print(sample_file,generated_file)
             assert plots_are_similar(sample_file, generated_file)
 
+def test_find_nearest_time():
+    # relative time finds the closest recorded time, absolute time the first stamp at or after the one given
+    rel_df = pd.DataFrame({'Time': [0.0, 1.5, 3.0, 4.5, 6.0]})
+    time_index = build_time_index(rel_df, 'Time', True)
+    assert [find_nearest_time(t, rel_df, 'Time', True, time_index) for t in ['0', '2', '4', '100']] == [0, 1, 3, 4]
+
+    abs_df = pd.DataFrame({'abs_time': ['23:59:57', '23:59:59', '0:00:01', '0:00:03']})
+    assert find_nearest_time('23:59:58', abs_df, 'abs_time', False) == 1 # absent time stamp
+    assert find_nearest_time('0:00:00', abs_df, 'abs_time', False) == 2 # past midnight
+
+def test_clean_overtones():
+    # baseline averages subtracted per channel, freq normalized by overtone, dis scaled to 1e-6, time starts at 0
+    df = pd.DataFrame({'Time': [10.0, 20.0, 30.0, 40.0],
+                       'fundamental_freq': [5.0, 7.0, 9.0, 11.0], 'fundamental_dis': [1e-6, 3e-6, 5e-6, 7e-6],
+                       '3rd_freq': [30.0, 36.0, np.nan, 48.0], '3rd_dis': [2e-6, 2e-6, 2e-6, 4e-6]})
+    cleaned_df, pairs, rf_base_avgs, dis_base_avgs = clean_overtones(df, 2, 'Time', ['fundamental_freq', '3rd_freq'],
+                                                                      ['fundamental_dis', '3rd_dis'], True, False, 10)
+    assert list(cleaned_df.columns) == ['Time', 'fundamental_freq', 'fundamental_dis', '3rd_freq', '3rd_dis']
+    assert np.allclose(rf_base_avgs, [6, 11]) and np.allclose(dis_base_avgs, [2e-6, 2e-6])
+    assert np.allclose(cleaned_df['Time'], [0, 1, 2, 3])
+    assert np.allclose(cleaned_df['fundamental_freq'], [-1, 1, 3, 5])
+    assert np.allclose(cleaned_df['fundamental_dis'], [-1, 1, 3, 5])
+    assert np.isnan(cleaned_df['3rd_dis'].iloc[2]) # pair missing data in a row is blanked in that row
+
+    x_time, y_freq, y_dis = pairs[1] # and dropped from that pair's own series
+    assert list(x_time.index) == [0, 1, 3]
+    assert np.allclose(y_freq, [-1, 1, 5]) and np.allclose(y_dis, [0, 0, 2])
+
+    # no overtones selected, or an empty baseline (nothing to correct), leaves just the shifted time
+    for baseline_len in [2, 0]:
+        cleaned_df, pairs, rf_base_avgs, dis_base_avgs = clean_overtones(df, baseline_len, 'Time', [], [], True, False, 10)
+        assert list(cleaned_df.columns) == ['Time'] and np.allclose(cleaned_df['Time'], [0, 1, 2, 3])
+        assert pairs == [] and rf_base_avgs.shape == dis_base_avgs.shape == (0,)
+
+def test_interactive_zoom_update():
+    # selections swap data of the same zoom artists in place, the fit still of every selected point
+    plt.switch_backend('Agg') # no window needed
+    n = 100000
+    t = np.arange(n) / 10
+    df = pd.DataFrame({'Time': t, '1st_freq': 2 * t + np.sin(t), '1st_dis': np.cos(t / 100)})
+    int_plot, _, _, int_ax1_zoom, _, y_rf, y_dis, zoom_plots = generate_interactive_plot('1', 's', df, 'Time', False)
+    lines = list(int_ax1_zoom.lines)
+    for xmin, xmax in [(100, 5000), (20, 9000)]:
+        imin, imax = update_interactive_plot([], zoom_plots, get_plot_preferences(), xmin, xmax, (df['Time'], df['Time']), y_rf, y_dis, 's')
+        assert list(int_ax1_zoom.lines) == lines
+        assert int_ax1_zoom.get_xlim() == (t[imin], t[imax-1])
+        assert zoom_plots.legends[0].get_texts()[0].get_text().startswith("frequency drift: 2.0")
+
 if __name__ == '__main__':
     pytest.main()
\ No newline at end of file
@@ -0,0 +1,40 @@
+import pytest
+import pandas as pd
+import sys
+import os
+import json
+import shutil
+
+# Add the parent directory to the system path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+from src.cli import main
+from test_analyze import QCMI_FP
+
+def test_cli_jobs(tmp_path, monkeypatch):
+    # job file runs analysis and saves range stats without the UI, then models run on those stats
+    for src_dir in ['plot_opts', 'offset_data']:
+        shutil.copytree(src_dir, tmp_path / src_dir)
+    shutil.copy('plot_opts/default_opts.json', tmp_path / 'plot_opts/plot_customizations.json')
+    shutil.copy(QCMI_FP, tmp_path / 'run1.csv')
+    monkeypatch.chdir(tmp_path)
+    os.makedirs('raw_data')
+    jobs = {
+        'defaults': {'device': 'QCM-i', 'is_relative_time': True, 'baseline': [10, 100], 'overtones': ['fundamental', '3rd', '5th']},
+        'jobs': [{'file': 'run1.csv', 'ranges': {'protein': [2000, 3000]}}, {'file': 'missing.csv'}],
+        'models': ['avgs_analysis', 'sauerbrey'],
+    }
+    with open('jobs.json', 'w') as fp:
+        json.dump(jobs, fp)
+
+    assert main(['jobs.json', '--workers', '2', '--report', 'report.json', '--export-csv']) == 1 # missing file fails only its own job
+    with open('report.json', 'r') as fp:
+        report = json.load(fp)
+    assert [job['status'] for job in report['jobs']] == ['ok', 'failed']
+    assert [model['status'] for model in report['models']] == ['ok', 'ok']
+    assert os.path.exists('qcmd-plots/run1/frequency_plot.png')
+    rf_stats = pd.read_csv('selected_ranges/clean_all_stats_rf.csv')
+    assert (rf_stats['range_name'] == 'protein').all() and rf_stats.shape[0] == 7
+    assert os.path.exists('qcmd-plots/modeling/Sauerbrey_fit_range_protein.png')
+
+if __name__ == '__main__':
+    pytest.main()
\ No newline at end of file
@@ -0,0 +1,45 @@
+import pytest
+import numpy as np
+import pandas as pd
+import sys
+import os
+
+# Add the parent directory to the system path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+from src.decimate import decimate, MinMaxPyramid
+
+def test_decimate():
+    # reduced to about one point (minmax two) per pixel column, while a spike and a step striding would skip stay in
+    n = 200000
+    x = pd.Series(np.arange(n) / 10, index=np.arange(n) + 7)
+    y = pd.Series(np.sin(np.arange(n) / 5000))
+    y.iloc[123457] = 50 # one point spike
+    y.iloc[150000:] += 10 # rinse step
+    plot_customs = {'decimation': 'stride', 'points_plotted_index': 100}
+    x_dec, y_dec = decimate(x, y, plot_customs, 1000)
+    assert x_dec.equals(x[::100]) and y_dec.max() < 50
+
+    for mode, max_points in [('minmax', 2002), ('lttb', 1000)]:
+        plot_customs['decimation'] = mode
+        x_dec, y_dec = decimate(x, y, plot_customs, 1000)
+        assert len(x_dec) <= max_points
+        assert y_dec.max() == 50 and y_dec.loc[x_dec.index >= x.index[150000]].min() >= 9
+        assert x_dec.iloc[0] == x.iloc[0] and x_dec.iloc[-1] == x.iloc[-1]
+
+def test_minmax_pyramid():
+    # any selection reduces to about the requested points with its extremes and end points, missing values never chosen
+    rng = np.random.default_rng(0)
+    y = rng.normal(size=100003)
+    y[54321] = 20
+    y[54322] = -20
+    y[60000] = np.nan
+    pyramid = MinMaxPyramid(y)
+    for imin, imax in [(0, len(y)), (13, 99001), (54000, 61000), (500, 900)]:
+        idxs = pyramid.query(imin, imax, 1000)
+        assert len(idxs) <= 1.2 * 1000 + 100
+        assert idxs[0] == imin and idxs[-1] == imax - 1 and np.all(np.diff(idxs) > 0)
+        assert np.nanmin(y[idxs]) == np.nanmin(y[imin:imax]) and np.nanmax(y[idxs]) == np.nanmax(y[imin:imax])
+    assert np.array_equal(pyramid.query(10, 500, 1000), np.arange(10, 500))
+
+if __name__ == '__main__':
+    pytest.main()
\ No newline at end of file
@@ -0,0 +1,64 @@
+import pytest
+import sys
+import os
+import matplotlib.pyplot as plt
+from concurrent.futures.process import BrokenProcessPool
+
+# Add the parent directory to the system path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+from src.engine import AnalysisOptions, AnalysisResult, run_analysis, render_figures, get_render_pool, shutdown_render_pool
+import src.Exceptions as Exceptions
+from test_analyze import init_qcmi_input_data, set_default_plot_opts, copy_file, img_exts
+
+def test_headless_analysis(init_qcmi_input_data):
+    # engine runs without a display or saving anything, returning cleaned data and figures
+    plot_dir, qcmi_input = init_qcmi_input_data
+    set_default_plot_opts()
+    copy_file("sample_generations/qcmi-bsa-after/Formatted-QSM-I-BSA_1mgpml.csv", "raw_data/Formatted-QSM-I-BSA_1mgpml.csv")
+    options = AnalysisOptions.from_input(qcmi_input)
+    options.will_save_figures = False
+
+    result = run_analysis(options, reporter=Exceptions.raise_reporter)
+    assert not any(file.endswith(tuple(img_exts)) for file in os.listdir(plot_dir))
+    assert result.figure_fns == {}
+    assert {'freq_dis_V_time', 'temp_vs_time'} <= set(result.figures)
+    assert result.cleaned_df.columns[0] == 'Time'
+    assert result.cleaned_df['Time'].iloc[0] == 0
+    assert set(result.baseline_averages) == {col for col in result.cleaned_df.columns if col != 'Time'}
+
+    # reporter is only swapped for the run
+    assert Exceptions.set_reporter(Exceptions.print_reporter) is Exceptions.print_reporter
+
+def test_pooled_rendering(init_qcmi_input_data, tmp_path):
+    # figures saved by worker processes are the same files as saved in this process
+    plot_dir, qcmi_input = init_qcmi_input_data
+    set_default_plot_opts()
+    copy_file("sample_generations/qcmi-bsa-after/Formatted-QSM-I-BSA_1mgpml.csv", "raw_data/Formatted-QSM-I-BSA_1mgpml.csv")
+    fig_bytes = {}
+    for render_workers in [1, 2]:
+        options = AnalysisOptions.from_input(qcmi_input)
+        options.plot_dir = str(tmp_path)
+        options.render_workers = render_workers
+        result = run_analysis(options, reporter=Exceptions.raise_reporter)
+        assert result.render_jobs == []
+        fig_bytes[render_workers] = {name: open(fn, 'rb').read() for name, fn in result.figure_fns.items()}
+    assert len(fig_bytes[1]) == 6
+    assert fig_bytes[1] == fig_bytes[2]
+
+def test_render_pool_restart(tmp_path):
+    # a worker dying breaks the pool kept between analyses, the next render starts a new pool rather than failing
+    broken_pool = get_render_pool(2)
+    with pytest.raises(BrokenProcessPool):
+        broken_pool.submit(os._exit, 1).result()
+    result = AnalysisResult()
+    for i in range(2):
+        fig, ax = plt.subplots()
+        ax.plot([0, 1], [i, 1])
+        result.render_jobs.append((fig, str(tmp_path / f"fig{i}.png"), 'png', 50))
+    render_figures(AnalysisOptions(render_workers=2), result)
+    assert os.path.exists(tmp_path / "fig0.png") and os.path.exists(tmp_path / "fig1.png")
+    assert get_render_pool(2) is not broken_pool
+    shutdown_render_pool()
+
+if __name__ == '__main__':
+    pytest.main()
\ No newline at end of file
@@ -1,11 +1,20 @@
 import pytest
+import numpy as np
 import pandas as pd
 import sys
 import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
 
 # Add the parent directory to the system path
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
-from src.format_file import freqs, disps, open_df_from_file, add_offsets, unnormalize, dissipation_magnitude_adjustment, format_QCMi, format_Qsense
+from src.format_file import freqs, disps, QCMI_COLS, format_raw_data, format_stream, calibrate, open_df_from_file, add_offsets, unnormalize, dissipation_magnitude_adjustment, format_QCMi, format_Qsense
+from src.formatted_store import save_formatted, load_formatted, FormattedWriter
+from src.format_cache import FormatCache
+from src.batch_format import batch_format, find_data_files
+import src.Exceptions as Exceptions
+import src.format_qsd as format_qsd
+from src.format_qsd import QSD_HEADER, qsd_block, read_uint, scan_qsd, read_qsd, extract_sensor_data, extract_all_sensors_data, QsdTail
 
 # Sample DataFrames for testing
 calibration_df = pd.DataFrame({ # df that's added to main data df
@@ -74,6 +83,14 @@ def test_basic_reading(fp, fmt_func):
     are_cols_matching = all(elem in list(fmt_df.columns) for elem in cols)
     assert are_cols_matching == True
 
+def test_projected_reading():
+    # reading only the device columns as floats gives the same formatted data as reading everything
+    fp = "sample_generations/qcmi-bsa-after/QSM-I-BSA_1mgpml.csv"
+    df = open_df_from_file(fp, QCMI_COLS)
+    assert set(df.columns) <= set(QCMI_COLS.keys())
+    assert all(df[col].dtype == np.float64 for col in df.columns)
+    pd.testing.assert_frame_equal(format_QCMi(df), format_QCMi(open_df_from_file(fp)))
+
 def test_qsense_file_formatting():
     # verify numerical formatting steps individually with dummy data
     # testing add offsets
@@ -87,6 +104,10 @@ def test_qsense_file_formatting():
     # testing magnitude adjustment
     magnitude_res_df = dissipation_magnitude_adjustment(base_df.copy())
     pd.testing.assert_frame_equal(magnitude_res_df, magnitude_adjusted_expected_df)
+
+    # single pass calibration matches the individual steps applied in order
+    stepwise_df = add_offsets(calibration_df, unnormalize(dissipation_magnitude_adjustment(base_df.copy())))
+    pd.testing.assert_frame_equal(calibrate(base_df.copy(), calibration_df), stepwise_df)
     print("Passed!")
 
 def test_qsd_reading():
@@ -94,5 +115,209 @@ def test_qsd_reading():
     qsd_df = open_df_from_file(qsd_fp)
     assert isinstance(qsd_df, pd.DataFrame)
 
+def test_formatted_store_roundtrip(tmp_path):
+    # binary format keeps full precision and only loads requested columns
+    df = base_df.copy()
+    df['fundamental_freq'] = df['fundamental_freq'] + 1/3
+    df['abs_time'] = ['10:00:01', None, '10:00:03']
+    fn = str(tmp_path / 'Formatted-test.npz')
+    save_formatted(df, fn, export_csv=True)
+    assert os.path.exists(str(tmp_path / 'Formatted-test.csv'))
+
+    loaded_df = load_formatted(fn)
+    pd.testing.assert_frame_equal(loaded_df.drop(columns='abs_time'), df.drop(columns='abs_time'))
+    assert loaded_df['abs_time'].iloc[0] == '10:00:01' and pd.isna(loaded_df['abs_time'].iloc[1])
+
+    projected_df = load_formatted(fn, ['Time', '3rd_freq', 'not_a_column'])
+    assert list(projected_df.columns) == ['Time', '3rd_freq']
+
+def test_streamed_formatting(tmp_path, monkeypatch, capsys):
+    # formatting in small chunks gives the same data as formatting the whole file at once
+    fp = os.path.abspath("sample_generations/qcmi-bsa-after/QSM-I-BSA_1mgpml.csv")
+    expected_df = format_QCMi(open_df_from_file(fp, QCMI_COLS))
+    monkeypatch.setattr('src.format_file.get_formatted_fn', lambda file_name: str(tmp_path / f"{file_name}.npz"))
+    assert format_stream('QCM-i', fp, 'streamed', '.csv', True, export_csv=True, chunk_rows=100)
+    pd.testing.assert_frame_equal(load_formatted(str(tmp_path / "streamed.npz")), expected_df)
+    pd.testing.assert_frame_equal(load_formatted(str(tmp_path / "streamed.csv")), expected_df)
+
+    # device message is printed once for the file, a device column with text in it is read again with inferred types
+    text_fp = str(tmp_path / "text.csv")
+    pd.DataFrame({'Channel A QCM Time [sec]': ['0', '1', 'end'], 'Channel A Fundamental Frequency [Hz]': [1., 2., 3.]}).to_csv(text_fp, index=False)
+    capsys.readouterr()
+    assert format_stream('QCM-i', text_fp, 'text_streamed', '.csv', True, chunk_rows=1)
+    assert capsys.readouterr().out.count("QCM-i selected") == 1
+    assert list(load_formatted(str(tmp_path / "text_streamed.npz"))['Time']) == ['0', '1', 'end']
+
+    # errors formatting a chunk are raised rather than retried
+    format_calls = []
+    def bad_format(*args):
+        format_calls.append(args)
+        raise ValueError("bad chunk")
+    monkeypatch.setattr('src.format_file.format_df', bad_format)
+    with pytest.raises(ValueError, match="bad chunk"):
+        format_stream('QCM-i', fp, 'streamed', '.csv', True, chunk_rows=100)
+    assert len(format_calls) == 1
+
+    # text columns are widened to fit every chunk
+    writer = FormattedWriter(str(tmp_path / "text.npz"))
+    writer.write(pd.DataFrame({'abs_time': ['1:00', None], 'Time': [0.0, 1.0]}))
+    writer.write(pd.DataFrame({'abs_time': ['10:00:02', '10:00:03'], 'Time': [2.0, 3.0]}))
+    writer.close()
+    text_df = load_formatted(str(tmp_path / "text.npz"))
+    assert list(text_df['abs_time'].fillna('')) == ['1:00', '', '10:00:02', '10:00:03']
+    assert list(text_df['Time']) == [0.0, 1.0, 2.0, 3.0]
+
+def test_format_cache(tmp_path, monkeypatch):
+    # cache hits restore formatted files, least recently used entries are evicted past the size limit
+    monkeypatch.chdir(tmp_path)
+    os.makedirs('raw_data')
+    src_fn = 'data.csv'
+    base_df.to_csv(src_fn, index=False)
+    format_cache = FormatCache(max_bytes=1)
+
+    key_a = format_cache.make_key(src_fn, 'QCM-i', True)
+    assert key_a != format_cache.make_key(src_fn, 'Qsense', True)
+    assert not format_cache.restore(key_a, 'data')
+    save_formatted(base_df, 'raw_data/Formatted-data.npz')
+    format_cache.store(key_a, 'data')
+    os.remove('raw_data/Formatted-data.npz')
+    assert format_cache.restore(key_a, 'data')
+    pd.testing.assert_frame_equal(load_formatted('raw_data/Formatted-data.npz'), base_df)
+
+    # changing the source contents changes the key, and storing it evicts the older entry
+    base_df.iloc[:1].to_csv(src_fn, index=False)
+    key_b = format_cache.make_key(src_fn, 'QCM-i', True)
+    assert key_b != key_a
+    format_cache.store(key_b, 'data')
+    assert not format_cache.restore(key_a, 'data')
+    assert format_cache.restore(key_b, 'data')
+
+    # editing offsets only changes the keys of data formatted with them
+    calibration_df.to_csv('offsets.csv', index=False)
+    key_theoretical = format_cache.make_key(src_fn, 'Qsense', True)
+    key_offsets = format_cache.make_key(src_fn, 'Qsense', False, offset_fn='offsets.csv')
+    (calibration_df * 2).to_csv('offsets.csv', index=False)
+    assert format_cache.make_key(src_fn, 'Qsense', True) == key_theoretical
+    assert format_cache.make_key(src_fn, 'Qsense', False, offset_fn='offsets.csv') != key_offsets
+
+def test_format_cache_parallel_store(tmp_path, monkeypatch):
+    # entries stored at the same time by parallel workers all make it into the index
+    monkeypatch.chdir(tmp_path)
+    os.makedirs('raw_data')
+    format_cache = FormatCache()
+    n_workers = 8
+    for i in range(n_workers):
+        save_formatted(base_df, f'raw_data/Formatted-data{i}.npz')
+    with ThreadPoolExecutor(n_workers) as pool:
+        list(pool.map(lambda i: format_cache.store(f"key{i}", f"data{i}"), range(n_workers)))
+    assert sorted(format_cache.load_index()) == sorted(f"key{i}" for i in range(n_workers))
+    assert not os.path.exists(format_cache.lock_fn)
+
+def test_format_previously_formatted(tmp_path, monkeypatch):
+    # already formatted files are recognized by their headers rather than their name, and cached like any other file
+    monkeypatch.chdir(tmp_path)
+    os.makedirs('raw_data')
+    base_df.to_csv('Formatted-run1.csv', index=False)
+    with Exceptions.use_reporter(Exceptions.raise_reporter):
+        formatted_fns = format_raw_data('QCM-i', 'Formatted-run1.csv', True)
+        assert formatted_fns == [os.path.join('raw_data', 'Formatted-Formatted-run1.npz')]
+        pd.testing.assert_frame_equal(load_formatted(formatted_fns[0]), base_df, check_dtype=False)
+
+        os.remove(formatted_fns[0])
+        assert format_raw_data('QCM-i', 'Formatted-run1.csv', True) == formatted_fns # restored from the cache
+        assert os.path.exists(formatted_fns[0])
+
+def test_batch_format(tmp_path, monkeypatch):
+    # every file gets a manifest entry, a file that fails does not stop the others
+    qcmi_fp = os.path.abspath("sample_generations/qcmi-bsa-after/QSM-I-BSA_1mgpml.csv")
+    monkeypatch.chdir(tmp_path)
+    os.makedirs('raw_data')
+    os.makedirs('data')
+    shutil.copy(qcmi_fp, 'data/run1.csv')
+    pd.DataFrame({'a': [1, 2], 'b': [3, 4]}).to_csv('data/not_qcmi.csv', index=False)
+    data_files = find_data_files('data')
+    assert len(data_files) == 2
+
+    manifest = batch_format(data_files, 'QCM-i', workers=2, manifest_fn='raw_data/manifest.json')
+    statuses = {os.path.basename(entry['file']): entry['status'] for entry in manifest['files']}
+    assert statuses == {'run1.csv': 'ok', 'not_qcmi.csv': 'failed'}
+    assert manifest['n_failed'] == 1
+    assert os.path.exists('raw_data/Formatted-run1.npz')
+    assert os.path.exists('raw_data/manifest.json')
+
+def record_qsd(raw, n, time_lag=0):
+    """rewrite the sample .qsd as if its recording stopped after n samples,
+    every block keeps its first n freq/dis values and n - time_lag time values"""
+    blocks, ns = scan_qsd(raw)
+    header = raw.rfind(b"XtalDriveTimeFloat")
+    n_time = n - time_lag
+    edits = [(header + 34, 4, n_time), (header + 54 + 4 * ns, 4, n_time + 1)] # lengths of the first time block
+    for i, (tim_pointer, tim_n, fre_pointer, dis_pointer, data_n) in enumerate(blocks):
+        if i > 0:
+            edits.append((tim_pointer - 22, 4, n_time))
+        edits += [(fre_pointer - 4, 4, n), (dis_pointer - 4, 4, n)]
+        edits += [(tim_pointer, tim_n * 8, raw[tim_pointer:tim_pointer + n_time * 8]),
+                  (fre_pointer, data_n * 8, raw[fre_pointer:fre_pointer + n * 8]),
+                  (dis_pointer, data_n * 8, raw[dis_pointer:dis_pointer + n * 8])]
+
+    out = bytearray()
+    pointer = 0
+    for start, length, value in sorted(edits, key=lambda edit: edit[0]):
+        out += raw[pointer:start]
+        out += value if isinstance(value, bytes) else int(value).to_bytes(4, 'little')
+        pointer = start + length
+    return bytes(out + raw[pointer:])
+
+def test_qsd_tail(tmp_path, monkeypatch):
+    # first poll decodes the whole file, later polls only return what was appended (nothing here)
+    qsd_fp = "sample_generations/qsense-bsa-after/BSA.1mgml-1.280723_QSD.qsd"
+    tail = QsdTail(qsd_fp)
+    first_poll = tail.poll()
+    pd.testing.assert_frame_equal(first_poll, extract_sensor_data(*read_qsd(qsd_fp)), check_index_type=False)
+    assert tail.poll().empty
+
+    # file growing while it is recorded, time lags the data by 1 sample so rows after the first poll are offset too
+    with open(qsd_fp, 'rb') as f:
+        raw = f.read()
+    recording_fp = tmp_path / "recording.qsd"
+    tail = QsdTail(recording_fp)
+    recordings = [record_qsd(raw, n, time_lag=1) for n in [1, 2, 50, 51, 400]]
+    header_searches = []
+    monkeypatch.setattr(format_qsd, 'find_qsd_header', lambda d: header_searches.append(len(d)) or d.rfind(QSD_HEADER))
+    polls = []
+    for recording in recordings:
+        recording_fp.write_bytes(recording)
+        polls.append(tail.poll())
+    assert tail.poll().empty
+    assert len(header_searches) == 1 # later polls only walk the block lengths after the header
+    recorded = extract_sensor_data(*read_qsd(recording_fp))
+    assert len(recorded) == 398 # 1st row has no time and 2nd is at time 0, both are dropped as 0 entries
+    pd.testing.assert_frame_equal(pd.concat(polls), recorded, check_index_type=False)
+
+    # recording restarted, shorter file is decoded again from the beginning
+    monkeypatch.undo()
+    recording_fp.write_bytes(record_qsd(raw, 100))
+    pd.testing.assert_frame_equal(tail.poll(), extract_sensor_data(*read_qsd(recording_fp)), check_index_type=False)
+
+def test_qsd_block_is_view():
+    # blocks are read in place from the buffer rather than copied out of it
+    buf = np.arange(4, dtype='<f8').tobytes()
+    block = qsd_block(buf, 8, 2)
+    assert np.array_equal(block, [1., 2.])
+    assert not block.flags.owndata
+
+def test_extract_all_sensors():
+    # 4 sensors with 2 overtones each, rows ordered by sensor then overtone
+    n_rows = 8
+    time = np.tile([0., 1., 2.], (n_rows, 1))
+    freq = np.arange(n_rows)[:, None] + np.full((n_rows, 3), 10.)
+    dis = freq * 1e-3
+    sensor_dfs = extract_all_sensors_data(time, freq, dis, [3] * n_rows, 4)
+
+    assert list(sensor_dfs.keys()) == [1, 2, 3, 4]
+    assert list(sensor_dfs[3].columns) == ['Time', 'fundamental_freq', 'fundamental_dis', '3rd_freq', '3rd_dis']
+    assert sensor_dfs[3]['fundamental_freq'].iloc[0] == freq[4, 0]
+    assert sensor_dfs[4]['3rd_dis'].iloc[0] == dis[7, 0]
+
 if __name__ == "__main__":
     pytest.main()
\ No newline at end of file
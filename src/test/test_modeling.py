@@ -0,0 +1,74 @@
+import pytest
+import numpy as np
+import pandas as pd
+import sys
+import os
+
+# Add the parent directory to the system path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+from src.modeling import RangeAggregate, RangeAggregates, propogate_bandwidth_err, weighted_linear_fit, sauerbrey_fit
+from src.stats_store import save_range_stats
+from test_analyze import set_default_plot_opts
+
+def test_error_propagation():
+    # all ranges averaged over the sources they were selected from at once, unselected overtones (0) have no error
+    rows = []
+    for range_name, source, avgs, errs in [('a', 's1', [-10.0, -30.0, 0.0], [1.0, 2.0, 0.0]),
+                                           ('a', 's2', [-20.0, -50.0, 0.0], [3.0, 4.0, 0.0]),
+                                           ('b', 's1', [-5.0, -15.0, 0.0], [0.5, 0.5, 0.0])]:
+        for ov, avg, err in zip(['fundamental_freq', '3rd_freq', '5th_freq'], avgs, errs):
+            rows.append((ov, avg, err, avg, range_name, 0.0, 1.0, source))
+    df = pd.DataFrame(rows, columns=['overtone', 'Dfreq_average', 'Dfreq_std_dev', 'Dfreq_median', 'range_name', 'x_lower', 'x_upper', 'data_source'])
+
+    rf_agg = RangeAggregate(df, True)
+    assert list(rf_agg.labels) == ['a', 'b'] and list(rf_agg.sources) == ['s1', 's2']
+    assert np.allclose(rf_agg.means, [[-15.0, -40.0, 0.0], [-5.0, -15.0, 0.0]])
+    # squared errors summed over sources, divided by n-1 (or 1 for a single source), thin film models carry them into later overtones
+    assert np.allclose(rf_agg.errs(), [[np.sqrt(10.0), np.sqrt(20.0), 0.0], [0.5, 0.5, 0.0]])
+    assert np.allclose(rf_agg.errs(carry_over=True), [[np.sqrt(10.0), np.sqrt(30.0), 0.0], [0.5, np.sqrt(0.5), 0.0]])
+    assert np.allclose(propogate_bandwidth_err(np.array([4.0, 0.0]), [np.array([2.0, 0.0]), np.array([0.5, 0.1])]), [1.0, 0.0])
+
+def test_range_aggregates_cache(tmp_path):
+    # aggregates are kept for the modelling session until saved stats change
+    db_fn = str(tmp_path / 'range_stats.db')
+    rows = lambda avg: {'rf': [('fundamental_freq', avg, 0.5, avg, 'a', 1.0, 2.0, 'x.csv')], 'dis': []}
+    save_range_stats('clean', rows(-2.0), db_fn)
+    aggregates = RangeAggregates(db_fn)
+    rf_agg = aggregates.get('clean', 'rf')
+    assert aggregates.get('clean', 'rf') is rf_agg and rf_agg.means[0, 0] == -2.0
+    save_range_stats('clean', rows(-4.0), db_fn)
+    assert aggregates.get('clean', 'rf').means[0, 0] == -4.0
+
+def test_weighted_linear_fit():
+    # stacked fits in one call match curve_fit, and near constant data or large offsets still fit
+    from scipy.optimize import curve_fit
+    from src.modeling import linear
+    rng = np.random.default_rng(0)
+    x = np.linspace(0, 50, 40)
+    ys = np.vstack((0.3 * x - 2 + rng.normal(0, 1, 40), -2 * x + 7 + rng.normal(0, 3, 40)))
+    sigma = rng.random(40) + 0.1
+    m, b, cov, r_squared = weighted_linear_fit(x, ys, sigma)
+    for i in range(2):
+        params, params_cov = curve_fit(linear, x, ys[i], sigma=sigma)
+        assert np.allclose([m[i], b[i]], params, rtol=1e-7) and np.allclose(cov[i], params_cov, rtol=1e-5)
+    assert np.all((r_squared > 0.5) & (r_squared <= 1))
+
+    t = 1e5 + np.arange(100000) * 0.01
+    m, b, _, r_squared = weighted_linear_fit(t, np.vstack((np.full(t.shape, 4.99e6), 4.99e6 - 1e-3 * t)))
+    assert m[0] == 0 and b[0] == 4.99e6 and r_squared[0] == 1
+    assert np.isclose(m[1], -1e-3, rtol=1e-9)
+    assert weighted_linear_fit([3.0, 3.0], [1.0, 2.0])[0] == 0 # no spread in x, no slope
+    assert np.allclose(weighted_linear_fit([1.0, 2.0, np.nan, 4.0], [1.0, 2.0, 5.0, 4.0])[:2], [1.0, 0.0]) # missing points left out
+
+def test_sauerbrey_fit_weighted():
+    # fit follows the overtones with small propagated errors rather than one far off with a large error
+    os.makedirs('qcmd-plots/modeling', exist_ok=True)
+    set_default_plot_opts()
+    overtones = np.array([3, 5, 7, 9])
+    mu_Df = np.array([-30., -50., -70., -200.])
+    _, _, mu_Df_fit = sauerbrey_fit(mu_Df, np.array([1., 1., 1., 1000.]), overtones, 'weighted', 1.0, 'png', 50)
+    assert np.allclose(mu_Df_fit[:3], mu_Df[:3], rtol=1e-3)
+    os.remove('qcmd-plots/modeling/Sauerbrey_fit_range_weighted.png')
+
+if __name__ == '__main__':
+    pytest.main()
\ No newline at end of file
@@ -0,0 +1,28 @@
+import pytest
+import numpy as np
+import pandas as pd
+import sys
+import os
+
+# Add the parent directory to the system path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+from src.range_stats import RangeStats
+
+def test_range_stats():
+    # any range gives the same mean, std and median as computing them from the selected data, medians exactly
+    rng = np.random.default_rng(0)
+    n = 60000
+    df = pd.DataFrame({'Time': np.arange(n) / 10, '1st_freq': -20 * np.tanh(np.arange(n) / 9000) + rng.normal(0, 0.05, n),
+                       '1st_dis': rng.normal(5, 1, n).round(2)}) # rounded for ties
+    df.loc[31000, '1st_dis'] = np.nan
+    stats = RangeStats(df, ['1st_freq', '1st_dis'])
+    for imin, imax in [(0, n), (17, 5000), (29000, 33000), (40000, 59999), (100, 100 + 4097)]:
+        assert stats.time_bounds(imin, imax) == (df['Time'][imin:imax].min(), df['Time'][imin:imax].max())
+        for col in ['1st_freq', '1st_dis']:
+            y_sel = df[col][imin:imax]
+            mean, std_dev, median = stats.summary(col, imin, imax)
+            assert median == np.median(y_sel) or (np.isnan(median) and np.isnan(np.median(y_sel)))
+            assert np.allclose([mean, std_dev], [np.average(y_sel), np.std(y_sel)], rtol=1e-9, equal_nan=True)
+
+if __name__ == '__main__':
+    pytest.main()
\ No newline at end of file
@@ -0,0 +1,51 @@
+import pytest
+import numpy as np
+import pandas as pd
+import sys
+import os
+
+# Add the parent directory to the system path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+from src.stats_store import save_range_stats, load_range_stats, export_range_stats, StatsSession
+
+def test_stats_store(tmp_path):
+    # legacy csv stats are imported once, saving a range again replaces its rows and moves them last, export gives back the csv
+    db_fn = str(tmp_path / 'range_stats.db')
+    with open(tmp_path / 'clean_all_stats_rf.csv', 'w') as fp:
+        fp.write("overtone,Dfreq_average,Dfreq_std_dev,Dfreq_median,range_name,x_lower,x_upper,data_source\n")
+        for range_name in ['a', 'b']:
+            for ov in ['fundamental_freq', '3rd_freq']:
+                fp.write(f"{ov},{-1.5:.16E},{0.25:.16E},{-1.5:.16E},{range_name},10.5,20.0,raw_data/Formatted-x.csv\n")
+    legacy_df = pd.read_csv(tmp_path / 'clean_all_stats_rf.csv')
+    assert load_range_stats('clean', 'rf', db_fn).equals(legacy_df)
+
+    save_range_stats('clean', {'rf': [('fundamental_freq', -2.0, np.nan, -2.0, 'a', 1.0, 2.0, 'raw_data/Formatted-x.csv'),
+                                      ('3rd_freq', -3.0, 0.5, -3.0, 'a', 1.0, 2.0, 'raw_data/Formatted-x.csv')],
+                               'dis': []}, db_fn)
+    rf_df = load_range_stats('clean', 'rf', db_fn)
+    assert rf_df['range_name'].tolist() == ['b', 'b', 'a', 'a']
+    assert np.isnan(rf_df['Dfreq_std_dev'].iloc[2]) and rf_df['Dfreq_average'].iloc[3] == -3.0
+    assert load_range_stats('raw', 'dis', db_fn).shape == (0, 8)
+
+    export_range_stats(('clean',), db_fn)
+    assert pd.read_csv(tmp_path / 'clean_all_stats_rf.csv').equals(rf_df)
+
+def test_stats_session(tmp_path):
+    # many selections of the same range are kept in memory, only the latest is written, and reading stats flushes them
+    db_fn = str(tmp_path / 'range_stats.db')
+    session = StatsSession(db_fn=db_fn)
+    for i in range(50):
+        for range_name in ['a', 'b']:
+            session.add('clean', range_name, 'x.csv', {'rf': [('fundamental_freq', -i, 0.5, -i, range_name, i, i + 1, 'x.csv')],
+                                                       'dis': [('fundamental_dis', i, 0.1, i, range_name, i, i + 1, 'x.csv')]})
+    session.add('clean', 'a', 'x.csv', {'rf': [('fundamental_freq', -100, 0.5, -100, 'a', 1, 2, 'x.csv')],
+                                        'dis': [('fundamental_dis', 100, 0.1, 100, 'a', 1, 2, 'x.csv')]})
+    assert not os.path.exists(db_fn)
+
+    rf_df = load_range_stats('clean', 'rf', db_fn)
+    assert rf_df['range_name'].tolist() == ['b', 'a'] and rf_df['Dfreq_average'].tolist() == [-49.0, -100.0]
+    assert load_range_stats('clean', 'dis', db_fn)['Ddis_average'].tolist() == [49.0, 100.0]
+    session.close()
+
+if __name__ == '__main__':
+    pytest.main()
\ No newline at end of file